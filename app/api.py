@@ -0,0 +1,99 @@
+import asyncio
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from app.utils.instrumentation import metrics
+from app.utils.job_queue import get_job_queue
+from app.utils.lazy_imports import lazy_module
+
+analytics_engine = lazy_module("app.utils.analytics_engine")
+similarity = lazy_module("app.utils.similarity")
+
+# Most neighbours one similar-customer request may ask for.
+MAX_NEIGHBOURS = 100
+
+
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """Exposes pipeline stage metrics for a local Prometheus scrape."""
+    return PlainTextResponse(
+        metrics.prometheus_text(), media_type="text/plain; version=0.0.4"
+    )
+
+
+async def similar_customers(request: Request) -> JSONResponse:
+    """Top-k most similar customers to one row, from a built similarity index.
+
+    GET /similar/{index job id}/{row}?k=10 returns the row's segment, its
+    neighbours with their segments and distances, and the nearest segment
+    boundary.
+    """
+    try:
+        k = min(max(int(request.query_params.get("k", 10)), 1), MAX_NEIGHBOURS)
+    except ValueError:
+        return JSONResponse({"error": "k must be an integer."}, status_code=400)
+    try:
+        index = await asyncio.to_thread(
+            similarity.load_similarity_index, request.path_params["job_id"]
+        )
+    except KeyError:
+        return JSONResponse({"error": "No such similarity index."}, status_code=404)
+    row = request.path_params["row"]
+    try:
+        return JSONResponse(index.similar(row, k))
+    except KeyError:
+        return JSONResponse(
+            {"error": f"Row {row} is not in the clustered data."}, status_code=404
+        )
+
+
+def _export_file(cleaning_job: str, clustering_job: str, clusters: list[int]) -> str:
+    queue = get_job_queue()
+    for job_id in (cleaning_job, clustering_job):
+        job = queue.status(job_id)
+        if job is None or job["status"] != "done":
+            raise KeyError(job_id)
+    return analytics_engine.export_clustered_csv(
+        queue.dataset_path(cleaning_job, "cleaned_data"),
+        queue.dataset_path(clustering_job, "labels"),
+        clusters,
+    )
+
+
+async def export_clustered_data(request: Request) -> FileResponse | JSONResponse:
+    """The cleaned data with each row's cluster, as a CSV download.
+
+    GET /export/{cleaning job id}/{clustering job id}?clusters=0,2 exports
+    only the listed clusters. The file is written from the jobs' Parquet
+    outputs without loading them (see analytics_engine.py).
+    """
+    try:
+        clusters = [
+            int(c) for c in request.query_params.get("clusters", "").split(",") if c
+        ]
+    except ValueError:
+        return JSONResponse({"error": "clusters must be integers."}, status_code=400)
+    try:
+        path = await asyncio.to_thread(
+            _export_file,
+            request.path_params["cleaning_job"],
+            request.path_params["clustering_job"],
+            clusters,
+        )
+    except KeyError:
+        return JSONResponse({"error": "No such finished clustering."}, status_code=404)
+    suffix = "_cluster_" + "_".join(map(str, clusters)) if clusters else ""
+    return FileResponse(
+        path,
+        media_type="text/csv",
+        filename=f"clustered_customer_data{suffix}.csv",
+    )
+
+
+api = Starlette(
+    routes=[
+        Route("/metrics", prometheus_metrics),
+        Route("/similar/{job_id}/{row:int}", similar_customers),
+        Route("/export/{cleaning_job}/{clustering_job}", export_clustered_data),
+    ]
+)
@@ -26,6 +26,10 @@ def clustering() -> rx.Component:
 
 from app.pages.profiles_page import profiles_page
 from app.pages.insights_page import insights_page
+from app.pages.performance_page import performance_page
+from app.api import api
+from app.settings import WARMUP
+from app.utils.warmup import warm_up_in_background
 
 
 def profiles() -> rx.Component:
@@ -36,6 +40,10 @@ def insights() -> rx.Component:
     return insights_page()
 
 
+def performance() -> rx.Component:
+    return performance_page()
+
+
 app = rx.App(
     theme=rx.theme(
         appearance="light", accent_color="sky", gray_color="gray", radius="large"
@@ -46,10 +54,14 @@ app = rx.App(
             href="https://fonts.googleapis.com/css2?family=Open+Sans:wght@400;600;700;800&display=swap",
         )
     ],
+    api_transformer=api,
 )
-app.add_page(index, route="/")
-app.add_page(data_cleaning, route="/data_cleaning")
-app.add_page(pca_analysis, route="/pca_analysis")
-app.add_page(clustering, route="/clustering")
-app.add_page(profiles, route="/profiles")
-app.add_page(insights, route="/insights")
\ No newline at end of file
+if WARMUP:
+    app.register_lifespan_task(warm_up_in_background)
+app.add_page(index, route="/", on_load=State.reattach_jobs)
+app.add_page(data_cleaning, route="/data_cleaning", on_load=State.reattach_jobs)
+app.add_page(pca_analysis, route="/pca_analysis", on_load=State.reattach_jobs)
+app.add_page(clustering, route="/clustering", on_load=State.reattach_jobs)
+app.add_page(profiles, route="/profiles", on_load=State.reattach_jobs)
+app.add_page(insights, route="/insights", on_load=State.reattach_jobs)
+app.add_page(performance, route="/performance", on_load=State.reattach_jobs)
\ No newline at end of file
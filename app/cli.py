@@ -0,0 +1,50 @@
+"""Runs the segmentation pipeline on files from the command line, without the UI.
+
+Each file is cleaned, projected, clustered and profiled on its own, several
+at once in worker processes, and no figures are built. Settings come from a
+JSON config file (keys as in DEFAULT_CONFIG in app/utils/batch.py):
+
+    {"algorithm": "kmeans", "n_clusters": 5, "columns": {"region": "exclude"}}
+
+    python -m app.cli --config nightly.json --output results data/*.csv
+
+Exits with status 1 if any file failed; see results/timing_report.csv.
+"""
+
+import argparse
+import logging
+import sys
+
+from app.utils.batch import load_config, run_batch
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]),
+    )
+    parser.add_argument("files", nargs="+", help="CSV or XLSX files to segment")
+    parser.add_argument("--config", help="JSON file of pipeline settings")
+    parser.add_argument(
+        "--output", default="batch_output", help="directory for the results"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="worker processes (default: as many as cores and memory allow)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    report = run_batch(args.files, config, args.output, args.workers)
+    return 1 if any(row["error"] for row in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
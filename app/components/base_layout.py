@@ -3,6 +3,24 @@ from app.components.sidebar import sidebar
 from app.state import State
 
 
+def queue_banner() -> rx.Component:
+    """Shows where the session's job is while it waits for memory or a worker."""
+    return rx.cond(
+        State.queue_position > 0,
+        rx.el.div(
+            rx.icon("hourglass", class_name="h-5 w-5 mr-2 text-amber-500"),
+            rx.el.span(
+                "Other analyses are using the server. Your job is number ",
+                State.queue_position,
+                " in the queue and will start automatically.",
+                class_name="text-sm text-amber-800",
+            ),
+            class_name="flex items-center px-6 py-3 bg-amber-50 border-b border-amber-200",
+        ),
+        rx.fragment(),
+    )
+
+
 def base_layout(child: rx.Component, *args, **kwargs) -> rx.Component:
     """The base layout for all pages."""
     return rx.el.div(
@@ -15,6 +33,7 @@ def base_layout(child: rx.Component, *args, **kwargs) -> rx.Component:
                 on_click=lambda: State.set_sidebar_open(~State.sidebar_open),
                 class_name="fixed top-4 right-4 z-50 p-2 rounded-full bg-white/50 backdrop-blur-sm shadow-md hover:bg-gray-100 transition-colors lg:hidden",
             ),
+            queue_banner(),
             child,
             class_name="transition-all duration-300 lg:ml-64",
         ),
@@ -0,0 +1,23 @@
+import reflex as rx
+from app.state import State
+
+
+def draft_badge(stage: str) -> rx.Component:
+    """Says whether a stage's results come from the draft sample or from all rows."""
+    return rx.cond(
+        State.draft_stages.contains(stage),
+        rx.el.div(
+            rx.spinner(size="1"),
+            rx.el.span(
+                "Draft from a ",
+                State.draft_sample_rows,
+                "-row sample. Refining on all rows...",
+            ),
+            class_name="inline-flex items-center gap-2 px-3 py-1 rounded-full bg-amber-100 text-amber-800 text-sm font-medium",
+        ),
+        rx.el.div(
+            rx.icon("circle-check", class_name="h-4 w-4"),
+            rx.el.span("Final results on all rows"),
+            class_name="inline-flex items-center gap-2 px-3 py-1 rounded-full bg-green-100 text-green-800 text-sm font-medium",
+        ),
+    )
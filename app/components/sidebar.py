@@ -40,6 +40,7 @@ def sidebar() -> rx.Component:
                     nav_item("Clustering", "git-merge", "/clustering"),
                     nav_item("Customer Profiles", "users", "/profiles"),
                     nav_item("Insights", "lightbulb", "/insights"),
+                    nav_item("Performance", "gauge", "/performance"),
                     class_name="space-y-2",
                 ),
                 class_name="p-4",
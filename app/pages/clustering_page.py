@@ -1,6 +1,7 @@
 import reflex as rx
-from app.state import State
+from app.state import State, PCAState, ClusteringState
 from app.components.base_layout import base_layout
+from app.components.draft_badge import draft_badge
 from app.pages.home import progress_indicator
 
 
@@ -12,20 +13,29 @@ def config_section() -> rx.Component:
             rx.el.div(
                 rx.el.button(
                     "KMeans",
-                    on_click=lambda: State.set_clustering_algorithm("kmeans"),
+                    on_click=lambda: ClusteringState.set_clustering_algorithm("kmeans"),
                     class_name=rx.cond(
-                        State.clustering_algorithm == "kmeans",
+                        ClusteringState.clustering_algorithm == "kmeans",
                         "px-4 py-2 text-sm font-semibold text-white bg-sky-600 rounded-l-lg border border-sky-600",
                         "px-4 py-2 text-sm font-medium text-gray-700 bg-white hover:bg-gray-100 rounded-l-lg border border-gray-300",
                     ),
                 ),
                 rx.el.button(
                     "Hierarchical",
-                    on_click=lambda: State.set_clustering_algorithm("hierarchical"),
+                    on_click=lambda: ClusteringState.set_clustering_algorithm("hierarchical"),
                     class_name=rx.cond(
-                        State.clustering_algorithm == "hierarchical",
+                        ClusteringState.clustering_algorithm == "hierarchical",
+                        "px-4 py-2 text-sm font-semibold text-white bg-sky-600 border border-sky-600",
+                        "px-4 py-2 text-sm font-medium text-gray-700 bg-white hover:bg-gray-100 border border-gray-300 border-l-0",
+                    ),
+                ),
+                rx.el.button(
+                    "HDBSCAN",
+                    on_click=lambda: ClusteringState.set_clustering_algorithm("hdbscan"),
+                    class_name=rx.cond(
+                        ClusteringState.clustering_algorithm == "hdbscan",
                         "px-4 py-2 text-sm font-semibold text-white bg-sky-600 rounded-r-lg border border-sky-600",
-                        "px-4 py-2 text-sm font-medium text-gray-700 bg-white hover:bg-gray-100 rounded-r-lg border border-r-gray-300 border-t-gray-300 border-b-gray-300",
+                        "px-4 py-2 text-sm font-medium text-gray-700 bg-white hover:bg-gray-100 rounded-r-lg border border-gray-300 border-l-0",
                     ),
                 ),
                 class_name="flex mt-1",
@@ -36,40 +46,292 @@ def config_section() -> rx.Component:
             rx.el.label("Number of Clusters", class_name="font-medium text-gray-700"),
             rx.el.input(
                 type="number",
-                on_change=State.set_n_clusters,
+                on_change=ClusteringState.set_n_clusters,
                 min=2,
                 max=10,
                 class_name="mt-1 w-full p-2 border border-gray-300 rounded-lg focus:ring-sky-500 focus:border-sky-500",
-                default_value=State.n_clusters.to_string(),
+                default_value=ClusteringState.n_clusters.to_string(),
+            ),
+            rx.cond(
+                ClusteringState.clustering_algorithm == "hdbscan",
+                rx.el.p(
+                    "HDBSCAN finds the number of clusters itself and marks outlying "
+                    "customers as noise. This sets the smallest segment it reports.",
+                    class_name="mt-1 text-sm text-gray-500",
+                ),
+                rx.fragment(),
             ),
             class_name="mb-4",
         ),
+        rx.checkbox(
+            "Preview large files on a sample first, then refine on all rows",
+            checked=State.draft_mode,
+            on_change=State.set_draft_mode,
+            class_name="mb-4 text-sm text-gray-700",
+        ),
         rx.el.button(
             "Run Clustering",
-            on_click=State.run_clustering,
+            on_click=ClusteringState.run_clustering,
             is_loading=State.is_processing,
             class_name="w-full px-6 py-3 bg-sky-600 text-white font-semibold rounded-xl shadow-md hover:bg-sky-700 disabled:opacity-50 disabled:cursor-not-allowed flex items-center justify-center gap-2",
         ),
+        rx.el.button(
+            "Compare Both Algorithms",
+            on_click=ClusteringState.compare_algorithms,
+            disabled=ClusteringState.is_comparing,
+            class_name="w-full mt-3 px-6 py-3 bg-white text-sky-700 font-semibold rounded-xl border border-sky-600 hover:bg-sky-50 disabled:opacity-50 disabled:cursor-not-allowed",
+        ),
+        class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg",
+    )
+
+
+def comparison_row(row: rx.Var) -> rx.Component:
+    return rx.el.tr(
+        rx.el.td(
+            row["name"],
+            rx.cond(
+                row["recommended"],
+                rx.el.span(
+                    "Recommended",
+                    class_name="ml-2 px-2 py-0.5 text-xs font-semibold text-green-800 bg-green-100 rounded-full",
+                ),
+                rx.fragment(),
+            ),
+            class_name="px-4 py-3 font-medium text-gray-800",
+        ),
+        rx.el.td(row["silhouette"], class_name="px-4 py-3 text-gray-700"),
+        rx.el.td(row["seconds"], class_name="px-4 py-3 text-gray-700"),
+        rx.el.td(row["strategy"], class_name="px-4 py-3 text-sm text-gray-500"),
+        rx.el.td(
+            rx.el.button(
+                "Use",
+                on_click=ClusteringState.use_algorithm(row["algorithm"]),
+                class_name="px-3 py-1 text-sm font-semibold text-sky-700 border border-sky-600 rounded-lg hover:bg-sky-50",
+            ),
+            class_name="px-4 py-3 text-right",
+        ),
+        class_name="border-t border-gray-200",
+    )
+
+
+def comparison_section() -> rx.Component:
+    """Silhouette, run time and agreement of the algorithms side by side."""
+    comparison = ClusteringState.comparison
+    return rx.el.div(
+        rx.el.h3("Algorithm Comparison", class_name="text-xl font-bold text-gray-800"),
+        rx.cond(
+            ClusteringState.is_comparing,
+            rx.el.div(
+                rx.spinner(size="2"),
+                rx.el.span("Running both algorithms...", class_name="text-gray-700"),
+                class_name="flex items-center gap-3 mt-4",
+            ),
+            rx.el.div(
+                rx.el.p(
+                    "With ",
+                    comparison["n_clusters"].to_string(),
+                    " clusters. ",
+                    comparison["reason"],
+                    class_name="text-gray-700 mt-1 mb-4",
+                ),
+                rx.el.table(
+                    rx.el.thead(
+                        rx.el.tr(
+                            rx.el.th("Algorithm", class_name="px-4 py-2 text-left"),
+                            rx.el.th("Silhouette", class_name="px-4 py-2 text-left"),
+                            rx.el.th("Run time", class_name="px-4 py-2 text-left"),
+                            rx.el.th("Strategy", class_name="px-4 py-2 text-left"),
+                            rx.el.th(""),
+                            class_name="text-sm font-semibold text-gray-500",
+                        )
+                    ),
+                    rx.el.tbody(rx.foreach(comparison["rows"], comparison_row)),
+                    class_name="w-full",
+                ),
+                rx.foreach(
+                    comparison["agreement"],
+                    lambda row: rx.el.p(
+                        "Adjusted Rand Index, ",
+                        row["pair"],
+                        ": ",
+                        rx.el.span(row["ari"], class_name="font-semibold"),
+                        class_name="mt-4 text-gray-700",
+                    ),
+                ),
+            ),
+        ),
         class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg",
     )
 
 
+def stability_row(row: rx.Var) -> rx.Component:
+    return rx.el.tr(
+        rx.el.td(row["cluster"], class_name="px-4 py-3 font-medium text-gray-800"),
+        rx.el.td(row["size"], class_name="px-4 py-3 text-gray-700"),
+        rx.el.td(
+            row["jaccard"],
+            rx.el.span(" (min ", row["jaccard_min"], ")", class_name="text-gray-400"),
+            class_name="px-4 py-3 text-gray-700",
+        ),
+        rx.el.td(row["co_assignment"], class_name="px-4 py-3 text-gray-700"),
+        rx.el.td(
+            rx.el.span(
+                row["verdict"],
+                class_name=rx.match(
+                    row["verdict"],
+                    (
+                        "Stable",
+                        "px-2 py-0.5 text-xs font-semibold text-green-800 bg-green-100 rounded-full",
+                    ),
+                    (
+                        "Moderate",
+                        "px-2 py-0.5 text-xs font-semibold text-amber-800 bg-amber-100 rounded-full",
+                    ),
+                    "px-2 py-0.5 text-xs font-semibold text-red-800 bg-red-100 rounded-full",
+                ),
+            ),
+            class_name="px-4 py-3",
+        ),
+        class_name="border-t border-gray-200",
+    )
+
+
+def stability_section() -> rx.Component:
+    """How reproducible each segment is when the data is resampled."""
+    stability = ClusteringState.stability
+    return rx.el.div(
+        rx.el.div(
+            rx.el.h4("Segment Stability", class_name="text-lg font-bold text-gray-800"),
+            rx.el.button(
+                "Check Stability",
+                on_click=ClusteringState.check_stability,
+                disabled=ClusteringState.is_checking_stability,
+                class_name="px-4 py-2 text-sm font-semibold text-sky-700 border border-sky-600 rounded-lg hover:bg-sky-50 disabled:opacity-50 disabled:cursor-not-allowed",
+            ),
+            class_name="flex items-center justify-between gap-2",
+        ),
+        rx.cond(
+            ClusteringState.is_checking_stability,
+            rx.el.div(
+                rx.spinner(size="2"),
+                rx.el.span(
+                    "Re-clustering random subsamples...", class_name="text-gray-700"
+                ),
+                class_name="flex items-center gap-3 mt-4",
+            ),
+            rx.cond(
+                stability,
+                rx.el.div(
+                    rx.el.p(
+                        stability["confident_share"],
+                        " of customers stay in their segment in at least 80% of ",
+                        stability["n_bootstraps"].to_string(),
+                        " subsamples of ",
+                        stability["sample_rows"],
+                        " rows (",
+                        stability["seconds"],
+                        "). Jaccard similarity is 1 for a segment found "
+                        "identically every time; below 0.5 it dissolves.",
+                        class_name="text-gray-700 mt-1 mb-4",
+                    ),
+                    rx.el.table(
+                        rx.el.thead(
+                            rx.el.tr(
+                                rx.el.th("Segment", class_name="px-4 py-2 text-left"),
+                                rx.el.th("Customers", class_name="px-4 py-2 text-left"),
+                                rx.el.th("Jaccard", class_name="px-4 py-2 text-left"),
+                                rx.el.th(
+                                    "Kept together", class_name="px-4 py-2 text-left"
+                                ),
+                                rx.el.th("", class_name="px-4 py-2"),
+                                class_name="text-sm font-semibold text-gray-500",
+                            )
+                        ),
+                        rx.el.tbody(rx.foreach(stability["rows"], stability_row)),
+                        class_name="w-full",
+                    ),
+                    rx.plotly(
+                        data=ClusteringState.stability_fig,
+                        class_name="w-full h-[400px] mt-4",
+                    ),
+                ),
+                rx.el.p(
+                    "Re-cluster random subsamples to see which segments are "
+                    "robust and which are artefacts of this particular data.",
+                    class_name="text-sm text-gray-500 mt-1",
+                ),
+            ),
+        ),
+        class_name="p-4 mt-6 bg-gray-50 rounded-xl border border-gray-200",
+    )
+
+
+def plan_cost(label: str, predicted: rx.Var, actual: rx.Var) -> rx.Component:
+    return rx.el.div(
+        rx.el.p(label, class_name="text-sm font-medium text-gray-500"),
+        rx.el.p(
+            actual,
+            rx.el.span(" (predicted ", predicted, ")", class_name="text-gray-400"),
+            class_name="text-lg font-semibold text-gray-800",
+        ),
+    )
+
+
+def plan_section() -> rx.Component:
+    """The strategy the planner chose for this dataset, with predicted vs actual cost."""
+    plan = ClusteringState.clustering_plan
+    return rx.cond(
+        plan,
+        rx.el.div(
+            rx.el.h4("Execution Plan", class_name="text-lg font-bold text-gray-800"),
+            rx.el.p(plan["strategy"], class_name="text-gray-700 mt-1 mb-4"),
+            rx.el.div(
+                plan_cost("Run time", plan["predicted_seconds"], plan["actual_seconds"]),
+                plan_cost(
+                    "Peak memory", plan["predicted_memory"], plan["actual_memory"]
+                ),
+                class_name="grid grid-cols-2 gap-4",
+            ),
+            class_name="p-4 mt-6 bg-gray-50 rounded-xl border border-gray-200",
+        ),
+        rx.fragment(),
+    )
+
+
 def results_section() -> rx.Component:
     return rx.el.div(
-        rx.el.h3(
-            "Clustering Results", class_name="text-xl font-bold text-gray-800 mb-4"
+        rx.el.div(
+            rx.el.h3("Clustering Results", class_name="text-xl font-bold text-gray-800"),
+            draft_badge("clustering"),
+            class_name="flex flex-wrap items-center justify-between gap-2 mb-4",
         ),
-        rx.plotly(data=State.cluster_scatter_fig, class_name="w-full h-[500px]"),
         rx.cond(
-            (State.clustering_algorithm == "hierarchical") & State.has_dendrogram_data,
+            ClusteringState.noise_share != "",
+            rx.el.p(
+                ClusteringState.noise_share,
+                " of customers fall in no dense segment and are shown as Noise.",
+                class_name="mb-2 text-gray-700",
+            ),
+            rx.fragment(),
+        ),
+        rx.plotly(data=ClusteringState.cluster_scatter_fig, class_name="w-full h-[500px]"),
+        rx.cond(
+            (ClusteringState.clustering_algorithm != "kmeans") & ClusteringState.has_dendrogram_data,
             rx.el.div(
                 rx.el.h4(
-                    "Dendrogram", class_name="text-lg font-bold text-gray-800 my-4"
+                    rx.cond(
+                        ClusteringState.clustering_algorithm == "hdbscan",
+                        "Condensed Tree",
+                        "Dendrogram",
+                    ),
+                    class_name="text-lg font-bold text-gray-800 my-4",
                 ),
-                rx.plotly(data=State.dendrogram_fig, class_name="w-full h-[400px]"),
+                rx.plotly(data=ClusteringState.dendrogram_fig, class_name="w-full h-[400px]"),
             ),
             rx.fragment(),
         ),
+        plan_section(),
+        stability_section(),
         class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg mt-8",
     )
 
@@ -86,7 +348,7 @@ def clustering_page() -> rx.Component:
                 class_name="mb-8",
             ),
             rx.cond(
-                State.pca_results.is_none(),
+                ~PCAState.has_pca_results,
                 rx.el.div(
                     rx.el.p(
                         "PCA results not found. Please complete the PCA step first.",
@@ -112,11 +374,16 @@ def clustering_page() -> rx.Component:
                             class_name="flex flex-col items-center justify-center p-16 mt-8 bg-white/50 rounded-2xl shadow-lg",
                         ),
                         rx.cond(
-                            State.clustering_results.is_not_none(),
+                            ClusteringState.has_clustering_results,
                             results_section(),
                             rx.fragment(),
                         ),
                     ),
+                    rx.cond(
+                        ClusteringState.is_comparing | ClusteringState.comparison,
+                        comparison_section(),
+                        rx.fragment(),
+                    ),
                     class_name="space-y-8",
                 ),
             ),
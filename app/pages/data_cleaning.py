@@ -1,7 +1,9 @@
 import reflex as rx
-from app.state import State
+from app.state import State, UploadState, CleaningState
 from app.components.base_layout import base_layout
+from app.components.draft_badge import draft_badge
 from app.pages.home import progress_indicator
+from app.settings import TRANSACTION_UPLOAD_MB
 
 
 def stat_card(label: str, value: rx.Var, icon: str, color_class: str) -> rx.Component:
@@ -29,22 +31,39 @@ def upload_component() -> rx.Component:
                         class_name="font-semibold text-gray-700 mt-2",
                     ),
                     rx.el.p(
-                        "CSV or XLSX, up to 50MB", class_name="text-sm text-gray-500"
+                        rx.cond(
+                            UploadState.transactions,
+                            f"One or more CSV or XLSX transaction files, up to {TRANSACTION_UPLOAD_MB}MB each",
+                            "One or more CSV or XLSX files, up to 50MB each",
+                        ),
+                        class_name="text-sm text-gray-500",
                     ),
                     class_name="text-center",
                 ),
                 class_name="flex items-center justify-center w-full h-full p-8 border-2 border-dashed border-gray-300 rounded-xl hover:bg-gray-50 transition-colors",
             ),
             id="upload-data",
-            on_drop=State.handle_upload(rx.upload_files(upload_id="upload-data")),
+            on_drop=UploadState.handle_upload(rx.upload_files(upload_id="upload-data")),
             class_name="w-full cursor-pointer",
         ),
+        rx.el.input(
+            value=UploadState.sheet_name,
+            on_change=UploadState.set_sheet_name,
+            placeholder="Excel sheet name or number (default: first sheet)",
+            class_name="w-full mt-3 p-2 text-sm border border-gray-300 rounded-lg focus:ring-sky-500 focus:border-sky-500",
+        ),
+        rx.checkbox(
+            "One row per transaction: aggregate customer ID, date, amount, channel and balance into per-customer features",
+            checked=UploadState.transactions,
+            on_change=UploadState.set_transactions,
+            class_name="mt-3 text-sm text-gray-700",
+        ),
         rx.cond(
-            State.uploaded_file_name != "",
+            UploadState.uploaded_file_name != "",
             rx.el.div(
                 rx.icon("file-check-2", class_name="h-5 w-5 text-green-500 mr-2"),
                 rx.el.p(
-                    f"Uploaded: {State.uploaded_file_name}",
+                    f"Uploaded: {UploadState.uploaded_file_name}",
                     class_name="text-sm font-medium text-gray-700",
                 ),
                 class_name="mt-4 flex items-center justify-center p-2 bg-green-50 rounded-lg",
@@ -63,7 +82,7 @@ def data_preview_table() -> rx.Component:
                 rx.el.thead(
                     rx.el.tr(
                         rx.foreach(
-                            State.raw_data_columns,
+                            UploadState.raw_data_columns,
                             lambda col: rx.el.th(
                                 col,
                                 class_name="px-4 py-2 text-left text-sm font-semibold text-gray-600 bg-gray-100",
@@ -73,10 +92,10 @@ def data_preview_table() -> rx.Component:
                 ),
                 rx.el.tbody(
                     rx.foreach(
-                        State.raw_data_preview,
+                        UploadState.raw_data_preview,
                         lambda row: rx.el.tr(
                             rx.foreach(
-                                State.raw_data_columns,
+                                UploadState.raw_data_columns,
                                 lambda col: rx.el.td(
                                     row[col].to_string(),
                                     class_name="px-4 py-2 border-b border-gray-200 text-sm text-gray-700",
@@ -93,18 +112,18 @@ def data_preview_table() -> rx.Component:
         rx.el.div(
             rx.el.button(
                 "Previous",
-                on_click=State.prev_preview_page,
-                disabled=State.preview_page <= 1,
+                on_click=UploadState.prev_preview_page,
+                disabled=UploadState.preview_page <= 1,
                 class_name="px-4 py-2 text-sm font-medium bg-white border border-gray-300 rounded-lg hover:bg-gray-100 disabled:opacity-50",
             ),
             rx.el.p(
-                f"Page {State.preview_page} of {State.total_preview_pages}",
+                f"Page {UploadState.preview_page} of {UploadState.total_preview_pages}",
                 class_name="text-sm font-medium text-gray-700",
             ),
             rx.el.button(
                 "Next",
-                on_click=State.next_preview_page,
-                disabled=State.preview_page >= State.total_preview_pages,
+                on_click=UploadState.next_preview_page,
+                disabled=UploadState.preview_page >= UploadState.total_preview_pages,
                 class_name="px-4 py-2 text-sm font-medium bg-white border border-gray-300 rounded-lg hover:bg-gray-100 disabled:opacity-50",
             ),
             class_name="flex items-center justify-between mt-4",
@@ -113,6 +132,104 @@ def data_preview_table() -> rx.Component:
     )
 
 
+KIND_LABELS = {
+    "identifier": "Identifier",
+    "constant": "Constant",
+    "high_cardinality": "High cardinality",
+    "date": "Date",
+    "numeric": "Numeric",
+    "categorical": "Categorical",
+}
+ACTION_LABELS = {
+    "keep": "Keep",
+    "exclude": "Exclude",
+    "frequency": "Encode by frequency",
+    "days_since": "Days since date",
+}
+
+
+def column_profile_row(profile: rx.Var) -> rx.Component:
+    return rx.el.tr(
+        rx.el.td(profile["column"], class_name="px-4 py-2 text-sm font-medium"),
+        rx.el.td(
+            rx.match(profile["kind"], *KIND_LABELS.items(), profile["kind"]),
+            class_name="px-4 py-2 text-sm",
+        ),
+        rx.el.td(f"~{profile['distinct']}", class_name="px-4 py-2 text-sm"),
+        rx.el.td(
+            f"{round(profile['missing_share'].to(float) * 1000) / 10}%",
+            class_name="px-4 py-2 text-sm",
+        ),
+        rx.el.td(
+            rx.el.select(
+                rx.foreach(
+                    profile["actions"].to(list[str]),
+                    lambda action: rx.el.option(
+                        rx.match(action, *ACTION_LABELS.items(), action),
+                        value=action,
+                    ),
+                ),
+                value=profile["action"],
+                on_change=lambda action: UploadState.set_column_action(
+                    profile["column"], action
+                ),
+                class_name="p-1 text-sm border border-gray-300 rounded-lg",
+            ),
+            class_name="px-4 py-2",
+        ),
+        class_name="border-b border-gray-200 text-gray-700",
+    )
+
+
+def column_profile_table() -> rx.Component:
+    """What the schema profiler found in each column and what cleaning does with it."""
+    return rx.el.div(
+        rx.el.h3("Column Profile", class_name="text-xl font-bold text-gray-800"),
+        rx.el.p(
+            "Identifiers, constants and free-text columns would only add noise to "
+            "the segmentation. Choose what cleaning does with each column.",
+            class_name="text-sm text-gray-500 mt-1 mb-4",
+        ),
+        rx.el.div(
+            rx.el.table(
+                rx.el.thead(
+                    rx.el.tr(
+                        *[
+                            rx.el.th(
+                                header,
+                                class_name="px-4 py-2 text-left text-sm font-semibold text-gray-600 bg-gray-100",
+                            )
+                            for header in [
+                                "Column",
+                                "Type",
+                                "Distinct",
+                                "Missing",
+                                "Action",
+                            ]
+                        ]
+                    )
+                ),
+                rx.el.tbody(
+                    rx.foreach(UploadState.column_profiles, column_profile_row),
+                    class_name="bg-white",
+                ),
+                class_name="w-full border-collapse",
+            ),
+            class_name="overflow-x-auto rounded-lg border border-gray-200",
+        ),
+        rx.el.div(
+            rx.el.button(
+                "Apply and Clean Again",
+                on_click=UploadState.apply_column_actions,
+                disabled=State.is_processing,
+                class_name="px-4 py-2 bg-sky-600 text-white font-semibold rounded-lg hover:bg-sky-700 disabled:opacity-50",
+            ),
+            class_name="flex justify-end mt-4",
+        ),
+        class_name="w-full",
+    )
+
+
 def data_cleaning_page() -> rx.Component:
     """The data cleaning page."""
     return base_layout(
@@ -136,10 +253,15 @@ def data_cleaning_page() -> rx.Component:
                         class_name="flex flex-col items-center justify-center p-16 bg-white/50 rounded-2xl shadow-lg",
                     ),
                     rx.cond(
-                        State.raw_data.is_none(),
+                        ~UploadState.has_raw_data,
                         upload_component(),
                         rx.el.div(
                             rx.el.div(
+                                rx.cond(
+                                    CleaningState.has_cleaned_data,
+                                    draft_badge("cleaning"),
+                                    rx.fragment(),
+                                ),
                                 rx.el.div(
                                     rx.el.div(
                                         rx.el.h3(
@@ -149,19 +271,19 @@ def data_cleaning_page() -> rx.Component:
                                         rx.el.div(
                                             stat_card(
                                                 "Rows",
-                                                State.original_stats.rows,
+                                                CleaningState.original_stats.rows,
                                                 "align-horizontal-distribute-start",
                                                 "text-red-500",
                                             ),
                                             stat_card(
                                                 "Columns",
-                                                State.original_stats.cols,
+                                                CleaningState.original_stats.cols,
                                                 "align-horizontal-distribute-end",
                                                 "text-red-500",
                                             ),
                                             stat_card(
                                                 "Missing Values",
-                                                State.original_stats.missing_values,
+                                                CleaningState.original_stats.missing_values,
                                                 "search-x",
                                                 "text-red-500",
                                             ),
@@ -176,19 +298,19 @@ def data_cleaning_page() -> rx.Component:
                                         rx.el.div(
                                             stat_card(
                                                 "Rows",
-                                                State.cleaned_stats.rows,
+                                                CleaningState.cleaned_stats.rows,
                                                 "align-horizontal-distribute-start",
                                                 "text-green-500",
                                             ),
                                             stat_card(
                                                 "Columns",
-                                                State.cleaned_stats.cols,
+                                                CleaningState.cleaned_stats.cols,
                                                 "align-horizontal-distribute-end",
                                                 "text-green-500",
                                             ),
                                             stat_card(
                                                 "Outliers Removed",
-                                                State.cleaned_stats.outliers,
+                                                CleaningState.cleaned_stats.outliers,
                                                 "trash-2",
                                                 "text-green-500",
                                             ),
@@ -198,13 +320,18 @@ def data_cleaning_page() -> rx.Component:
                                     class_name="space-y-8",
                                 ),
                                 data_preview_table(),
+                                rx.cond(
+                                    UploadState.column_profiles,
+                                    column_profile_table(),
+                                    rx.fragment(),
+                                ),
                                 rx.el.div(
                                     rx.el.h3(
                                         "Correlation Heatmap (Cleaned Data)",
                                         class_name="text-xl font-bold text-gray-800 mb-4",
                                     ),
                                     rx.plotly(
-                                        data=State.correlation_heatmap,
+                                        data=CleaningState.correlation_heatmap,
                                         class_name="w-full h-[600px]",
                                     ),
                                     class_name="bg-white p-6 rounded-2xl border border-gray-200 shadow-lg",
@@ -215,8 +342,8 @@ def data_cleaning_page() -> rx.Component:
                                 rx.el.button(
                                     "Proceed to PCA Analysis",
                                     rx.icon("arrow_right"),
-                                    on_click=State.proceed_to_pca,
-                                    disabled=State.cleaned_data.is_none(),
+                                    on_click=CleaningState.proceed_to_pca,
+                                    disabled=~CleaningState.has_cleaned_data,
                                     class_name="px-6 py-3 bg-sky-600 text-white font-semibold rounded-xl shadow-md hover:bg-sky-700 disabled:opacity-50 disabled:cursor-not-allowed flex items-center gap-2",
                                 ),
                                 class_name="flex justify-end mt-8",
@@ -1,5 +1,5 @@
 import reflex as rx
-from app.state import State
+from app.state import InsightsState
 from app.components.base_layout import base_layout
 
 
@@ -7,22 +7,22 @@ def marketing_recommendations_card() -> rx.Component:
     return rx.el.div(
         rx.el.h3(
             rx.cond(
-                State.ai_insights.contains("error"),
+                InsightsState.ai_insights.contains("error"),
                 "Error Generating Insights",
                 "Marketing Recommendations",
             ),
             class_name="text-xl font-bold text-gray-800 mb-4",
         ),
         rx.el.p(
-            State.ai_insights.get("marketing_recommendations", ""),
+            InsightsState.ai_insights.get("marketing_recommendations", ""),
             class_name=rx.cond(
-                State.ai_insights.contains("error"),
+                InsightsState.ai_insights.contains("error"),
                 "text-red-600 leading-relaxed",
                 "text-gray-600 leading-relaxed",
             ),
         ),
         class_name=rx.cond(
-            State.ai_insights.contains("error"),
+            InsightsState.ai_insights.contains("error"),
             "p-6 bg-red-50 rounded-2xl border border-red-200 shadow-lg",
             "p-6 bg-white rounded-2xl border border-gray-200 shadow-lg",
         ),
@@ -63,7 +63,7 @@ def insights_page() -> rx.Component:
                 class_name="text-3xl font-bold text-gray-900 mb-8",
             ),
             rx.cond(
-                State.cluster_profiles.keys().length() == 0,
+                InsightsState.cluster_profiles.keys().length() == 0,
                 rx.el.div(
                     rx.el.p(
                         "Cluster profiles not generated. Please complete the profiles step first.",
@@ -79,12 +79,12 @@ def insights_page() -> rx.Component:
                 rx.el.div(
                     rx.el.button(
                         "Generate AI Insights",
-                        on_click=State.generate_ai_insights,
-                        is_loading=State.is_generating_insights,
+                        on_click=InsightsState.generate_ai_insights,
+                        is_loading=InsightsState.is_generating_insights,
                         class_name="w-full mb-8 px-6 py-3 bg-sky-600 text-white font-semibold rounded-xl shadow-md hover:bg-sky-700 disabled:opacity-50 flex items-center justify-center gap-2",
                     ),
                     rx.cond(
-                        State.is_generating_insights,
+                        InsightsState.is_generating_insights,
                         rx.el.div(
                             rx.spinner(class_name="h-12 w-12 text-sky-600"),
                             rx.el.p(
@@ -94,7 +94,7 @@ def insights_page() -> rx.Component:
                             class_name="flex flex-col items-center justify-center p-16 bg-white/50 rounded-2xl shadow-lg",
                         ),
                         rx.cond(
-                            State.ai_insights["personas"].length() > 0,
+                            InsightsState.ai_insights["personas"].length() > 0,
                             rx.el.div(
                                 marketing_recommendations_card(),
                                 rx.el.div(
@@ -104,7 +104,7 @@ def insights_page() -> rx.Component:
                                     ),
                                     rx.el.div(
                                         rx.foreach(
-                                            State.ai_insights["personas"], persona_card
+                                            InsightsState.ai_insights["personas"], persona_card
                                         ),
                                         class_name="grid md:grid-cols-2 lg:grid-cols-3 gap-8",
                                     ),
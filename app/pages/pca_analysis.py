@@ -1,6 +1,7 @@
 import reflex as rx
-from app.state import State
+from app.state import State, CleaningState, PCAState
 from app.components.base_layout import base_layout
+from app.components.draft_badge import draft_badge
 from app.pages.home import progress_indicator
 
 
@@ -14,7 +15,7 @@ def pca_analysis_page() -> rx.Component:
                 class_name="mb-8",
             ),
             rx.cond(
-                State.cleaned_data.is_none(),
+                ~CleaningState.has_cleaned_data,
                 rx.el.div(
                     rx.el.p(
                         "Cleaned data not found. Please complete the data cleaning step first.",
@@ -29,7 +30,7 @@ def pca_analysis_page() -> rx.Component:
                 ),
                 rx.el.div(
                     rx.cond(
-                        State.is_processing & State.pca_results.is_none(),
+                        State.is_processing & ~PCAState.has_pca_results,
                         rx.el.div(
                             rx.spinner(class_name="h-12 w-12 text-sky-600"),
                             rx.el.p(
@@ -39,8 +40,9 @@ def pca_analysis_page() -> rx.Component:
                             class_name="flex flex-col items-center justify-center p-16 bg-white/50 rounded-2xl shadow-lg",
                         ),
                         rx.cond(
-                            State.pca_results.is_not_none(),
+                            PCAState.has_pca_results,
                             rx.el.div(
+                                rx.el.div(draft_badge("pca"), class_name="mb-6"),
                                 rx.el.div(
                                     rx.el.div(
                                         rx.el.h3(
@@ -48,7 +50,7 @@ def pca_analysis_page() -> rx.Component:
                                             class_name="text-xl font-bold text-gray-800 mb-4",
                                         ),
                                         rx.plotly(
-                                            data=State.scree_plot, class_name="w-full"
+                                            data=PCAState.scree_plot, class_name="w-full"
                                         ),
                                         class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg",
                                     ),
@@ -58,7 +60,7 @@ def pca_analysis_page() -> rx.Component:
                                             class_name="text-xl font-bold text-gray-800 mb-4",
                                         ),
                                         rx.plotly(
-                                            data=State.cumulative_variance_plot,
+                                            data=PCAState.cumulative_variance_plot,
                                             class_name="w-full",
                                         ),
                                         class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg",
@@ -71,7 +73,7 @@ def pca_analysis_page() -> rx.Component:
                                         class_name="text-xl font-bold text-gray-800 mb-4",
                                     ),
                                     rx.el.p(
-                                        f"Optimal components for >80% variance: {State.pca_results['optimal_n_components']}",
+                                        f"Optimal components for >80% variance: {PCAState.optimal_n_components}",
                                         class_name="text-lg font-medium text-gray-700",
                                     ),
                                     class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg mb-8 text-center",
@@ -80,7 +82,7 @@ def pca_analysis_page() -> rx.Component:
                                     rx.el.button(
                                         "Proceed to Clustering",
                                         rx.icon("arrow_right"),
-                                        on_click=State.proceed_to_clustering,
+                                        on_click=PCAState.proceed_to_clustering,
                                         class_name="px-6 py-3 bg-sky-600 text-white font-semibold rounded-xl shadow-md hover:bg-sky-700 flex items-center gap-2",
                                     ),
                                     class_name="flex justify-end mt-8",
@@ -90,7 +92,7 @@ def pca_analysis_page() -> rx.Component:
                             rx.fragment(),
                         ),
                     ),
-                    on_mount=State.run_pca,
+                    on_mount=PCAState.run_pca,
                 ),
             ),
             class_name="p-4 sm:p-6 lg:p-8",
@@ -0,0 +1,120 @@
+import reflex as rx
+from app.state import PerformanceState
+from app.components.base_layout import base_layout
+
+COLUMNS = [
+    ("Stage", "stage"),
+    ("Wall (s)", "seconds"),
+    ("Share", "share"),
+    ("CPU (s)", "cpu_seconds"),
+    ("Peak RSS (MB)", "peak_rss_mb"),
+    ("Rows In", "rows_in"),
+    ("Rows Out", "rows_out"),
+    ("Delta (KB)", "delta_kb"),
+]
+
+
+def timing_row(timing: rx.Var[dict]) -> rx.Component:
+    return rx.el.tr(
+        rx.el.td(
+            rx.cond(timing["nested"], "↳ " + timing["stage"], timing["stage"]),
+            class_name=rx.cond(
+                timing["nested"],
+                "px-4 py-2 pl-8 border-b border-gray-200 text-sm text-gray-500",
+                "px-4 py-2 border-b border-gray-200 text-sm font-semibold text-gray-800",
+            ),
+        ),
+        *[
+            rx.el.td(
+                timing[key],
+                class_name="px-4 py-2 border-b border-gray-200 text-sm text-gray-700 text-right",
+            )
+            for _, key in COLUMNS[1:]
+        ],
+    )
+
+
+def timing_table() -> rx.Component:
+    return rx.el.div(
+        rx.el.table(
+            rx.el.thead(
+                rx.el.tr(
+                    *[
+                        rx.el.th(
+                            label,
+                            class_name="px-4 py-2 text-left text-sm font-semibold text-gray-600 bg-gray-100",
+                        )
+                        for label, _ in COLUMNS
+                    ]
+                )
+            ),
+            rx.el.tbody(
+                rx.foreach(PerformanceState.stage_timings, timing_row),
+                class_name="bg-white",
+            ),
+            class_name="w-full border-collapse",
+        ),
+        class_name="overflow-x-auto rounded-lg border border-gray-200",
+    )
+
+
+def performance_page() -> rx.Component:
+    """Timing breakdown of the last pipeline run."""
+    return base_layout(
+        rx.el.div(
+            rx.el.div(
+                rx.el.h1(
+                    "Pipeline Performance", class_name="text-3xl font-bold text-gray-900"
+                ),
+                rx.el.button(
+                    "Refresh",
+                    rx.icon("refresh-cw", class_name="h-4 w-4"),
+                    on_click=PerformanceState.refresh_performance,
+                    class_name="px-4 py-2 text-sm font-medium bg-white border border-gray-300 rounded-lg hover:bg-gray-100 flex items-center gap-2",
+                ),
+                class_name="flex items-center justify-between mb-8",
+            ),
+            rx.cond(
+                PerformanceState.stage_timings.length() == 0,
+                rx.el.div(
+                    rx.el.p(
+                        "No stages have run in this session yet. Upload a file to see its timing breakdown.",
+                        class_name="text-gray-600",
+                    ),
+                    class_name="text-center p-8 bg-white rounded-xl shadow-md",
+                ),
+                rx.el.div(
+                    rx.el.div(
+                        rx.icon("gauge", class_name="h-6 w-6 text-sky-600 mr-2"),
+                        rx.el.p(
+                            "Dominant stage: ",
+                            rx.el.span(
+                                PerformanceState.dominant_stage,
+                                class_name="font-bold text-gray-900",
+                            ),
+                            class_name="text-lg text-gray-700",
+                        ),
+                        class_name="flex items-center p-4 bg-sky-50 rounded-xl border border-sky-100",
+                    ),
+                    rx.el.div(
+                        rx.plotly(
+                            data=PerformanceState.timing_chart,
+                            class_name="w-full h-[400px]",
+                        ),
+                        class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg",
+                    ),
+                    rx.el.div(
+                        rx.el.h3(
+                            "Stage Breakdown",
+                            class_name="text-xl font-bold text-gray-800 mb-4",
+                        ),
+                        timing_table(),
+                        class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg",
+                    ),
+                    class_name="space-y-8",
+                ),
+            ),
+            on_mount=PerformanceState.refresh_performance,
+            class_name="p-4 sm:p-6 lg:p-8",
+        )
+    )
@@ -1,6 +1,7 @@
 import reflex as rx
-from app.state import State
+from app.state import State, ClusteringState, InsightsState, SimilarityState
 from app.components.base_layout import base_layout
+from app.components.draft_badge import draft_badge
 from app.pages.home import progress_indicator
 import plotly.graph_objects as go
 
@@ -53,10 +54,121 @@ def profile_card(cluster_id: str, profile: rx.Var[dict]) -> rx.Component:
             ),
             class_name="max-h-48 overflow-y-auto pr-2",
         ),
+        rx.el.h4(
+            "Quartiles (25% / median / 75%)",
+            class_name="text-lg font-semibold text-gray-800 mt-4 mb-2",
+        ),
+        rx.el.div(
+            rx.foreach(
+                profile["feature_quartiles"].keys(),
+                lambda key: rx.el.div(
+                    rx.el.p(key, class_name="font-medium"),
+                    rx.el.p(profile["feature_quartiles"][key].join(" / ")),
+                    class_name="flex justify-between text-sm p-1 bg-gray-50 even:bg-gray-100 rounded",
+                ),
+            ),
+            class_name="max-h-48 overflow-y-auto pr-2",
+        ),
+        rx.el.button(
+            "Export This Cluster (CSV)",
+            on_click=InsightsState.export_clustered_data(cluster_id),
+            class_name="mt-4 px-3 py-1.5 text-sm bg-green-600 text-white rounded-lg",
+        ),
         class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg",
     )
 
 
+def similar_customer_row(customer: rx.Var) -> rx.Component:
+    return rx.el.tr(
+        rx.el.td(customer["row"].to_string(), class_name="px-4 py-2 text-gray-800"),
+        rx.el.td(customer["segment"], class_name="px-4 py-2 text-gray-700"),
+        rx.el.td(customer["distance"], class_name="px-4 py-2 text-gray-700"),
+        class_name="border-t border-gray-200",
+    )
+
+
+def similar_customers_section() -> rx.Component:
+    """Looks up a customer's closest peers and nearest segment boundary."""
+    lookup = SimilarityState.lookup
+    return rx.el.div(
+        rx.el.h3("Similar Customers", class_name="text-xl font-bold text-gray-800"),
+        rx.el.p(
+            "Enter a customer's row number in the uploaded file, counting from 0.",
+            class_name="text-sm text-gray-500 mt-1",
+        ),
+        rx.el.div(
+            rx.el.input(
+                type="number",
+                min=0,
+                value=SimilarityState.lookup_row,
+                on_change=SimilarityState.set_lookup_row,
+                placeholder="Row number",
+                class_name="w-40 p-2 border border-gray-300 rounded-lg focus:ring-sky-500 focus:border-sky-500",
+            ),
+            rx.el.button(
+                "Find Similar",
+                on_click=SimilarityState.find_similar_customers,
+                disabled=SimilarityState.is_searching,
+                class_name="px-4 py-2 bg-sky-600 text-white font-semibold rounded-lg hover:bg-sky-700 disabled:opacity-50",
+            ),
+            rx.cond(SimilarityState.is_searching, rx.spinner(size="2"), rx.fragment()),
+            class_name="flex items-center gap-3 mt-4",
+        ),
+        rx.cond(
+            lookup,
+            rx.el.div(
+                rx.el.p(
+                    "Row ",
+                    lookup["row"].to_string(),
+                    " is in segment ",
+                    rx.el.span(lookup["segment"], class_name="font-semibold"),
+                    rx.cond(
+                        lookup["boundary_segment"] != "",
+                        rx.el.span(
+                            "; the nearest other segment is ",
+                            rx.el.span(
+                                lookup["boundary_segment"], class_name="font-semibold"
+                            ),
+                            ", ",
+                            lookup["boundary_distance"],
+                            " away in PCA space",
+                        ),
+                        rx.fragment(),
+                    ),
+                    ". Found in ",
+                    lookup["milliseconds"],
+                    ".",
+                    class_name="text-gray-700 mt-4",
+                ),
+                rx.el.table(
+                    rx.el.thead(
+                        rx.el.tr(
+                            rx.el.th("Row", class_name="px-4 py-2 text-left"),
+                            rx.el.th("Segment", class_name="px-4 py-2 text-left"),
+                            rx.el.th("Distance", class_name="px-4 py-2 text-left"),
+                            class_name="text-sm font-semibold text-gray-500",
+                        )
+                    ),
+                    rx.el.tbody(
+                        rx.foreach(
+                            SimilarityState.similar_customers, similar_customer_row
+                        )
+                    ),
+                    class_name="w-full mt-4",
+                ),
+                rx.el.p(
+                    "API: GET ",
+                    rx.el.code(lookup["api_path"]),
+                    "?k=10",
+                    class_name="text-xs text-gray-400 mt-4",
+                ),
+            ),
+            rx.fragment(),
+        ),
+        class_name="p-6 bg-white rounded-2xl border border-gray-200 shadow-lg mt-8",
+    )
+
+
 def profiles_page() -> rx.Component:
     return base_layout(
         rx.el.div(
@@ -65,7 +177,7 @@ def profiles_page() -> rx.Component:
             ),
             progress_indicator(),
             rx.cond(
-                State.clustering_results.is_none(),
+                ~ClusteringState.has_clustering_results,
                 rx.el.div(
                     rx.el.p(
                         "Clustering not performed yet. Please complete the clustering step.",
@@ -80,22 +192,23 @@ def profiles_page() -> rx.Component:
                 ),
                 rx.el.div(
                     rx.cond(
-                        State.cluster_profiles.keys().length() == 0,
+                        InsightsState.cluster_profiles.keys().length() == 0,
                         rx.el.div(
                             rx.el.button(
                                 "Generate Cluster Profiles",
-                                on_click=State.generate_cluster_profiles,
+                                on_click=InsightsState.generate_cluster_profiles,
                                 is_loading=State.is_processing,
                                 class_name="px-6 py-3 bg-sky-600 text-white font-semibold rounded-xl shadow-md hover:bg-sky-700 flex items-center gap-2",
                             ),
                             class_name="text-center",
                         ),
                         rx.el.div(
+                            rx.el.div(draft_badge("profiles"), class_name="mb-6"),
                             rx.el.div(
                                 rx.foreach(
-                                    State.filtered_cluster_keys,
+                                    InsightsState.filtered_cluster_keys,
                                     lambda cluster_id: profile_card(
-                                        cluster_id, State.cluster_profiles[cluster_id]
+                                        cluster_id, InsightsState.cluster_profiles[cluster_id]
                                     ),
                                 ),
                                 class_name="grid md:grid-cols-2 lg:grid-cols-3 gap-8 mb-8",
@@ -103,23 +216,37 @@ def profiles_page() -> rx.Component:
                             rx.el.div(
                                 rx.el.button(
                                     "Export Clustered Data (CSV)",
-                                    on_click=State.export_clustered_data,
+                                    on_click=InsightsState.export_clustered_data(""),
                                     class_name="px-4 py-2 bg-green-600 text-white rounded-lg",
                                 ),
                                 rx.el.button(
                                     "Export Profiles Summary (CSV)",
-                                    on_click=State.export_cluster_profiles,
+                                    on_click=InsightsState.export_cluster_profiles,
+                                    class_name="px-4 py-2 bg-green-600 text-white rounded-lg",
+                                ),
+                                rx.el.button(
+                                    "Write Segments to Database",
+                                    on_click=InsightsState.write_back_segments,
+                                    is_loading=InsightsState.is_writing_back,
                                     class_name="px-4 py-2 bg-green-600 text-white rounded-lg",
                                 ),
                                 rx.el.button(
                                     "Proceed to AI Insights",
-                                    on_click=State.proceed_to_insights,
+                                    on_click=InsightsState.proceed_to_insights,
                                     class_name="px-6 py-3 bg-sky-600 text-white font-semibold rounded-xl shadow-md hover:bg-sky-700",
                                 ),
                                 class_name="flex justify-between items-center mt-8",
                             ),
+                            rx.cond(
+                                InsightsState.writeback_summary != "",
+                                rx.el.p(
+                                    InsightsState.writeback_summary,
+                                    class_name="text-sm text-gray-500 mt-2 text-center",
+                                ),
+                            ),
                         ),
-                    )
+                    ),
+                    similar_customers_section(),
                 ),
             ),
             class_name="p-4 sm:p-6 lg:p-8",
@@ -0,0 +1,119 @@
+import os
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    """Reads a boolean flag from the environment."""
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Opt-in compact-memory mode: float32 numerics, small-int category codes and
+# Arrow-backed strings across the cleaning, PCA and clustering stages.
+COMPACT_MEMORY = _env_flag("SEGMENTATION_COMPACT_MEMORY")
+
+# How cleaning encodes categorical columns: "label" maps categories to integer
+# codes; "onehot" adds a sparse 0/1 column per category, and PCA then runs as
+# a truncated SVD on the sparse design matrix so it is never densified.
+ENCODING = os.environ.get("SEGMENTATION_ENCODING", "label")
+
+# Per-stage timing, CPU, peak RSS, row counts and state delta sizes. Spans are
+# appended as JSON lines to SEGMENTATION_TRACE_FILE (empty disables the file).
+INSTRUMENTATION = _env_flag("SEGMENTATION_INSTRUMENTATION", default=True)
+TRACE_FILE = os.environ.get("SEGMENTATION_TRACE_FILE", "traces/pipeline_trace.jsonl")
+
+# Durable pipeline job queue: SQLite index plus pickled inputs, checkpoints
+# and outputs per job.
+JOB_DB_PATH = os.environ.get("SEGMENTATION_JOB_DB", "jobs/jobs.sqlite3")
+JOB_STORE_DIR = os.environ.get("SEGMENTATION_JOB_STORE", "jobs/store")
+JOB_WORKERS = int(os.environ.get("SEGMENTATION_JOB_WORKERS", "2"))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("SEGMENTATION_JOB_HEARTBEAT", "5"))
+JOB_RETENTION_DAYS = float(os.environ.get("SEGMENTATION_JOB_RETENTION_DAYS", "7"))
+# Memory the queue may hand out to concurrently running jobs across all
+# sessions. 0 uses half of the host's physical memory.
+JOB_MEMORY_BUDGET_MB = int(os.environ.get("SEGMENTATION_JOB_MEMORY_BUDGET_MB", "0"))
+
+# Parsed uploads are cached by content hash as Arrow files, so re-uploading
+# the same extract skips parsing. Least recently used files are evicted once
+# the cache exceeds SEGMENTATION_UPLOAD_CACHE_MB.
+UPLOAD_CACHE_DIR = os.environ.get("SEGMENTATION_UPLOAD_CACHE", "jobs/uploads")
+UPLOAD_CACHE_MB = int(os.environ.get("SEGMENTATION_UPLOAD_CACHE_MB", "2048"))
+
+# Files of a multi-file upload are parsed in this many worker processes
+# (0 = one per core, fewer if memory is short) and then merged.
+INGEST_WORKERS = int(os.environ.get("SEGMENTATION_INGEST_WORKERS", "0"))
+
+# Transaction uploads (one row per transaction) are streamed and aggregated
+# into one row per customer, so they may be larger than customer tables.
+TRANSACTION_UPLOAD_MB = int(
+    os.environ.get("SEGMENTATION_TRANSACTION_UPLOAD_MB", "1024")
+)
+
+# Cluster profiles, quartiles and exports run as SQL in an embedded DuckDB
+# database over Parquet copies of the cleaned data and cluster labels, so
+# they stream from disk instead of loading the data. DuckDB spills to the
+# temp directory beyond its memory limit and uses every core unless limited.
+# Set it to "pandas" to opt out and compute them in memory instead.
+ANALYTICS_ENGINE = os.environ.get("SEGMENTATION_ANALYTICS_ENGINE", "duckdb")
+ANALYTICS_MEMORY_MB = int(os.environ.get("SEGMENTATION_ANALYTICS_MEMORY_MB", "1024"))
+ANALYTICS_THREADS = int(os.environ.get("SEGMENTATION_ANALYTICS_THREADS", "0"))
+ANALYTICS_TEMP_DIR = os.environ.get("SEGMENTATION_ANALYTICS_TEMP", "jobs/analytics")
+
+# Segment write-back: each customer's cluster and distance to its centroid are
+# bulk-loaded into this SQLAlchemy database URL (SQLite, or PostgreSQL through
+# COPY), one transaction per clustering run that replaces any earlier load of
+# the same run. Rows are sent this many at a time.
+WRITEBACK_URL = os.environ.get(
+    "SEGMENTATION_WRITEBACK_URL", "sqlite:///jobs/segments.sqlite3"
+)
+WRITEBACK_TABLE = os.environ.get("SEGMENTATION_WRITEBACK_TABLE", "segment_assignments")
+WRITEBACK_BATCH_ROWS = int(os.environ.get("SEGMENTATION_WRITEBACK_BATCH_ROWS", "50000"))
+
+# Strategy planner: a stage switches to sampled or mini-batch variants when
+# the exact algorithm is predicted to take longer than this. Per-host cost
+# coefficients are measured once and cached in the calibration file.
+PLANNER_TIME_BUDGET_SECONDS = float(
+    os.environ.get("SEGMENTATION_PLANNER_TIME_BUDGET", "60")
+)
+PLANNER_CALIBRATION_FILE = os.environ.get(
+    "SEGMENTATION_PLANNER_CALIBRATION", "jobs/calibration.json"
+)
+
+# Draft mode: after an upload or a new clustering request, the whole pipeline
+# first runs on a stratified sample and shows provisional results while the
+# full-data run continues in the background. Only uploads of more than
+# DRAFT_MIN_ROWS rows get a draft; smaller ones run in full at once.
+DRAFT_MODE = _env_flag("SEGMENTATION_DRAFT_MODE", default=True)
+DRAFT_SAMPLE_ROWS = int(os.environ.get("SEGMENTATION_DRAFT_SAMPLE_ROWS", "3000"))
+DRAFT_MIN_ROWS = int(
+    os.environ.get("SEGMENTATION_DRAFT_MIN_ROWS", str(DRAFT_SAMPLE_ROWS * 10))
+)
+DRAFT_TIME_BUDGET_SECONDS = float(
+    os.environ.get("SEGMENTATION_DRAFT_TIME_BUDGET", "0.3")
+)
+
+# Changing clustering parameters re-runs clustering once they have stayed
+# unchanged for this long; runs for superseded parameters are cancelled.
+RECOMPUTE_DEBOUNCE_SECONDS = float(
+    os.environ.get("SEGMENTATION_RECOMPUTE_DEBOUNCE", "0.6")
+)
+
+# k-means restarts run concurrently in this many worker processes, each with a
+# single BLAS thread. 0 uses every core.
+KMEANS_WORKERS = int(os.environ.get("SEGMENTATION_KMEANS_WORKERS", "0"))
+
+# Segment stability: clustering is repeated on this many random subsamples of
+# at most this many rows, in parallel worker processes (0 uses every core).
+STABILITY_BOOTSTRAPS = int(os.environ.get("SEGMENTATION_STABILITY_BOOTSTRAPS", "20"))
+STABILITY_SAMPLE_ROWS = int(
+    os.environ.get("SEGMENTATION_STABILITY_SAMPLE_ROWS", "10000")
+)
+STABILITY_WORKERS = int(os.environ.get("SEGMENTATION_STABILITY_WORKERS", "0"))
+
+# Startup: with lazy imports the analysis modules (scikit-learn, SciPy,
+# plotly.express, google-generativeai) load on first use, so workers boot
+# quickly. Warmup then loads them in the background after startup and runs
+# each stage once on a tiny dataset, so the first click does not pay for it.
+LAZY_IMPORTS = _env_flag("SEGMENTATION_LAZY_IMPORTS", default=True)
+WARMUP = _env_flag("SEGMENTATION_WARMUP", default=True)
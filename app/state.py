@@ -4,17 +4,52 @@ from typing import Any, Literal, Optional, TypedDict
 import plotly.graph_objects as go
 import io
 import asyncio
+import hashlib
+import json
 import logging
 import os
+import tempfile
+import uuid
 from pydantic import BaseModel
-from app.utils.cleaning_utils import (
-    clean_data,
-    get_statistics,
-    create_correlation_heatmap,
+from reflex.utils.format import json_dumps
+from app.utils.figure_utils import compact_figure_json, create_timing_chart
+from app.utils.instrumentation import metrics, pipeline_run, span
+from app.utils.job_queue import DatasetRef, JobFailedError, OutputRef, get_job_queue
+from app.utils.lazy_imports import lazy_module
+from app.settings import (
+    COMPACT_MEMORY,
+    DRAFT_MIN_ROWS,
+    DRAFT_MODE,
+    DRAFT_SAMPLE_ROWS,
+    ENCODING,
+    INSTRUMENTATION,
+    RECOMPUTE_DEBOUNCE_SECONDS,
+    STABILITY_BOOTSTRAPS,
+    TRANSACTION_UPLOAD_MB,
+    WRITEBACK_TABLE,
 )
 
+# Imported on first use so the web worker boots without scikit-learn and SciPy.
+analytics_engine = lazy_module("app.utils.analytics_engine")
+clustering_utils = lazy_module("app.utils.clustering_utils")
+google_ai_utils = lazy_module("app.utils.google_ai_utils")
+similarity = lazy_module("app.utils.similarity")
+writeback = lazy_module("app.utils.writeback")
+
 logging.basicConfig(level=logging.INFO)
+rx.serializer(compact_figure_json, to=dict, overwrite=True)
 WorkflowStage = Literal["Upload", "Cleaning", "PCA", "Clustering", "Insights"]
+JOB_SEQUENCE = ["ingest", "cleaning", "pca", "clustering", "profiles"]
+DRAFT_STAGES = JOB_SEQUENCE[1:]
+STAGE_PROGRESS: dict[str, WorkflowStage] = {
+    "ingest": "Upload",
+    "cleaning": "Cleaning",
+    "pca": "PCA",
+    "clustering": "Clustering",
+    "profiles": "Insights",
+}
+COMPARED_ALGORITHMS = ["kmeans", "hierarchical"]
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
 
 class Stats(BaseModel):
@@ -25,10 +60,20 @@ class Stats(BaseModel):
     dtypes: dict[str, int] = {}
 
 
+class ColumnProfile(TypedDict):
+    column: str
+    kind: str
+    distinct: int
+    missing_share: float
+    action: str
+    actions: list[str]
+
+
 class ProfileData(TypedDict):
     size: int
     percentage: str
     feature_means: dict[str, float]
+    feature_quartiles: dict[str, list[float]]
     distinguishing_features: list[str]
 
 
@@ -45,45 +90,253 @@ class AIInsights(TypedDict):
     error: Optional[str]
 
 
+class StageTiming(TypedDict):
+    stage: str
+    nested: bool
+    seconds: str
+    cpu_seconds: str
+    share: str
+    peak_rss_mb: str
+    rows_in: str
+    rows_out: str
+    delta_kb: str
+
+
+class PlanReport(TypedDict):
+    stage: str
+    strategy: str
+    predicted_seconds: str
+    actual_seconds: str
+    predicted_memory: str
+    actual_memory: str
+
+
+class ComparisonRow(TypedDict):
+    algorithm: str
+    name: str
+    silhouette: str
+    seconds: str
+    strategy: str
+    recommended: bool
+
+
+class AgreementRow(TypedDict):
+    pair: str
+    ari: str
+
+
+class ComparisonReport(TypedDict):
+    n_clusters: int
+    rows: list[ComparisonRow]
+    agreement: list[AgreementRow]
+    recommendation: str
+    reason: str
+
+
+class StabilityRow(TypedDict):
+    cluster: str
+    size: str
+    jaccard: str
+    jaccard_min: str
+    co_assignment: str
+    verdict: str
+
+
+class StabilityReport(TypedDict):
+    rows: list[StabilityRow]
+    confident_share: str
+    n_bootstraps: int
+    sample_rows: str
+    seconds: str
+
+
+def _stability_report(stability: dict) -> StabilityReport:
+    """Formats bootstrap_stability output for display."""
+    return {
+        "rows": [
+            {
+                "cluster": cluster,
+                "size": f"{row['size']:,}",
+                "jaccard": f"{row['jaccard_mean']:.2f}",
+                "jaccard_min": f"{row['jaccard_min']:.2f}",
+                "co_assignment": f"{row['co_assignment']:.0%}",
+                "verdict": row["verdict"],
+            }
+            for cluster, row in stability["clusters"].iterrows()
+        ],
+        "confident_share": f"{stability['confident_share']:.0%}",
+        "n_bootstraps": stability["n_bootstraps"],
+        "sample_rows": f"{stability['sample_rows']:,}",
+        "seconds": f"{stability['seconds']:.1f} s",
+    }
+
+
+class SimilarCustomer(TypedDict):
+    row: int
+    segment: str
+    distance: str
+
+
+class SimilarityLookup(TypedDict):
+    row: int
+    segment: str
+    boundary_segment: str
+    boundary_distance: str
+    milliseconds: str
+    api_path: str
+
+
+def _segment_name(label: int) -> str:
+    return "Noise" if label == -1 else str(label)
+
+
+def _comparison_report(comparison: dict, n_clusters: int) -> ComparisonReport:
+    """Formats compare_algorithms output for display."""
+    return {
+        "n_clusters": n_clusters,
+        "rows": [
+            {
+                "algorithm": row["algorithm"],
+                "name": row["name"],
+                "silhouette": f"{row['silhouette']:.3f}",
+                "seconds": f"{row['seconds']:.2f} s",
+                "strategy": row["strategy"],
+                "recommended": row["algorithm"] == comparison["recommendation"],
+            }
+            for row in comparison["rows"]
+        ],
+        "agreement": [
+            {
+                "pair": f"{clustering_utils.ALGORITHM_NAMES[a]} vs {clustering_utils.ALGORITHM_NAMES[b]}",
+                "ari": f"{ari:.3f}",
+            }
+            for (a, b), ari in comparison["agreement"].items()
+        ],
+        "recommendation": clustering_utils.ALGORITHM_NAMES[comparison["recommendation"]],
+        "reason": comparison["reason"],
+    }
+
+
+def _record_delta(record: dict, state: rx.State):
+    """Attaches the size of the delta the state is about to send to a span."""
+    if not INSTRUMENTATION:
+        return
+    try:
+        metrics.annotate(record, delta_bytes=len(json_dumps(state.get_delta())))
+    except Exception as e:
+        logging.warning(f"Could not measure state delta: {e}")
+
+
+async def _submit_job(
+    stage: str, inputs: dict, params: dict, owner: str, run_id: str
+) -> str:
+    queue = await asyncio.to_thread(get_job_queue)
+    return await asyncio.to_thread(queue.submit, stage, inputs, params, owner, run_id)
+
+
+async def _receive_upload(upload_file: rx.UploadFile) -> tuple[str, str]:
+    """Writes an upload to the job store in chunks, hashing it as it arrives.
+
+    Returns the file's path, named by content hash, and its SHA-256.
+    """
+    queue = await asyncio.to_thread(get_job_queue)
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(
+        dir=queue.upload_dir, suffix=".part", delete=False
+    ) as f:
+        try:
+            while chunk := await upload_file.read(UPLOAD_CHUNK_BYTES):
+                digest.update(chunk)
+                f.write(chunk)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    path = queue.upload_path(digest.hexdigest(), upload_file.filename)
+    os.replace(f.name, path)
+    return path, digest.hexdigest()
+
+
+async def _wait_for_job(job_id: str, on_position=None) -> dict:
+    queue = await asyncio.to_thread(get_job_queue)
+    return await queue.wait(job_id, on_position=on_position)
+
+
+async def _cancel_jobs(job_ids: list[str], owner: str):
+    queue = await asyncio.to_thread(get_job_queue)
+    for job_id in job_ids:
+        await asyncio.to_thread(queue.cancel, job_id, owner)
+
+
+def _stage_job_spec(
+    stage: str,
+    job_ids: dict[str, str],
+    algorithm: str = "",
+    n_clusters: int = 0,
+    column_actions: dict[str, str] | None = None,
+) -> tuple[dict, dict]:
+    """Inputs and params of a full-data stage job, wired to earlier stages' outputs."""
+    if stage == "cleaning":
+        return {"raw_data": OutputRef(job_ids["ingest"], "raw_data")}, {
+            "compact": COMPACT_MEMORY,
+            "columns": column_actions,
+            "encoding": ENCODING,
+        }
+    if stage == "pca":
+        return {"cleaned_data": OutputRef(job_ids["cleaning"], "cleaned_data")}, {
+            "compact": COMPACT_MEMORY
+        }
+    if stage == "clustering":
+        return {"transformed_data": OutputRef(job_ids["pca"], "transformed_data")}, {
+            "algorithm": algorithm,
+            "n_clusters": n_clusters,
+            "compact": COMPACT_MEMORY,
+        }
+    if analytics_engine.duckdb_enabled():
+        return {
+            "cleaned_data": DatasetRef(job_ids["cleaning"], "cleaned_data"),
+            "labels": DatasetRef(job_ids["clustering"], "labels"),
+        }, {"engine": "duckdb"}
+    return {
+        "cleaned_data": OutputRef(job_ids["cleaning"], "cleaned_data"),
+        "labels": OutputRef(job_ids["clustering"], "labels"),
+    }, {}
+
+
 class State(rx.State):
-    """The main application state."""
+    """The main application state.
+
+    Holds only the workflow-wide flags. Each pipeline stage keeps its data in
+    its own substate so an event only serializes and diffs the stage it touched.
+    Large intermediates (DataFrames, PCA arrays, clustering results) are backend
+    vars and never reach the browser.
+
+    Stage work runs as durable jobs (see app/utils/job_queue.py). The browser
+    keeps the job id of every stage it started, so after a reload or a server
+    restart reattach_jobs restores finished stages and waits on running ones.
+
+    In draft mode a run first shows results computed on a sample; the stages
+    listed in draft_stages are still waiting for their full-data results.
+
+    Uploads and clustering runs each start a new run generation. A run only
+    applies its results while its generation is still the latest, and the
+    jobs it superseded are cancelled.
+    """
 
     current_stage: WorkflowStage = "Upload"
     is_processing: bool = False
+    queue_position: int = 0
     sidebar_open: bool = True
-    uploaded_file_name: str = ""
-    raw_data: pd.DataFrame | None = None
-    cleaned_data: pd.DataFrame | None = None
-    original_stats: Stats = Stats()
-    cleaned_stats: Stats = Stats()
-    correlation_heatmap: go.Figure | None = go.Figure()
-    preview_page: int = 1
-    rows_per_page: int = 10
-    pca_results: dict | None = None
-    scree_plot: go.Figure = go.Figure()
-    cumulative_variance_plot: go.Figure = go.Figure()
-    clustering_algorithm: str = "kmeans"
-    n_clusters: int = 4
-    clustering_results: dict | None = None
-    cluster_scatter_fig: go.Figure = go.Figure()
-    dendrogram_fig: go.Figure = go.Figure()
-    cluster_profiles: dict[str, ProfileData | dict] = {}
-    ai_insights: AIInsights = {"marketing_recommendations": "", "personas": []}
-    is_generating_insights: bool = False
-
-    @rx.var
-    def has_dendrogram_data(self) -> bool:
-        return self.dendrogram_fig is not None and len(self.dendrogram_fig.data) > 0
-
-    @rx.var
-    def filtered_cluster_keys(self) -> list[str]:
-        return [
-            k
-            for k in self.cluster_profiles.keys()
-            if k not in ["summary_df", "feature_names"]
-        ]
+    job_ids_json: str = rx.LocalStorage("{}", name="segmentation_job_ids")
+    draft_mode: bool = DRAFT_MODE
+    draft_stages: list[str] = []
+    draft_sample_rows: int = 0
+    _run_id: str = ""
+    _run_generation: int = 0
+    _draft_job_id: str = ""
+    _stability_job_id: str = ""
 
-    @rx.var
+    @rx.var(cache=True, deps=["current_stage"], auto_deps=False)
     def workflow_stages(self) -> list[dict[str, str | bool]]:
         stages = ["Upload", "Cleaning", "PCA", "Clustering", "Insights"]
         current_index = stages.index(self.current_stage)
@@ -96,93 +349,401 @@ class State(rx.State):
             for i, stage in enumerate(stages)
         ]
 
-    @rx.var
+    @rx.event
+    def set_sidebar_open(self, open: bool):
+        self.sidebar_open = open
+
+    @rx.event
+    def set_draft_mode(self, enabled: bool):
+        self.draft_mode = enabled
+
+    @rx.event
+    async def go_to_page(self, page_name: str):
+        upload_state = await self.get_state(UploadState)
+        if page_name == "data_cleaning" and upload_state._raw_data is None:
+            return rx.toast.info("Please upload a file first.")
+        return rx.redirect(f"/{page_name}")
+
+    def _job_ids(self) -> dict[str, str]:
+        return json.loads(self.job_ids_json or "{}")
+
+    def _stage_job_id(self, stage: str) -> str | None:
+        return self._job_ids().get(stage)
+
+    def _advance_to(self, stage: str):
+        """Moves the progress indicator forward to a stage, never back."""
+        stages = list(STAGE_PROGRESS.values())
+        if stages.index(STAGE_PROGRESS[stage]) > stages.index(self.current_stage):
+            self.current_stage = STAGE_PROGRESS[stage]
+
+    async def _apply_stage(
+        self, stage: str, job_id: str, outputs: dict, draft: bool = False
+    ):
+        """Shows a stage's job outputs and tracks whether they are draft or final."""
+        stage_state = await self.get_state(_STAGE_STATES[stage])
+        stage_state._apply_job(job_id, outputs)
+        if stage == "cleaning" and "column_actions" in outputs:
+            upload_state = await self.get_state(UploadState)
+            upload_state._show_actions(outputs["column_actions"])
+        others = [s for s in self.draft_stages if s != stage]
+        self.draft_stages = others + [stage] if draft else others
+
+    def _forget_jobs_from(self, stage: str) -> dict[str, str]:
+        """Drops the job ids of stage and every stage after it."""
+        earlier = JOB_SEQUENCE[: JOB_SEQUENCE.index(stage)]
+        job_ids = {
+            s: j
+            for s, j in json.loads(self.job_ids_json or "{}").items()
+            if s in earlier
+        }
+        self.job_ids_json = json.dumps(job_ids)
+        return job_ids
+
+    def _remember_job(self, stage: str, job_id: str):
+        """Stores a stage's job id in the browser; later stages are now stale."""
+        if self._stage_job_id(stage) == job_id:
+            return
+        job_ids = self._forget_jobs_from(stage)
+        job_ids[stage] = job_id
+        self.job_ids_json = json.dumps(job_ids)
+
+    async def _supersede(self, from_stage: str) -> int:
+        """Starts a new run generation from a stage and returns it.
+
+        Jobs of older runs for from_stage and later stages are cancelled if
+        they are still queued or running.
+        """
+        self._run_generation += 1
+        later = JOB_SEQUENCE[JOB_SEQUENCE.index(from_stage) :]
+        stale = [j for s, j in self._job_ids().items() if s in later]
+        if self._draft_job_id:
+            stale.append(self._draft_job_id)
+            self._draft_job_id = ""
+        if self._stability_job_id:
+            stale.append(self._stability_job_id)
+            self._stability_job_id = ""
+        await _cancel_jobs(stale, self.router.session.client_token)
+        return self._run_generation
+
+    async def _use_draft(self) -> bool:
+        """Whether to preview on a sample first: draft mode on and a large upload."""
+        upload_state = await self.get_state(UploadState)
+        raw_data = upload_state._raw_data
+        if not self.draft_mode or raw_data is None:
+            return False
+        return len(raw_data) > DRAFT_MIN_ROWS
+
+    async def _column_actions(self) -> dict[str, str] | None:
+        """The action chosen for each profiled column; None before profiling."""
+        upload_state = await self.get_state(UploadState)
+        profiles = upload_state.column_profiles
+        return {p["column"]: p["action"] for p in profiles} if profiles else None
+
+    async def _await_job(self, job_id: str) -> dict:
+        """Waits for a job from a background event, showing its place in the queue."""
+
+        async def show_position(position: int):
+            async with self:
+                self.queue_position = position
+
+        try:
+            return await _wait_for_job(job_id, show_position)
+        finally:
+            async with self:
+                self.queue_position = 0
+
+    @rx.event(background=True)
+    async def reattach_jobs(self):
+        async with self:
+            job_ids = json.loads(self.job_ids_json or "{}")
+        for stage in JOB_SEQUENCE:
+            job_id = job_ids.get(stage)
+            if job_id is None:
+                break
+            async with self:
+                stage_state = await self.get_state(_STAGE_STATES[stage])
+                if stage_state._applied_job_id == job_id:
+                    continue
+                self.is_processing = True
+            try:
+                outputs = await self._await_job(job_id)
+            except JobFailedError as e:
+                logging.warning(f"Could not reattach to {stage} job {job_id}: {e}")
+                async with self:
+                    self.is_processing = False
+                    self._forget_jobs_from(stage)
+                return
+            async with self:
+                await self._apply_stage(stage, job_id, outputs)
+                self._advance_to(stage)
+                self.is_processing = False
+
+    @rx.event(background=True)
+    async def run_draft_pipeline(self, from_stage: str = "cleaning"):
+        """Shows the pipeline's results on a sample at once, then on all rows.
+
+        Stages from from_stage on are previewed from a single draft job over a
+        stratified sample. The full-data jobs for the same stages then run one
+        after another and replace the draft results as each one finishes.
+        """
+        async with self:
+            job_ids = self._job_ids()
+            if "ingest" not in job_ids:
+                yield rx.toast.error("Please upload a file first.")
+                return
+            clustering_state = await self.get_state(ClusteringState)
+            algorithm = clustering_state.clustering_algorithm
+            n_clusters = clustering_state.n_clusters
+            column_actions = await self._column_actions()
+            self.is_processing = True
+            generation = await self._supersede(from_stage)
+            run_id = self._run_id
+            owner = self.router.session.client_token
+            # Refinement also has to redo any earlier stage that has no
+            # full-data result yet, such as one a superseded run left as draft.
+            start = DRAFT_STAGES.index(from_stage)
+            missing = [
+                i
+                for i, s in enumerate(DRAFT_STAGES[:start])
+                if s not in job_ids or s in self.draft_stages
+            ]
+            stages = DRAFT_STAGES[min(missing, default=start) :]
+        try:
+            with pipeline_run(run_id), span("draft_pipeline") as record:
+                draft_id = await _submit_job(
+                    "draft",
+                    {"raw_data": OutputRef(job_ids["ingest"], "raw_data")},
+                    {
+                        "algorithm": algorithm,
+                        "n_clusters": n_clusters,
+                        "compact": COMPACT_MEMORY,
+                        "sample_rows": DRAFT_SAMPLE_ROWS,
+                        "columns": column_actions,
+                        "encoding": ENCODING,
+                    },
+                    owner,
+                    run_id,
+                )
+                async with self:
+                    if self._run_generation != generation:
+                        return
+                    self._draft_job_id = draft_id
+                draft = await self._await_job(draft_id)
+                record["rows_out"] = draft["sample_rows"]
+            async with self:
+                if self._run_generation != generation:
+                    return
+                self._draft_job_id = ""
+                for stage in stages:
+                    await self._apply_stage(stage, draft_id, draft[stage], draft=True)
+                self._advance_to("cleaning")
+                self.draft_sample_rows = draft["sample_rows"]
+                self.is_processing = False
+                _record_delta(record, self)
+            yield rx.toast.info(
+                f"Draft results from {draft['sample_rows']:,} of "
+                f"{draft['total_rows']:,} rows. Refining on all rows..."
+            )
+        except Exception as e:
+            async with self:
+                if self._run_generation != generation:
+                    return
+                self.is_processing = False
+            logging.exception(f"Draft pipeline error: {e}")
+            yield rx.toast.error(f"Draft run failed: {e}")
+            return
+        try:
+            for stage in stages:
+                async with self:
+                    if self._run_generation != generation:
+                        return
+                    inputs, params = _stage_job_spec(
+                        stage, self._job_ids(), algorithm, n_clusters, column_actions
+                    )
+                with pipeline_run(run_id), span(f"refine_{stage}") as record:
+                    job_id = await _submit_job(stage, inputs, params, owner, run_id)
+                    async with self:
+                        if self._run_generation != generation:
+                            return
+                        self._remember_job(stage, job_id)
+                    outputs = await self._await_job(job_id)
+                async with self:
+                    if self._run_generation != generation:
+                        # A newer upload or clustering run replaced this one.
+                        return
+                    await self._apply_stage(stage, job_id, outputs)
+                    _record_delta(record, self)
+            yield rx.toast.success("Final results on all rows are ready.")
+        except Exception as e:
+            async with self:
+                if self._run_generation != generation:
+                    return
+            logging.exception(f"Full-data refinement error: {e}")
+            yield rx.toast.error(f"Full-data run failed, draft results kept: {e}")
+
+
+class UploadState(State):
+    """File upload and raw data preview."""
+
+    uploaded_file_name: str = ""
+    sheet_name: str = ""
+    transactions: bool = False
+    column_profiles: list[ColumnProfile] = []
+    _raw_data: pd.DataFrame | None = None
+    # Name, saved path and SHA-256 of each file handle_upload received.
+    _received_files: list[tuple[str, str, str]] = []
+    _applied_job_id: str = ""
+    preview_page: int = 1
+    rows_per_page: int = 10
+
+    @rx.var(cache=True, deps=["_raw_data"], auto_deps=False)
+    def has_raw_data(self) -> bool:
+        return self._raw_data is not None
+
+    @rx.var(
+        cache=True,
+        deps=["_raw_data", "preview_page", "rows_per_page"],
+        auto_deps=False,
+    )
     def raw_data_preview(self) -> list[dict[str, float | int | str]]:
-        if self.raw_data is not None and (not self.raw_data.empty):
+        if self._raw_data is not None and (not self._raw_data.empty):
             start = (self.preview_page - 1) * self.rows_per_page
             end = start + self.rows_per_page
-            return self.raw_data.iloc[start:end].to_dict("records")
+            return self._raw_data.iloc[start:end].to_dict("records")
         return []
 
-    @rx.var
+    @rx.var(cache=True, deps=["_raw_data"], auto_deps=False)
     def raw_data_columns(self) -> list[str]:
-        if self.raw_data is not None:
-            return self.raw_data.columns.tolist()
+        if self._raw_data is not None:
+            return self._raw_data.columns.tolist()
         return []
 
-    @rx.var
+    @rx.var(cache=True, deps=["_raw_data", "rows_per_page"], auto_deps=False)
     def total_preview_pages(self) -> int:
-        if self.raw_data is not None:
-            return (len(self.raw_data) + self.rows_per_page - 1) // self.rows_per_page
+        if self._raw_data is not None:
+            return (len(self._raw_data) + self.rows_per_page - 1) // self.rows_per_page
         return 1
 
     @rx.event
-    def set_sidebar_open(self, open: bool):
-        self.sidebar_open = open
+    def set_sheet_name(self, sheet: str):
+        self.sheet_name = sheet
+
+    @rx.event
+    def set_transactions(self, transactions: bool):
+        self.transactions = transactions
 
     @rx.event
     async def handle_upload(self, files: list[rx.UploadFile]):
+        """Checks and saves the uploaded files, then starts ingest_upload.
+
+        Reflex runs upload handlers in the foreground only, so waiting for
+        the ingest job is left to the background event.
+        """
         if not files:
             yield rx.toast.error("No file selected.")
             return
         self.is_processing = True
         yield
+        limit_mb = TRANSACTION_UPLOAD_MB if self.transactions else 50
         try:
-            upload_file = files[0]
-            if not (
-                upload_file.filename.endswith(".csv")
-                or upload_file.filename.endswith(".xlsx")
-            ):
-                self.is_processing = False
-                yield rx.toast.error(
-                    "Invalid file type. Please upload a CSV or XLSX file."
-                )
-                return
-            if upload_file.size > 50 * 1024 * 1024:
-                self.is_processing = False
-                yield rx.toast.error("File size exceeds 50MB limit.")
-                return
-            self.uploaded_file_name = upload_file.filename
-            file_content = await upload_file.read()
-            if self.uploaded_file_name.endswith(".csv"):
-                df = pd.read_csv(io.BytesIO(file_content))
-            else:
-                df = pd.read_excel(io.BytesIO(file_content))
-            self.raw_data = df
-            self.preview_page = 1
-            yield State.run_data_cleaning
+            for upload_file in files:
+                if not (
+                    upload_file.filename.endswith(".csv")
+                    or upload_file.filename.endswith(".xlsx")
+                ):
+                    self.is_processing = False
+                    yield rx.toast.error(
+                        f"Invalid file type: {upload_file.filename}. "
+                        "Please upload CSV or XLSX files."
+                    )
+                    return
+                if upload_file.size > limit_mb * 1024 * 1024:
+                    self.is_processing = False
+                    yield rx.toast.error(
+                        f"{upload_file.filename} exceeds the {limit_mb}MB limit."
+                    )
+                    return
+            self._received_files = [
+                (upload_file.filename, *await _receive_upload(upload_file))
+                for upload_file in files
+            ]
+            yield UploadState.ingest_upload
         except Exception as e:
             logging.exception(f"File upload failed: {e}")
             self.is_processing = False
             yield rx.toast.error(f"File processing failed: {e}")
 
     @rx.event(background=True)
-    async def run_data_cleaning(self):
+    async def ingest_upload(self):
+        """Parses the saved upload in an ingest job, then starts cleaning."""
         async with self:
-            if self.raw_data is None:
-                self.is_processing = False
-                yield rx.toast.error("No data available to clean.")
+            received, self._received_files = self._received_files, []
+            if not received:
                 return
-            self.is_processing = True
-            raw_data_copy = self.raw_data.copy()
+            self._run_id = uuid.uuid4().hex
+            generation = await self._supersede("ingest")
+            inputs = {"paths": [path for _, path, _ in received]}
+            params = {
+                "filenames": [filename for filename, _, _ in received],
+                "compact": COMPACT_MEMORY,
+                "sha256": [sha256 for _, _, sha256 in received],
+                "sheet": self.sheet_name.strip(),
+                "transactions": self.transactions,
+            }
+            run_id = self._run_id
+            owner = self.router.session.client_token
         try:
-            original_stats, _ = get_statistics(raw_data_copy)
-            cleaned_df, outliers_removed = clean_data(raw_data_copy)
-            cleaned_stats_data, _ = get_statistics(cleaned_df, outliers_removed)
-            heatmap_fig = create_correlation_heatmap(cleaned_df)
+            with pipeline_run(run_id), span("ingest_upload") as record:
+                job_id = await _submit_job("ingest", inputs, params, owner, run_id)
+                async with self:
+                    if self._run_generation != generation:
+                        return
+                    self._remember_job("ingest", job_id)
+                outputs = await self._await_job(job_id)
+                record["rows_out"] = len(outputs["raw_data"])
             async with self:
-                self.original_stats = Stats(**original_stats)
-                self.cleaned_stats = Stats(**cleaned_stats_data)
-                self.cleaned_data = cleaned_df
-                self.correlation_heatmap = heatmap_fig
-                self.current_stage = "Cleaning"
-                self.is_processing = False
-            yield rx.toast.success("Data cleaning complete!")
+                if self._run_generation != generation:
+                    return
+                self._apply_job(job_id, outputs)
+                self.draft_stages = []
+                _record_delta(record, self)
+                use_draft = await self._use_draft()
+            if use_draft:
+                yield State.run_draft_pipeline("cleaning")
+            else:
+                yield CleaningState.run_data_cleaning
         except Exception as e:
-            logging.exception(f"Data cleaning error: {e}")
             async with self:
+                if self._run_generation != generation:
+                    return
                 self.is_processing = False
-            yield rx.toast.error(f"An error occurred during cleaning: {e}")
+            logging.exception(f"File upload failed: {e}")
+            yield rx.toast.error(f"File processing failed: {e}")
+
+    def _apply_job(self, job_id: str, outputs: dict):
+        self.uploaded_file_name = outputs["filename"]
+        self._raw_data = outputs["raw_data"]
+        self.column_profiles = outputs.get("schema", [])
+        self.preview_page = 1
+        self._applied_job_id = job_id
+
+    def _show_actions(self, actions: dict[str, str]):
+        """Shows the column actions a cleaning run used."""
+        self.column_profiles = [
+            {**p, "action": actions.get(p["column"], p["action"])}
+            for p in self.column_profiles
+        ]
+
+    @rx.event
+    def set_column_action(self, column: str, action: str):
+        self._show_actions({column: action})
+
+    @rx.event
+    async def apply_column_actions(self):
+        """Cleans the data again with the chosen column actions."""
+        if await self._use_draft():
+            return State.run_draft_pipeline("cleaning")
+        return CleaningState.run_data_cleaning
 
     @rx.event
     def next_preview_page(self):
@@ -194,35 +755,100 @@ class State(rx.State):
         if self.preview_page > 1:
             self.preview_page -= 1
 
-    @rx.event
-    def go_to_page(self, page_name: str):
-        if page_name == "data_cleaning" and self.raw_data is None:
-            return rx.toast.info("Please upload a file first.")
-        return rx.redirect(f"/{page_name}")
+
+class CleaningState(State):
+    """Data cleaning results and statistics."""
+
+    _cleaned_data: pd.DataFrame | None = None
+    _applied_job_id: str = ""
+    original_stats: Stats = Stats()
+    cleaned_stats: Stats = Stats()
+    correlation_heatmap: go.Figure | None = go.Figure()
+
+    @rx.var(cache=True, deps=["_cleaned_data"], auto_deps=False)
+    def has_cleaned_data(self) -> bool:
+        return self._cleaned_data is not None
+
+    @rx.event(background=True)
+    async def run_data_cleaning(self):
+        async with self:
+            if self._stage_job_id("ingest") is None:
+                self.is_processing = False
+                yield rx.toast.error("No data available to clean.")
+                return
+            self.is_processing = True
+            inputs, params = _stage_job_spec(
+                "cleaning", self._job_ids(), column_actions=await self._column_actions()
+            )
+            run_id = self._run_id
+            owner = self.router.session.client_token
+        try:
+            with pipeline_run(run_id), span("run_data_cleaning") as record:
+                job_id = await _submit_job("cleaning", inputs, params, owner, run_id)
+                async with self:
+                    self._remember_job("cleaning", job_id)
+                outputs = await self._await_job(job_id)
+                record["rows_out"] = len(outputs["cleaned_data"])
+            async with self:
+                await self._apply_stage("cleaning", job_id, outputs)
+                self.current_stage = "Cleaning"
+                self.is_processing = False
+                _record_delta(record, self)
+            yield rx.toast.success("Data cleaning complete!")
+        except Exception as e:
+            logging.exception(f"Data cleaning error: {e}")
+            async with self:
+                self.is_processing = False
+            yield rx.toast.error(f"An error occurred during cleaning: {e}")
+
+    def _apply_job(self, job_id: str, outputs: dict):
+        self.original_stats = Stats(**outputs["original_stats"])
+        self.cleaned_stats = Stats(**outputs["cleaned_stats"])
+        self._cleaned_data = outputs["cleaned_data"]
+        self.correlation_heatmap = outputs["correlation_heatmap"]
+        self._applied_job_id = job_id
 
     @rx.event
     def proceed_to_pca(self):
         self.current_stage = "PCA"
         return rx.redirect("/pca_analysis")
 
+
+class PCAState(State):
+    """PCA results and variance plots."""
+
+    _pca_results: dict | None = None
+    _applied_job_id: str = ""
+    optimal_n_components: int = 0
+    scree_plot: go.Figure = go.Figure()
+    cumulative_variance_plot: go.Figure = go.Figure()
+
+    @rx.var(cache=True, deps=["_pca_results"], auto_deps=False)
+    def has_pca_results(self) -> bool:
+        return self._pca_results is not None
+
     @rx.event(background=True)
     async def run_pca(self):
-        from app.utils.pca_utils import perform_pca
-
         async with self:
-            if self.cleaned_data is None:
+            if self._stage_job_id("cleaning") is None:
                 yield rx.toast.error("No cleaned data to perform PCA.")
                 return
             self.is_processing = True
-            cleaned_data_copy = self.cleaned_data.copy()
+            inputs, params = _stage_job_spec("pca", self._job_ids())
+            run_id = self._run_id
+            owner = self.router.session.client_token
         try:
-            pca_results = perform_pca(cleaned_data_copy)
+            with pipeline_run(run_id), span("run_pca") as record:
+                job_id = await _submit_job("pca", inputs, params, owner, run_id)
+                async with self:
+                    self._remember_job("pca", job_id)
+                outputs = await self._await_job(job_id)
+                record["rows_out"] = len(outputs["transformed_data"])
             async with self:
-                self.pca_results = pca_results
-                self.scree_plot = pca_results["scree_plot"]
-                self.cumulative_variance_plot = pca_results["cumulative_variance_plot"]
+                await self._apply_stage("pca", job_id, outputs)
                 self.current_stage = "PCA"
                 self.is_processing = False
+                _record_delta(record, self)
             yield rx.toast.success("PCA completed successfully!")
         except Exception as e:
             logging.exception(f"PCA error: {e}")
@@ -230,78 +856,287 @@ class State(rx.State):
                 self.is_processing = False
             yield rx.toast.error(f"An error occurred during PCA: {e}")
 
+    def _apply_job(self, job_id: str, outputs: dict):
+        pca_results = outputs["pca_results"]
+        self._pca_results = pca_results
+        self.optimal_n_components = pca_results["optimal_n_components"]
+        self.scree_plot = pca_results["scree_plot"]
+        self.cumulative_variance_plot = pca_results["cumulative_variance_plot"]
+        self._applied_job_id = job_id
+
     @rx.event
     def proceed_to_clustering(self):
         self.current_stage = "Clustering"
         return rx.redirect("/clustering")
 
+
+class ClusteringState(State):
+    """Clustering configuration and results."""
+
+    clustering_algorithm: str = "kmeans"
+    n_clusters: int = 4
+    _clustering_results: dict | None = None
+    _applied_job_id: str = ""
+    cluster_scatter_fig: go.Figure = go.Figure()
+    dendrogram_fig: go.Figure = go.Figure()
+    clustering_plan: PlanReport | None = None
+    noise_share: str = ""
+    comparison: ComparisonReport | None = None
+    is_comparing: bool = False
+    stability: StabilityReport | None = None
+    stability_fig: go.Figure = go.Figure()
+    is_checking_stability: bool = False
+
+    @rx.var(cache=True, deps=["_clustering_results"], auto_deps=False)
+    def has_clustering_results(self) -> bool:
+        return self._clustering_results is not None
+
+    @rx.var(cache=True, deps=["dendrogram_fig"], auto_deps=False)
+    def has_dendrogram_data(self) -> bool:
+        return self.dendrogram_fig is not None and len(self.dendrogram_fig.data) > 0
+
     @rx.event
     def set_clustering_algorithm(self, algorithm: str):
+        if algorithm == self.clustering_algorithm:
+            return
         self.clustering_algorithm = algorithm
+        if self._clustering_results is not None:
+            return ClusteringState.recompute_clustering
 
     @rx.event
-    def set_n_clusters(self, n: int):
-        self.n_clusters = int(n)
+    def set_n_clusters(self, n: str):
+        try:
+            n_clusters = int(n)
+        except ValueError:
+            # Half-typed input such as an empty field.
+            return
+        if n_clusters == self.n_clusters or not 2 <= n_clusters <= 10:
+            return
+        self.n_clusters = n_clusters
+        if self._clustering_results is not None:
+            return ClusteringState.recompute_clustering
 
     @rx.event(background=True)
-    async def run_clustering(self):
-        from app.utils.clustering_utils import (
-            perform_kmeans,
-            perform_hierarchical,
-            create_cluster_scatter,
-        )
+    async def recompute_clustering(self):
+        """Re-runs clustering once the parameters have stopped changing."""
+        async with self:
+            generation = await self._supersede("clustering")
+        await asyncio.sleep(RECOMPUTE_DEBOUNCE_SECONDS)
+        async with self:
+            if self._run_generation != generation:
+                return
+        yield ClusteringState.run_clustering
 
+    @rx.event(background=True)
+    async def run_clustering(self):
         async with self:
-            if self.pca_results is None or "transformed_data" not in self.pca_results:
+            if self._stage_job_id("pca") is None:
                 yield rx.toast.error("PCA data not found. Please run PCA first.")
                 return
+            if await self._use_draft():
+                yield State.run_draft_pipeline("clustering")
+                return
             self.is_processing = True
-            pca_data = self.pca_results["transformed_data"]
-            algo = self.clustering_algorithm
-            n_clusters = self.n_clusters
+            generation = await self._supersede("clustering")
+            inputs, params = _stage_job_spec(
+                "clustering", self._job_ids(), self.clustering_algorithm, self.n_clusters
+            )
+            run_id = self._run_id
+            owner = self.router.session.client_token
         try:
-            if algo == "kmeans":
-                results = perform_kmeans(pca_data, n_clusters)
-            else:
-                results = perform_hierarchical(pca_data, n_clusters)
-            scatter_fig = create_cluster_scatter(pca_data, results["labels"])
+            with pipeline_run(run_id), span("run_clustering") as record:
+                job_id = await _submit_job("clustering", inputs, params, owner, run_id)
+                async with self:
+                    if self._run_generation != generation:
+                        return
+                    self._remember_job("clustering", job_id)
+                outputs = await self._await_job(job_id)
+                record["rows_out"] = len(outputs["labels"])
             async with self:
-                self.clustering_results = results
-                self.cluster_scatter_fig = scatter_fig
-                if algo == "hierarchical":
-                    self.dendrogram_fig = results["dendrogram_fig"]
-                else:
-                    self.dendrogram_fig = go.Figure()
+                if self._run_generation != generation:
+                    return
+                await self._apply_stage("clustering", job_id, outputs)
                 self.current_stage = "Clustering"
                 self.is_processing = False
+                _record_delta(record, self)
             yield rx.toast.success("Clustering complete!")
         except Exception as e:
-            logging.exception(f"Clustering error: {e}")
             async with self:
+                if self._run_generation != generation:
+                    return
                 self.is_processing = False
+            logging.exception(f"Clustering error: {e}")
             yield rx.toast.error(f"Clustering failed: {e}")
 
+    @rx.event(background=True)
+    async def compare_algorithms(self):
+        """Runs every algorithm on the same PCA data at once and compares them.
+
+        Each algorithm is an ordinary clustering job, so the queue runs them
+        side by side and choosing one afterwards reuses its finished job.
+        """
+        async with self:
+            job_ids = self._job_ids()
+            if "pca" not in job_ids:
+                yield rx.toast.error("PCA data not found. Please run PCA first.")
+                return
+            self.is_comparing = True
+            n_clusters = self.n_clusters
+            specs = {
+                algorithm: _stage_job_spec("clustering", job_ids, algorithm, n_clusters)
+                for algorithm in COMPARED_ALGORITHMS
+            }
+            run_id = self._run_id
+            owner = self.router.session.client_token
+        try:
+            with pipeline_run(run_id), span("compare_algorithms") as record:
+                compared_ids = [
+                    await _submit_job("clustering", inputs, params, owner, run_id)
+                    for inputs, params in specs.values()
+                ]
+                outputs = await asyncio.gather(
+                    *(self._await_job(job_id) for job_id in compared_ids)
+                )
+                comparison = await asyncio.to_thread(
+                    clustering_utils.compare_algorithms, dict(zip(specs, outputs))
+                )
+                record["rows_out"] = len(outputs[0]["labels"])
+            async with self:
+                self.comparison = _comparison_report(comparison, n_clusters)
+                self.is_comparing = False
+                _record_delta(record, self)
+            recommended = clustering_utils.ALGORITHM_NAMES[comparison["recommendation"]]
+            yield rx.toast.success(f"Comparison complete: {recommended} recommended.")
+        except Exception as e:
+            logging.exception(f"Algorithm comparison error: {e}")
+            async with self:
+                self.is_comparing = False
+            yield rx.toast.error(f"Comparison failed: {e}")
+
+    @rx.event(background=True)
+    async def check_stability(self):
+        """Refits the current clustering on subsamples to rate each segment.
+
+        The report belongs to the clustering job it measured and is dropped
+        if another clustering is applied before it finishes.
+        """
+        async with self:
+            job_ids = self._job_ids()
+            if "clustering" not in job_ids or self._clustering_results is None:
+                yield rx.toast.error("Run clustering first.")
+                return
+            self.is_checking_stability = True
+            generation = self._run_generation
+            measured_job_id = job_ids["clustering"]
+            inputs = {
+                "transformed_data": OutputRef(job_ids["pca"], "transformed_data"),
+                "labels": OutputRef(measured_job_id, "labels"),
+            }
+            params = {
+                "algorithm": self.clustering_algorithm,
+                "n_clusters": self.n_clusters,
+                "n_bootstraps": STABILITY_BOOTSTRAPS,
+            }
+            run_id = self._run_id
+            owner = self.router.session.client_token
+        try:
+            with pipeline_run(run_id), span("check_stability") as record:
+                job_id = await _submit_job("stability", inputs, params, owner, run_id)
+                async with self:
+                    self._stability_job_id = job_id
+                outputs = await self._await_job(job_id)
+                record["rows_out"] = len(outputs["row_consensus"])
+            async with self:
+                self.is_checking_stability = False
+                if self._stability_job_id == job_id:
+                    self._stability_job_id = ""
+                if self._applied_job_id != measured_job_id:
+                    return
+                self.stability = _stability_report(outputs)
+                self.stability_fig = outputs["co_assignment_fig"]
+                _record_delta(record, self)
+            yield rx.toast.success("Stability check complete!")
+        except Exception as e:
+            async with self:
+                self.is_checking_stability = False
+                if self._run_generation != generation:
+                    # Superseded by a new run, which cancelled this job.
+                    return
+            logging.exception(f"Stability check error: {e}")
+            yield rx.toast.error(f"Stability check failed: {e}")
+
+    @rx.event
+    def use_algorithm(self, algorithm: str):
+        """Switches to a compared algorithm; its finished job is reused."""
+        self.clustering_algorithm = algorithm
+        if self.comparison is not None:
+            self.n_clusters = self.comparison["n_clusters"]
+        return ClusteringState.run_clustering
+
+    def _apply_job(self, job_id: str, outputs: dict):
+        results = outputs["results"]
+        self.clustering_algorithm = outputs["algorithm"]
+        self.n_clusters = outputs["n_clusters"]
+        self._clustering_results = results
+        self.cluster_scatter_fig = outputs["scatter_fig"]
+        # Ward has a dendrogram, HDBSCAN a condensed tree, KMeans neither.
+        self.dendrogram_fig = results.get(
+            "dendrogram_fig", results.get("condensed_tree_fig", go.Figure())
+        )
+        self.noise_share = (
+            f"{results['noise_fraction']:.1%}" if "noise_fraction" in results else ""
+        )
+        self.clustering_plan = outputs.get("plan")
+        if job_id != self._applied_job_id:
+            self.stability = None
+            self.stability_fig = go.Figure()
+        self._applied_job_id = job_id
+
     @rx.event
     def proceed_to_profiles(self):
         self.current_stage = "Insights"
         return rx.redirect("/profiles")
 
+
+class InsightsState(State):
+    """Cluster profiles, AI insights and exports."""
+
+    cluster_profiles: dict[str, ProfileData | dict] = {}
+    ai_insights: AIInsights = {"marketing_recommendations": "", "personas": []}
+    is_generating_insights: bool = False
+    is_writing_back: bool = False
+    writeback_summary: str = ""
+    _applied_job_id: str = ""
+
+    @rx.var(cache=True, deps=["cluster_profiles"], auto_deps=False)
+    def filtered_cluster_keys(self) -> list[str]:
+        return [
+            k
+            for k in self.cluster_profiles.keys()
+            if k not in ["summary_df", "feature_names"]
+        ]
+
     @rx.event(background=True)
     async def generate_cluster_profiles(self):
-        from app.utils.clustering_utils import compute_cluster_profiles
-
         async with self:
-            if self.cleaned_data is None or self.clustering_results is None:
+            job_ids = self._job_ids()
+            if "cleaning" not in job_ids or "clustering" not in job_ids:
                 yield rx.toast.error("Missing data for profile generation.")
                 return
             self.is_processing = True
-            cleaned_df = self.cleaned_data.copy()
-            labels = self.clustering_results["labels"]
+            inputs, params = _stage_job_spec("profiles", job_ids)
+            run_id = self._run_id
+            owner = self.router.session.client_token
         try:
-            profiles = compute_cluster_profiles(cleaned_df, labels)
+            with pipeline_run(run_id), span("generate_cluster_profiles") as record:
+                job_id = await _submit_job("profiles", inputs, params, owner, run_id)
+                async with self:
+                    self._remember_job("profiles", job_id)
+                outputs = await self._await_job(job_id)
             async with self:
-                self.cluster_profiles = profiles
+                await self._apply_stage("profiles", job_id, outputs)
                 self.is_processing = False
+                _record_delta(record, self)
             yield rx.toast.success("Cluster profiles generated!")
         except Exception as e:
             logging.exception(f"Profile generation error: {e}")
@@ -309,15 +1144,19 @@ class State(rx.State):
                 self.is_processing = False
             yield rx.toast.error(f"Profile generation failed: {e}")
 
+    def _apply_job(self, job_id: str, outputs: dict):
+        self.cluster_profiles = outputs["profiles"]
+        if job_id != self._applied_job_id:
+            self.writeback_summary = ""
+        self._applied_job_id = job_id
+
     @rx.event
     def proceed_to_insights(self):
         return rx.redirect("/insights")
 
     @rx.event(background=True)
     async def generate_ai_insights(self):
-        from app.utils.google_ai_utils import generate_cluster_insights, check_api_key
-
-        if not check_api_key():
+        if not google_ai_utils.check_api_key():
             yield rx.toast.error("GOOGLE_API_KEY not set. Cannot generate insights.")
             return
         async with self:
@@ -328,11 +1167,16 @@ class State(rx.State):
                 self.is_generating_insights = False
                 return
             profiles_data = self.cluster_profiles
+            run_id = self._run_id
         try:
-            insights = await asyncio.to_thread(generate_cluster_insights, profiles_data)
+            with pipeline_run(run_id), span("generate_ai_insights") as record:
+                insights = await asyncio.to_thread(
+                    google_ai_utils.generate_cluster_insights, profiles_data
+                )
             async with self:
                 self.ai_insights = insights
                 self.is_generating_insights = False
+                _record_delta(record, self)
             yield rx.toast.success("AI insights generated!")
         except Exception as e:
             logging.exception(f"AI insight generation error: {e}")
@@ -342,15 +1186,79 @@ class State(rx.State):
             yield rx.toast.error(f"AI insight generation failed: {e}")
 
     @rx.event
-    def export_clustered_data(self) -> rx.event.EventSpec:
-        if self.cleaned_data is None or self.clustering_results is None:
+    def export_clustered_data(self, cluster_id: str = "") -> rx.event.EventSpec:
+        """Downloads the clustered data, or one cluster's rows, from /export.
+
+        The file is built from the jobs' stored outputs, so this process never
+        loads or copies the data.
+        """
+        job_ids = self._job_ids()
+        if "cleaning" not in job_ids or "clustering" not in job_ids:
             return rx.toast.error("No data to export.")
-        df = self.cleaned_data.copy()
-        df["cluster"] = self.clustering_results["labels"]
-        buffer = io.BytesIO()
-        df.to_csv(buffer, index=False)
-        buffer.seek(0)
-        return rx.download(data=buffer.read(), filename="clustered_customer_data.csv")
+        if "clustering" in self.draft_stages:
+            return rx.toast.info("Exports are ready once results on all rows are in.")
+        url = (
+            f"{rx.config.get_config().api_url}/export/"
+            f"{job_ids['cleaning']}/{job_ids['clustering']}"
+        )
+        if cluster_id:
+            url += f"?clusters={cluster_id}"
+        # The API is served by the backend, which rx.download cannot address.
+        return rx.redirect(url, is_external=True)
+
+    @rx.event(background=True)
+    async def write_back_segments(self):
+        """Loads every customer's segment into the write-back database.
+
+        The clustering job's id is the run id, so writing the same run again
+        replaces its rows instead of adding a second copy.
+        """
+        async with self:
+            job_ids = self._job_ids()
+            if "clustering" not in job_ids:
+                yield rx.toast.error("No segments to write back.")
+                return
+            if "clustering" in self.draft_stages:
+                yield rx.toast.info(
+                    "Write-back is ready once results on all rows are in."
+                )
+                return
+            self.is_writing_back = True
+            inputs = {
+                "raw_data": OutputRef(job_ids["ingest"], "raw_data"),
+                "schema": OutputRef(job_ids["ingest"], "schema"),
+                "cleaned_data": OutputRef(job_ids["cleaning"], "cleaned_data"),
+                "transformed_data": OutputRef(job_ids["pca"], "transformed_data"),
+                "labels": OutputRef(job_ids["clustering"], "labels"),
+                "results": OutputRef(job_ids["clustering"], "results"),
+            }
+            params = {
+                "run_id": job_ids["clustering"],
+                "table": WRITEBACK_TABLE,
+                "target": writeback.display_url(),
+            }
+            run_id = self._run_id
+            owner = self.router.session.client_token
+        try:
+            with pipeline_run(run_id), span("write_back_segments") as record:
+                job_id = await _submit_job("writeback", inputs, params, owner, run_id)
+                outputs = await self._await_job(job_id)
+                record["rows_out"] = outputs["rows"]
+            async with self:
+                self.is_writing_back = False
+                self.writeback_summary = (
+                    f"Wrote {outputs['rows']:,} customers of run "
+                    f"{outputs['run_id'][:8]} to {outputs['table']} "
+                    f"in {outputs['seconds']:.1f} s "
+                    f"({outputs['rows_per_second']:,.0f} rows/s)."
+                )
+                _record_delta(record, self)
+            yield rx.toast.success("Segments written back!")
+        except Exception as e:
+            logging.exception(f"Write-back error: {e}")
+            async with self:
+                self.is_writing_back = False
+            yield rx.toast.error(f"Write-back failed: {e}")
 
     @rx.event
     def export_cluster_profiles(self) -> rx.event.EventSpec:
@@ -360,4 +1268,138 @@ class State(rx.State):
         buffer = io.BytesIO()
         summary_df.to_csv(buffer, index=True)
         buffer.seek(0)
-        return rx.download(data=buffer.read(), filename="cluster_profiles_summary.csv")
\ No newline at end of file
+        return rx.download(data=buffer.read(), filename="cluster_profiles_summary.csv")
+
+
+class SimilarityState(State):
+    """Similar-customer lookups over the clustered PCA projection."""
+
+    lookup_row: str = ""
+    lookup: SimilarityLookup | None = None
+    similar_customers: list[SimilarCustomer] = []
+    is_searching: bool = False
+    _index_job_id: str = ""
+
+    @rx.event
+    def set_lookup_row(self, row: str):
+        self.lookup_row = row
+
+    @rx.event(background=True)
+    async def find_similar_customers(self):
+        """Shows a customer's closest peers and nearest segment boundary.
+
+        The index is built by a job on first use and reused by every later
+        lookup on the same clustering, here and through /similar.
+        """
+        async with self:
+            job_ids = self._job_ids()
+            if not {"cleaning", "pca", "clustering"} <= job_ids.keys():
+                yield rx.toast.error("Run clustering first.")
+                return
+            try:
+                row = int(self.lookup_row)
+            except ValueError:
+                yield rx.toast.error("Enter a row number.")
+                return
+            self.is_searching = True
+            inputs = {
+                "transformed_data": OutputRef(job_ids["pca"], "transformed_data"),
+                "labels": OutputRef(job_ids["clustering"], "labels"),
+                "cleaned_data": OutputRef(job_ids["cleaning"], "cleaned_data"),
+            }
+            index_job_id = self._index_job_id
+            run_id = self._run_id
+            owner = self.router.session.client_token
+        try:
+            with pipeline_run(run_id), span("find_similar_customers"):
+                job_id = await _submit_job(
+                    "similarity_index", inputs, {}, owner, run_id
+                )
+                if job_id != index_job_id:
+                    await self._await_job(job_id)
+                index = await asyncio.to_thread(
+                    similarity.load_similarity_index, job_id
+                )
+                found = index.similar(row)
+            async with self:
+                self._index_job_id = job_id
+                boundary = found["boundary"]
+                self.lookup = {
+                    "row": row,
+                    "segment": _segment_name(found["segment"]),
+                    "boundary_segment": (
+                        _segment_name(boundary["segment"]) if boundary else ""
+                    ),
+                    "boundary_distance": (
+                        f"{boundary['distance']:.2f}" if boundary else ""
+                    ),
+                    "milliseconds": f"{found['milliseconds']:.1f} ms",
+                    "api_path": f"/similar/{job_id}/{row}",
+                }
+                self.similar_customers = [
+                    {
+                        "row": n["row"],
+                        "segment": _segment_name(n["segment"]),
+                        "distance": f"{n['distance']:.2f}",
+                    }
+                    for n in found["neighbours"]
+                ]
+                self.is_searching = False
+        except KeyError:
+            async with self:
+                self.is_searching = False
+            yield rx.toast.error(f"Row {row} is not in the clustered data.")
+        except Exception as e:
+            logging.exception(f"Similar customer lookup error: {e}")
+            async with self:
+                self.is_searching = False
+            yield rx.toast.error(f"Lookup failed: {e}")
+
+
+class PerformanceState(State):
+    """Timing breakdown of the session's last pipeline run."""
+
+    stage_timings: list[StageTiming] = []
+    timing_chart: go.Figure = go.Figure()
+    dominant_stage: str = ""
+
+    @rx.event
+    def refresh_performance(self):
+        records = sorted(metrics.run_records(self._run_id), key=lambda r: r["started"])
+        top_level = [r for r in records if r["depth"] == 0] or records
+        total = sum(r["seconds"] for r in top_level) or 1.0
+
+        def fmt(value, spec=""):
+            return "-" if value is None else format(value, spec)
+
+        self.stage_timings = [
+            {
+                "stage": r["stage"],
+                "nested": r["depth"] > 0,
+                "seconds": fmt(r["seconds"], ".3f"),
+                "cpu_seconds": fmt(r["cpu_seconds"], ".3f"),
+                "share": f"{r['seconds'] / total * 100:.1f}%" if r["depth"] == 0 else "",
+                "peak_rss_mb": fmt(r["peak_rss_mb"], ".1f"),
+                "rows_in": fmt(r["rows_in"], ","),
+                "rows_out": fmt(r["rows_out"], ","),
+                "delta_kb": fmt(
+                    r["delta_bytes"] / 1024 if r.get("delta_bytes") else None, ".1f"
+                ),
+            }
+            for r in records
+        ]
+        self.dominant_stage = (
+            max(top_level, key=lambda r: r["seconds"])["stage"] if top_level else ""
+        )
+        self.timing_chart = create_timing_chart(
+            [r["stage"] for r in top_level], [r["seconds"] for r in top_level]
+        )
+
+
+_STAGE_STATES = {
+    "ingest": UploadState,
+    "cleaning": CleaningState,
+    "pca": PCAState,
+    "clustering": ClusteringState,
+    "profiles": InsightsState,
+}
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.settings import (
+    ANALYTICS_ENGINE,
+    ANALYTICS_MEMORY_MB,
+    ANALYTICS_TEMP_DIR,
+    ANALYTICS_THREADS,
+)
+from app.utils.instrumentation import instrumented
+from app.utils.lazy_imports import lazy_module
+from app.utils.memory_utils import sparse_columns
+
+clustering_utils = lazy_module("app.utils.clustering_utils")
+
+# Parquet is written this many cells at a time; one-hot columns are stored
+# as dense 0/1 columns, densified one batch at a time.
+PARQUET_BATCH_CELLS = 20_000_000
+# Schema metadata naming the columns that were sparse one-hot in pandas.
+SPARSE_METADATA_KEY = b"segmentation.sparse_columns"
+
+
+def duckdb_enabled() -> bool:
+    """Whether analytics run in DuckDB rather than pandas, as configured."""
+    return ANALYTICS_ENGINE == "duckdb"
+
+
+def write_parquet(value, path: str, name: str = "value"):
+    """Writes a DataFrame, or a 1-D array as a column called name, to Parquet.
+
+    One-hot columns are densified a batch of rows at a time and listed in the
+    schema metadata, so they can still be told apart when read back.
+    """
+    if isinstance(value, np.ndarray):
+        value = pd.DataFrame({name: value})
+    value = value.rename(columns=str)
+    one_hot = sparse_columns(value)
+    rows = max(1, PARQUET_BATCH_CELLS // max(1, len(value.columns)))
+    tmp_path = f"{path}.tmp"
+    writer = None
+    try:
+        for start in range(0, max(len(value), 1), rows):
+            batch = value.iloc[start : start + rows]
+            if one_hot:
+                batch = batch.astype({c: batch[c].dtype.subtype for c in one_hot})
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if writer is None:
+                metadata = dict(table.schema.metadata or {})
+                metadata[SPARSE_METADATA_KEY] = json.dumps(one_hot).encode()
+                schema = table.schema.with_metadata(metadata)
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+
+
+def connect():
+    """A DuckDB connection with the configured memory limit, threads and spill path."""
+    import duckdb
+
+    os.makedirs(ANALYTICS_TEMP_DIR, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = '{ANALYTICS_MEMORY_MB}MB'")
+    con.execute(f"SET temp_directory = '{ANALYTICS_TEMP_DIR}'")
+    if ANALYTICS_THREADS:
+        con.execute(f"SET threads = {ANALYTICS_THREADS}")
+    return con
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(path: str) -> str:
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _numeric_columns(path: str) -> tuple[list[str], list[str]]:
+    """Numeric columns of a Parquet file, and those among them that are one-hot."""
+    schema = pq.read_schema(path)
+    numeric = [
+        field.name
+        for field in schema
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+    ]
+    one_hot = json.loads((schema.metadata or {}).get(SPARSE_METADATA_KEY, b"[]"))
+    return numeric, [c for c in one_hot if c in numeric]
+
+
+def _clustered(data_path: str, labels_path: str) -> str:
+    """FROM clause pairing each data row with its cluster label, in file order."""
+    return (
+        f"read_parquet({_literal(data_path)}) d "
+        f"POSITIONAL JOIN read_parquet({_literal(labels_path)}) l"
+    )
+
+
+@instrumented
+def cluster_profiles(data_path: str, labels_path: str) -> dict:
+    """compute_cluster_profiles as SQL over the Parquet cleaned data and labels.
+
+    Means are grouped aggregates streamed through the files, so the data is
+    never loaded whole. Quartiles are exact while the columns they need fit
+    in half the memory limit, and t-digest approximations beyond that.
+    """
+    start = time.perf_counter()
+    numeric, one_hot = _numeric_columns(data_path)
+    quartile_cols = [c for c in numeric if c not in one_hot]
+    quartiles = ", ".join(str(q) for q in clustering_utils.QUARTILES)
+    cells = pq.read_metadata(data_path).num_rows * len(quartile_cols)
+    exact = cells * 8 <= ANALYTICS_MEMORY_MB * 1024**2 // 2
+    quantile = "quantile_cont" if exact else "approx_quantile"
+    selects = [f"avg(d.{_quote(c)})" for c in numeric]
+    selects += [f"{quantile}(d.{_quote(c)}, [{quartiles}])" for c in quartile_cols]
+    con = connect()
+    try:
+        rows = con.execute(
+            f"SELECT l.labels, count(*), {', '.join(selects)} "
+            f"FROM {_clustered(data_path, labels_path)} GROUP BY 1 ORDER BY 1"
+        ).fetchall()
+        overall = con.execute(
+            f"SELECT {', '.join(f'avg({_quote(c)})' for c in numeric)} "
+            f"FROM read_parquet({_literal(data_path)})"
+        ).fetchone()
+    finally:
+        con.close()
+    total = sum(row[1] for row in rows)
+    global_means = pd.Series(overall, index=numeric, dtype=np.float64)
+    distinguishing = clustering_utils.identify_distinguishing_features
+    profiles = {}
+    for label, size, *values in rows:
+        means = pd.Series(values[: len(numeric)], index=numeric, dtype=np.float64)
+        profiles[str(label)] = {
+            "size": int(size),
+            "percentage": f"{size / total * 100:.2f}%",
+            "feature_means": means.to_dict(),
+            "feature_quartiles": {
+                c: [round(v, 4) for v in q]
+                for c, q in zip(quartile_cols, values[len(numeric) :])
+            },
+            "distinguishing_features": distinguishing(means, global_means),
+        }
+    summary_df = pd.DataFrame({i: p["feature_means"] for i, p in profiles.items()})
+    summary_df.loc["size"] = {i: p["size"] for i, p in profiles.items()}
+    profiles["summary_df"] = summary_df.to_dict()
+    profiles["feature_names"] = numeric
+    logging.info(
+        f"Profiled {len(rows)} clusters of {total:,} rows in DuckDB in "
+        f"{time.perf_counter() - start:.2f} s"
+    )
+    return profiles
+
+
+def export_path(data_path: str, labels_path: str, clusters: list[int] | None) -> str:
+    """Where the CSV export is kept: next to the labels, so it expires with them."""
+    key = json.dumps([data_path, sorted(clusters or [])])
+    digest = hashlib.sha256(key.encode()).hexdigest()[:24]
+    return os.path.join(os.path.dirname(labels_path), "exports", f"{digest}.csv")
+
+
+@instrumented
+def export_clustered_csv(
+    data_path: str, labels_path: str, clusters: list[int] | None = None
+) -> str:
+    """Writes the data with a cluster column to CSV, optionally only some clusters.
+
+    With DuckDB the rows stream from Parquet straight into the file;
+    otherwise they are loaded with pandas. Returns the file's path; an
+    earlier export of the same data and clusters is reused.
+    """
+    path = export_path(data_path, labels_path, clusters)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if duckdb_enabled():
+        where = ""
+        if clusters:
+            where = f"WHERE l.labels IN ({', '.join(str(int(c)) for c in clusters)})"
+        con = connect()
+        try:
+            con.execute(
+                f"COPY (SELECT d.*, l.labels AS cluster "
+                f"FROM {_clustered(data_path, labels_path)} {where}) "
+                f"TO {_literal(tmp_path)} (HEADER, DELIMITER ',')"
+            )
+        finally:
+            con.close()
+    else:
+        df = pd.read_parquet(data_path)
+        df["cluster"] = pd.read_parquet(labels_path)["labels"].to_numpy()
+        if clusters:
+            df = df[df["cluster"].isin(clusters)]
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,215 @@
+import csv
+import json
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from app.settings import COMPACT_MEMORY, ENCODING
+from app.utils.ingest_utils import WORKER_OVERHEAD_BYTES, read_xlsx
+from app.utils.instrumentation import PeakRSS
+from app.utils.memory_utils import memory_budget_bytes
+from app.utils.pipeline import (
+    CLUSTERING_ALGORITHMS,
+    run_cleaning,
+    run_clustering,
+    run_pca,
+    run_profiles,
+)
+from app.utils.schema_utils import profile_schema, recommended_actions
+from app.utils.transaction_utils import aggregate_transactions
+from app.utils.writeback import segment_assignments
+
+# Settings a batch config file may give, and their defaults. columns overrides
+# the schema profiler's recommended action for the columns it names.
+DEFAULT_CONFIG = {
+    "algorithm": "kmeans",
+    "n_clusters": 4,
+    "encoding": ENCODING,
+    "compact": COMPACT_MEMORY,
+    "columns": {},
+    "sheet": None,
+    "transactions": False,
+}
+# One file's run takes up to this many bytes of memory per byte of the file.
+PIPELINE_BYTES_PER_BYTE = 16
+# Batch workers may use this share of the memory budget.
+MEMORY_SHARE = 0.5
+STAGES = ["read", "schema", "cleaning", "pca", "clustering", "profiles", "write"]
+REPORT_FILE = "timing_report.csv"
+
+
+def load_config(path: str | None = None) -> dict:
+    """DEFAULT_CONFIG updated from a JSON file; ValueError on unknown settings."""
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        unknown = sorted(set(overrides) - set(DEFAULT_CONFIG))
+        if unknown:
+            raise ValueError(f"Unknown settings in {path}: {', '.join(unknown)}")
+        config.update(overrides)
+    if config["algorithm"] not in CLUSTERING_ALGORITHMS:
+        raise ValueError(
+            f"Unknown algorithm {config['algorithm']!r}; choose from "
+            f"{', '.join(CLUSTERING_ALGORITHMS)}"
+        )
+    return config
+
+
+def batch_workers(sizes: list[int], workers: int = 0) -> int:
+    """Worker processes for files of these sizes, as cores and memory allow."""
+    cores = workers or os.cpu_count() or 1
+    per_worker = WORKER_OVERHEAD_BYTES + max(sizes) * PIPELINE_BYTES_PER_BYTE
+    by_memory = int(memory_budget_bytes() * MEMORY_SHARE) // per_worker
+    return max(1, min(len(sizes), cores, by_memory))
+
+
+def read_file(path: str, sheet: str | None = None, transactions: bool = False):
+    """Reads a CSV or XLSX file, or aggregates a transaction file per customer."""
+    name = os.path.basename(path)
+    if transactions:
+        return aggregate_transactions([path], [name], sheet)
+    if name.lower().endswith(".csv"):
+        return pd.read_csv(path)
+    return read_xlsx(path, sheet)
+
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+
+def run_file(path: str, config: dict, output_dir: str) -> dict:
+    """Runs the pipeline on one file, without figures, and writes its results.
+
+    labels.csv holds each customer's cluster and distance to the centroid
+    (see writeback.py), profiles.json the cluster profiles. Returns the
+    file's row of the timing report: seconds per stage and peak RSS growth.
+    """
+    compact = config["compact"]
+    seconds = {}
+
+    def timed(stage: str, fn):
+        start = time.perf_counter()
+        result = fn()
+        seconds[stage] = time.perf_counter() - start
+        return result
+
+    with PeakRSS() as rss:
+        raw = timed(
+            "read", lambda: read_file(path, config["sheet"], config["transactions"])
+        )
+        schema = timed("schema", lambda: profile_schema(raw))
+        cleaning = timed(
+            "cleaning",
+            lambda: run_cleaning(
+                raw,
+                compact,
+                build_figures=False,
+                column_actions={**recommended_actions(schema), **config["columns"]},
+                encoding=config["encoding"],
+            ),
+        )
+        cleaned = cleaning["cleaned_data"]
+        pca = timed("pca", lambda: run_pca(cleaned, compact))
+        clustering = timed(
+            "clustering",
+            lambda: run_clustering(
+                pca["transformed_data"],
+                config["algorithm"],
+                config["n_clusters"],
+                compact,
+                build_figures=False,
+            ),
+        )
+        labels = np.asarray(clustering["labels"])
+        profiles = timed("profiles", lambda: run_profiles(cleaned, labels))
+
+        def write():
+            os.makedirs(output_dir, exist_ok=True)
+            segment_assignments(
+                raw,
+                schema,
+                cleaned.index,
+                pca["transformed_data"],
+                labels,
+                clustering["results"].get("centroids"),
+            ).to_csv(os.path.join(output_dir, "labels.csv"), index=False)
+            with open(os.path.join(output_dir, "profiles.json"), "w") as f:
+                json.dump(profiles["profiles"], f, indent=2, default=_json_value)
+
+        timed("write", write)
+    return {
+        "file": path,
+        "rows": len(raw),
+        "clustered_rows": len(labels),
+        "clusters": len(np.unique(labels[labels >= 0])),
+        "silhouette_score": round(clustering["results"]["silhouette_score"], 4),
+        **{stage: round(seconds[stage], 3) for stage in STAGES},
+        "total_seconds": round(sum(seconds.values()), 3),
+        "peak_rss_mb": round(rss.delta_mb),
+        "error": "",
+    }
+
+
+def _run_file_logged(path: str, config: dict, output_dir: str) -> dict:
+    """run_file that reports a failure instead of stopping the other files."""
+    try:
+        return run_file(path, config, output_dir)
+    except Exception as e:
+        logging.exception(f"Batch run of {path} failed: {e}")
+        return {"file": path, "error": f"{type(e).__name__}: {e}"}
+
+
+def _output_dirs(paths: list[str], output_dir: str) -> list[str]:
+    """One directory per file, named after it; repeated names are numbered."""
+    seen: dict[str, int] = {}
+    dirs = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        name = stem if seen[stem] == 1 else f"{stem}_{seen[stem]}"
+        dirs.append(os.path.join(output_dir, name))
+    return dirs
+
+
+def run_batch(
+    paths: list[str], config: dict, output_dir: str, workers: int = 0
+) -> list[dict]:
+    """Runs the pipeline on each file in parallel worker processes.
+
+    Each file is segmented on its own into output_dir/<file name>/, and
+    output_dir/timing_report.csv gets one row per file. The workers split
+    the cores, so BLAS inside each is limited to its share. A file that
+    fails is reported with its error; the others still run.
+    """
+    start = time.perf_counter()
+    workers = batch_workers([os.path.getsize(p) for p in paths], workers)
+    cores = os.cpu_count() or 1
+    logging.info(f"Running {len(paths)} files on {workers} workers")
+    dirs = _output_dirs(paths, output_dir)
+    if workers == 1:
+        report = [_run_file_logged(p, config, d) for p, d in zip(paths, dirs)]
+    else:
+        with Parallel(
+            n_jobs=workers,
+            backend="loky",
+            inner_max_num_threads=max(1, cores // workers),
+        ) as pool:
+            report = pool(
+                delayed(_run_file_logged)(p, config, d) for p, d in zip(paths, dirs)
+            )
+    os.makedirs(output_dir, exist_ok=True)
+    fields = ["file", "rows", "clustered_rows", "clusters", "silhouette_score"]
+    fields += STAGES + ["total_seconds", "peak_rss_mb", "error"]
+    with open(os.path.join(output_dir, REPORT_FILE), "w", newline="") as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        writer.writerows(report)
+    failed = sum(1 for row in report if row["error"])
+    logging.info(
+        f"Batch of {len(paths)} files took {time.perf_counter() - start:.2f} s "
+        f"on {workers} workers, {failed} failed"
+    )
+    return report
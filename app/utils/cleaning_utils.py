@@ -3,11 +3,20 @@ import numpy as np
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 import plotly.express as px
 import logging
+from app.utils.figure_utils import APP_TEMPLATE
+from app.utils.memory_utils import smallest_int_codes, sparse_columns
+from app.utils.instrumentation import instrumented
 
 
-def clean_data(df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+@instrumented
+def clean_data(
+    df: pd.DataFrame, compact: bool = False, encoding: str = "label"
+) -> tuple[pd.DataFrame, int]:
     """
     Cleans the dataframe by handling missing values, outliers, and encoding.
+    With compact=True, scaled columns are float32 and encoded columns use the
+    smallest integer dtype. With encoding="onehot", each categorical column
+    becomes sparse 0/1 columns named column=value instead of integer codes.
     """
     if not isinstance(df, pd.DataFrame):
         raise TypeError("Input must be a pandas DataFrame.")
@@ -35,15 +44,32 @@ def clean_data(df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
         ]
     outliers_removed = initial_rows - len(df_cleaned)
     scaler = StandardScaler()
-    df_cleaned[numeric_cols] = scaler.fit_transform(df_cleaned[numeric_cols])
-    categorical_cols = df_cleaned.select_dtypes(include=["object", "category"]).columns
+    scaled = scaler.fit_transform(df_cleaned[numeric_cols])
+    df_cleaned[numeric_cols] = scaled.astype(np.float32) if compact else scaled
+    categorical_cols = df_cleaned.select_dtypes(
+        include=["object", "category", "string"]
+    ).columns
+    if encoding == "onehot" and len(categorical_cols):
+        # Sparse dummies store only the ones: a row costs one value per
+        # categorical column however many categories it has.
+        dummies = pd.get_dummies(
+            df_cleaned[categorical_cols], prefix_sep="=", sparse=True, dtype=np.uint8
+        )
+        df_cleaned = pd.concat(
+            [df_cleaned.drop(columns=categorical_cols), dummies], axis=1
+        )
+        categorical_cols = []
     for col in categorical_cols:
-        le = LabelEncoder()
-        df_cleaned[col] = le.fit_transform(df_cleaned[col])
+        if compact:
+            df_cleaned[col] = smallest_int_codes(df_cleaned[col])
+        else:
+            le = LabelEncoder()
+            df_cleaned[col] = le.fit_transform(df_cleaned[col])
     logging.info("Data cleaning completed successfully.")
     return (df_cleaned, outliers_removed)
 
 
+@instrumented
 def get_statistics(
     df: pd.DataFrame, outliers_removed: int = 0
 ) -> tuple[dict, pd.DataFrame]:
@@ -56,38 +82,45 @@ def get_statistics(
             pd.DataFrame(),
         )
     dtype_counts = df.dtypes.apply(lambda x: x.name).value_counts()
+    # One-hot columns are never missing, and pandas cannot sum their masks
+    # together with dense ones.
+    dense = df.drop(columns=sparse_columns(df))
     stats = {
         "rows": len(df),
         "cols": len(df.columns),
-        "missing_values": int(df.isnull().sum().sum()),
+        "missing_values": int(dense.isnull().sum().sum()),
         "outliers": outliers_removed,
         "dtypes": {k: int(v) for k, v in dtype_counts.items()},
     }
     return (stats, df)
 
 
+@instrumented
 def create_correlation_heatmap(df: pd.DataFrame):
     """
     Creates a correlation heatmap using Plotly.
     """
+    if isinstance(df, pd.DataFrame):
+        # One-hot columns would make the matrix as wide as the categories.
+        df = df.drop(columns=sparse_columns(df))
     if not isinstance(df, pd.DataFrame) or df.select_dtypes(include=np.number).empty:
         return px.imshow(
-            pd.DataFrame(), title="Not enough numeric data for correlation heatmap"
+            pd.DataFrame(),
+            title="Not enough numeric data for correlation heatmap",
+            template=APP_TEMPLATE,
         )
     corr = df.select_dtypes(include=np.number).corr()
     fig = px.imshow(
         corr,
-        text_auto=True,
+        text_auto=".2f",
         aspect="auto",
         color_continuous_scale="RdBu_r",
         zmin=-1,
         zmax=1,
         title="Feature Correlation Heatmap",
+        template=APP_TEMPLATE,
     )
     fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-        paper_bgcolor="rgba(0,0,0,0)",
-        font={"family": "Open Sans", "color": "#4A5568"},
         title_font_size=20,
         margin=dict(l=20, r=20, t=50, b=20),
     )
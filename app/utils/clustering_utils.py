@@ -1,33 +1,115 @@
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans, AgglomerativeClustering
-from sklearn.metrics import silhouette_score, adjusted_rand_score
+from sklearn.cluster import HDBSCAN, AgglomerativeClustering, MiniBatchKMeans
+from sklearn.metrics import (
+    silhouette_score,
+    adjusted_rand_score,
+    pairwise_distances_argmin,
+)
+from sklearn.neighbors import NearestNeighbors
 import plotly.express as px
 import plotly.graph_objects as go
+from scipy import sparse
 from scipy.cluster.hierarchy import dendrogram, linkage
 import logging
+from typing import Callable
+from app.utils.figure_utils import APP_TEMPLATE
+from app.utils.memory_utils import downcast_labels, sparse_columns
+from app.utils.instrumentation import instrumented
+from app.utils.kmeans_engine import not_cancelled, parallel_kmeans
 
+ALGORITHM_NAMES = {
+    "kmeans": "KMeans",
+    "hierarchical": "Hierarchical",
+    "hdbscan": "HDBSCAN",
+}
+# Silhouette scores closer than this count as a tie, broken by run time.
+SILHOUETTE_TIE = 0.02
+# HDBSCAN: a row's density is measured by the distance to this many neighbours.
+HDBSCAN_MIN_SAMPLES = 15
+# Density thins out in many dimensions, so HDBSCAN clusters the leading
+# components that explain this share of the variance, within these bounds.
+HDBSCAN_VARIANCE_SHARE = 0.5
+HDBSCAN_MIN_DIMENSIONS = 2
+HDBSCAN_MAX_DIMENSIONS = 5
+NOISE_LABEL = -1
+# Quartiles profiled per cluster for each feature that is not one-hot.
+QUARTILES = [0.25, 0.5, 0.75]
 
-def perform_kmeans(data: pd.DataFrame, n_clusters: int) -> dict:
-    """Performs KMeans clustering."""
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(data)
-    score = silhouette_score(data, labels)
+
+@instrumented
+def perform_kmeans(
+    data: pd.DataFrame,
+    n_clusters: int,
+    compact: bool = False,
+    minibatch: bool = False,
+    silhouette_sample: int | None = None,
+    build_figures: bool = True,
+    check_cancelled: Callable[[], None] = not_cancelled,
+) -> dict:
+    """
+    Performs KMeans clustering. compact=True clusters float32 data.
+    The ten restarts run in parallel (see app/utils/kmeans_engine.py).
+    minibatch=True fits MiniBatchKMeans; silhouette_sample scores a random subset.
+    KMeans has no figure of its own, so build_figures changes nothing.
+    check_cancelled raises to stop the fit between restarts and steps.
+    """
+    if compact:
+        data = np.asarray(data, dtype=np.float32)
+    if minibatch:
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=42, n_init=3, batch_size=4096
+        )
+        labels = kmeans.fit_predict(data)
+        centroids = kmeans.cluster_centers_
+    else:
+        result = parallel_kmeans(
+            data,
+            n_clusters,
+            n_init=10,
+            random_state=42,
+            check_cancelled=check_cancelled,
+        )
+        labels, centroids = result.labels, result.centroids
+    check_cancelled()
+    score = _silhouette(data, labels, silhouette_sample)
+    if compact:
+        labels = downcast_labels(labels)
     return {
         "labels": labels,
-        "centroids": kmeans.cluster_centers_,
+        "centroids": centroids,
         "silhouette_score": score,
         "cluster_sizes": pd.Series(labels).value_counts().to_dict(),
     }
 
 
-def perform_hierarchical(data: pd.DataFrame, n_clusters: int) -> dict:
-    """Performs Hierarchical clustering."""
-    model = AgglomerativeClustering(n_clusters=n_clusters, linkage="ward")
-    labels = model.fit_predict(data)
-    score = silhouette_score(data, labels)
-    linked = linkage(data, "ward")
-    dendro_fig = create_dendrogram(linked)
+@instrumented
+def perform_hierarchical(
+    data: pd.DataFrame,
+    n_clusters: int,
+    compact: bool = False,
+    sample_size: int | None = None,
+    silhouette_sample: int | None = None,
+    build_figures: bool = True,
+    check_cancelled: Callable[[], None] = not_cancelled,
+) -> dict:
+    """
+    Performs Hierarchical clustering. compact=True stores labels as small ints.
+    With sample_size, Ward runs on a random subset and every row joins the
+    cluster with the nearest centroid; the dendrogram shows the subset.
+    build_figures=False skips the dendrogram and the linkage behind it.
+    check_cancelled raises to stop between the fit, score and dendrogram.
+    """
+    data = np.asarray(data)
+    labels, fit_data = _ward_labels(data, n_clusters, sample_size)
+    check_cancelled()
+    score = _silhouette(data, labels, silhouette_sample)
+    if compact:
+        labels = downcast_labels(labels)
+    dendro_fig = None
+    if build_figures:
+        check_cancelled()
+        dendro_fig = create_dendrogram(linkage(fit_data, "ward"))
     return {
         "labels": labels,
         "dendrogram_fig": dendro_fig,
@@ -36,10 +118,288 @@ def perform_hierarchical(data: pd.DataFrame, n_clusters: int) -> dict:
     }
 
 
+@instrumented
+def perform_hdbscan(
+    data: pd.DataFrame,
+    n_clusters: int,
+    compact: bool = False,
+    sample_size: int | None = None,
+    silhouette_sample: int | None = None,
+    build_figures: bool = True,
+    check_cancelled: Callable[[], None] = not_cancelled,
+) -> dict:
+    """
+    Performs HDBSCAN density clustering; rows in no dense region get label -1.
+    The number of clusters follows from the data: n_clusters only sets the
+    smallest segment reported, a third of an even n_clusters split.
+    Density is measured on the leading PCA components (see
+    density_dimensions). With sample_size HDBSCAN fits a random subset; a
+    KD-tree of the fitted rows, built once, gives their core distances and
+    every other row's nearest fitted neighbour, queried on all cores. A row
+    within that neighbour's core distance takes its label, else it is noise.
+    build_figures=False skips the condensed tree. check_cancelled raises to
+    stop between the fit, score and condensed tree.
+    """
+    data = np.asarray(data)
+    labels, fit_space = _hdbscan_labels(data, n_clusters, sample_size)
+    check_cancelled()
+    clustered = labels != NOISE_LABEL
+    if len(np.unique(labels[clustered])) > 1:
+        score = _silhouette(data[clustered], labels[clustered], silhouette_sample)
+    else:
+        # Silhouette is undefined for fewer than two clusters.
+        score = 0.0
+    if compact:
+        labels = downcast_labels(labels)
+    tree_fig = None
+    if build_figures:
+        check_cancelled()
+        min_cluster_size, min_samples = _hdbscan_sizes(len(fit_space), n_clusters)
+        tree = condense_tree(
+            single_linkage_tree(fit_space, min_samples), min_cluster_size
+        )
+        n_found = len(np.unique(labels[clustered]))
+        if tree["selected"].sum() != n_found:
+            logging.warning(
+                f"Condensed tree selects {tree['selected'].sum()} clusters "
+                f"but HDBSCAN labelled {n_found}"
+            )
+        tree_fig = create_condensed_tree(tree)
+    return {
+        "labels": labels,
+        "condensed_tree_fig": tree_fig,
+        "silhouette_score": score,
+        "noise_fraction": float(1 - clustered.mean()),
+        "cluster_sizes": pd.Series(labels).value_counts().to_dict(),
+    }
+
+
+def _ward_labels(
+    data: np.ndarray, n_clusters: int, sample_size: int | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Ward labels of every row and the rows Ward was fitted on."""
+    fit_data = data
+    if sample_size is not None and sample_size < len(data):
+        rng = np.random.default_rng(42)
+        fit_data = data[rng.choice(len(data), sample_size, replace=False)]
+    model = AgglomerativeClustering(n_clusters=n_clusters, linkage="ward")
+    labels = model.fit_predict(fit_data)
+    if fit_data is not data:
+        centroids = np.vstack(
+            [fit_data[labels == c].mean(axis=0) for c in range(n_clusters)]
+        )
+        labels = pairwise_distances_argmin(data, centroids)
+    return labels, fit_data
+
+
+def _hdbscan_sizes(rows: int, n_clusters: int) -> tuple[int, int]:
+    """HDBSCAN's min_cluster_size and min_samples for a fit on this many rows."""
+    min_cluster_size = max(HDBSCAN_MIN_SAMPLES, rows // (3 * n_clusters))
+    return min_cluster_size, min(HDBSCAN_MIN_SAMPLES, min_cluster_size)
+
+
+def _hdbscan_labels(
+    data: np.ndarray,
+    n_clusters: int,
+    sample_size: int | None = None,
+    n_jobs: int = -1,
+) -> tuple[np.ndarray, np.ndarray]:
+    """HDBSCAN labels of every row and the rows it was fitted on, in density space."""
+    space = data[:, : density_dimensions(data)]
+    fit_space = space
+    if sample_size is not None and sample_size < len(data):
+        rng = np.random.default_rng(42)
+        fit_space = space[rng.choice(len(data), sample_size, replace=False)]
+    min_cluster_size, min_samples = _hdbscan_sizes(len(fit_space), n_clusters)
+    model = HDBSCAN(
+        min_cluster_size=min_cluster_size,
+        min_samples=min_samples,
+        algorithm="kd_tree",
+        n_jobs=n_jobs,
+        copy=True,
+    )
+    fit_labels = model.fit_predict(fit_space)
+    labels = fit_labels
+    if fit_space is not space:
+        index = NearestNeighbors(algorithm="kd_tree", n_jobs=n_jobs).fit(fit_space)
+        # The nearest neighbour of a fitted row is itself, as in HDBSCAN.
+        core_distances = index.kneighbors(fit_space, min_samples)[0][:, -1]
+        distances, nearest = index.kneighbors(space, 1)
+        nearest = nearest[:, 0]
+        labels = np.where(
+            distances[:, 0] <= core_distances[nearest],
+            fit_labels[nearest],
+            NOISE_LABEL,
+        )
+    return labels, fit_space
+
+
+def single_linkage_tree(space: np.ndarray, min_samples: int) -> np.ndarray:
+    """
+    HDBSCAN's single-linkage tree over mutual-reachability distances, in the
+    layout scikit-learn uses (left_node, right_node, value, cluster_size).
+    A KD-tree, built once, gives each row's core distance. Prim's algorithm
+    then grows the exact minimum spanning tree over all pairs, as HDBSCAN
+    does, keeping only each outside row's distance to the tree; merging its
+    edges shortest first gives the tree.
+    """
+    n = len(space)
+    index = NearestNeighbors(algorithm="kd_tree").fit(space)
+    # The nearest neighbour of a row is itself, as in HDBSCAN.
+    core = index.kneighbors(space, min_samples)[0][:, -1]
+    # Rows outside the tree, with their coordinates, core distances and
+    # distance to the tree; the first remaining slots are still outside.
+    outside = np.arange(1, n)
+    points = space[1:].astype(np.float64)
+    point_core = core[1:].copy()
+    reach = np.full(n - 1, np.inf)
+    source = np.zeros(n - 1, dtype=np.intp)
+    mst = np.empty((n - 1, 3))
+    current, current_point, current_core = 0, space[0], core[0]
+    for step in range(n - 1):
+        remaining = n - 1 - step
+        diff = points[:remaining] - current_point
+        distance = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        np.maximum(distance, point_core[:remaining], out=distance)
+        np.maximum(distance, current_core, out=distance)
+        closer = distance < reach[:remaining]
+        reach[:remaining][closer] = distance[closer]
+        source[:remaining][closer] = current
+        nearest = int(np.argmin(reach[:remaining]))
+        current = outside[nearest]
+        current_point, current_core = points[nearest].copy(), point_core[nearest]
+        mst[step] = (source[nearest], current, reach[nearest])
+        # Move the last outside row into the slot of the row that joined.
+        last = remaining - 1
+        for column in (outside, points, point_core, reach, source):
+            column[nearest] = column[last]
+    order = np.argsort(mst[:, 2], kind="stable")
+    edges = zip(
+        mst[order, 0].astype(np.intp), mst[order, 1].astype(np.intp), mst[order, 2]
+    )
+    tree = np.zeros(
+        n - 1,
+        dtype=[
+            ("left_node", np.intp),
+            ("right_node", np.intp),
+            ("value", np.float64),
+            ("cluster_size", np.intp),
+        ],
+    )
+    parent = np.arange(2 * n - 1)
+    size = np.ones(2 * n - 1, dtype=np.intp)
+
+    def find(node: int) -> int:
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for merge, (a, b, value) in enumerate(edges):
+        left, right = find(a), find(b)
+        node = n + merge
+        size[node] = size[left] + size[right]
+        parent[left] = parent[right] = node
+        tree[merge] = (left, right, value, size[node])
+    return tree
+
+
+def fit_labels(
+    data: np.ndarray, algorithm: str, n_clusters: int, n_jobs: int = -1
+) -> np.ndarray:
+    """Cluster labels alone, without silhouette or figures, fitted on every row.
+
+    n_jobs caps the cores one fit uses, so callers running several fits at
+    once can keep them from oversubscribing the host.
+    """
+    data = np.asarray(data)
+    if algorithm == "hierarchical":
+        return _ward_labels(data, n_clusters)[0]
+    if algorithm == "hdbscan":
+        return _hdbscan_labels(data, n_clusters, n_jobs=n_jobs)[0]
+    n_workers = None if n_jobs < 1 else n_jobs
+    return parallel_kmeans(data, n_clusters, n_workers=n_workers).labels
+
+
+def density_dimensions(data: np.ndarray) -> int:
+    """Leading PCA components HDBSCAN uses; columns must be in variance order."""
+    variance = np.asarray(data).var(axis=0)
+    share = np.cumsum(variance) / variance.sum()
+    dimensions = int(np.searchsorted(share, HDBSCAN_VARIANCE_SHARE)) + 1
+    return min(
+        max(dimensions, HDBSCAN_MIN_DIMENSIONS), HDBSCAN_MAX_DIMENSIONS, data.shape[1]
+    )
+
+
+def _silhouette(data, labels: np.ndarray, sample_size: int | None) -> float:
+    if sample_size is not None and sample_size < len(labels):
+        return silhouette_score(data, labels, sample_size=sample_size, random_state=42)
+    return silhouette_score(data, labels)
+
+
+def compare_algorithms(runs: dict[str, dict]) -> dict:
+    """
+    Compares clustering runs of different algorithms on the same data.
+    runs maps each algorithm to its clustering outputs (labels, results,
+    plan and seconds). Returns each run's silhouette and run time, the
+    pairwise Adjusted Rand Index and the recommended algorithm with a reason.
+    """
+    rows = [
+        {
+            "algorithm": algorithm,
+            "name": ALGORITHM_NAMES[algorithm],
+            "silhouette": float(run["results"]["silhouette_score"]),
+            "seconds": run["seconds"],
+            "strategy": run["plan"]["strategy"],
+        }
+        for algorithm, run in runs.items()
+    ]
+    agreement = {
+        (a, b): float(adjusted_rand_score(runs[a]["labels"], runs[b]["labels"]))
+        for i, a in enumerate(runs)
+        for b in list(runs)[i + 1 :]
+    }
+    ranked = sorted(rows, key=lambda r: r["silhouette"], reverse=True)
+    best, runner_up = ranked[0], ranked[1]
+    tied = [r for r in ranked if best["silhouette"] - r["silhouette"] <= SILHOUETTE_TIE]
+    if len(tied) == 1:
+        recommended, other = best, runner_up
+        reason = (
+            f"{best['name']} separates the segments more clearly (silhouette "
+            f"{best['silhouette']:.3f} vs {runner_up['silhouette']:.3f})."
+        )
+    else:
+        recommended = min(tied, key=lambda r: r["seconds"])
+        other = next(r for r in tied if r is not recommended)
+        reason = (
+            f"{recommended['name']} and {other['name']} separate the segments about "
+            f"equally well; {recommended['name']} is faster "
+            f"({recommended['seconds']:.1f} s vs {other['seconds']:.1f} s)."
+        )
+    ari = agreement.get(
+        (recommended["algorithm"], other["algorithm"]),
+        agreement.get((other["algorithm"], recommended["algorithm"])),
+    )
+    if ari >= 0.8:
+        reason += f" Both find largely the same segments (ARI {ari:.2f})."
+    elif ari < 0.5:
+        reason += (
+            f" They group many customers differently (ARI {ari:.2f}), so review "
+            "both sets of profiles before acting on them."
+        )
+    return {
+        "rows": rows,
+        "agreement": agreement,
+        "recommendation": recommended["algorithm"],
+        "reason": reason,
+    }
+
+
+@instrumented
 def create_cluster_scatter(data: pd.DataFrame, labels: np.ndarray) -> go.Figure:
     """Creates a scatter plot of clusters."""
     df = pd.DataFrame(data, columns=[f"PC{i + 1}" for i in range(data.shape[1])])
-    df["cluster"] = labels.astype(str)
+    df["cluster"] = np.where(labels == NOISE_LABEL, "Noise", labels.astype(str))
     fig = px.scatter(
         df,
         x="PC1",
@@ -47,31 +407,55 @@ def create_cluster_scatter(data: pd.DataFrame, labels: np.ndarray) -> go.Figure:
         color="cluster",
         title="Clusters on Principal Components",
         color_discrete_sequence=px.colors.qualitative.Vivid,
+        template=APP_TEMPLATE,
     )
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-        paper_bgcolor="rgba(0,0,0,0)",
-        font={"family": "Open Sans", "color": "#4A5568"},
-        legend_title_text="Cluster",
-    )
+    fig.update_layout(legend_title_text="Cluster")
     return fig
 
 
+@instrumented
+def _cluster_means(
+    df: pd.DataFrame, labels: np.ndarray, numeric_cols: pd.Index
+) -> pd.DataFrame:
+    """Mean of every numeric column per cluster, indexed by sorted label.
+
+    One-hot columns are summed through a sparse cluster-membership matrix
+    rather than sliced cluster by cluster, which pandas does slowly.
+    """
+    one_hot = [c for c in sparse_columns(df) if c in numeric_cols]
+    dense = numeric_cols.difference(one_hot, sort=False)
+    means = df[dense].groupby(labels).mean()
+    if one_hot:
+        clusters, codes = np.unique(labels, return_inverse=True)
+        rows = np.arange(len(codes))
+        membership = sparse.csr_matrix(
+            (np.ones(len(codes)), (codes, rows)), shape=(len(clusters), len(codes))
+        )
+        sums = (membership @ df[one_hot].sparse.to_coo().tocsc()).toarray()
+        shares = sums / np.bincount(codes)[:, None]
+        means = means.join(pd.DataFrame(shares, index=clusters, columns=one_hot))
+    return means[numeric_cols]
+
+
 def compute_cluster_profiles(df: pd.DataFrame, labels: np.ndarray) -> dict:
     """Computes descriptive statistics for each cluster."""
-    df_labeled = df.copy()
-    df_labeled["cluster"] = labels
-    profiles = {}
+    labels = np.asarray(labels)
     numeric_cols = df.select_dtypes(include=np.number).columns
-    global_means = df_labeled[numeric_cols].mean()
-    for i in sorted(df_labeled["cluster"].unique()):
-        cluster_df = df_labeled[df_labeled["cluster"] == i]
+    means = _cluster_means(df, labels, numeric_cols)
+    sizes = pd.Series(labels).value_counts().sort_index()
+    global_means = means.mul(sizes, axis=0).sum() / len(labels)
+    dense = numeric_cols.difference(sparse_columns(df), sort=False)
+    global_means[dense] = df[dense].mean()
+    quartiles = df[dense].groupby(labels).quantile(QUARTILES)
+    profiles = {}
+    for i in sizes.index:
         profile = {
-            "size": len(cluster_df),
-            "percentage": f"{len(cluster_df) / len(df_labeled) * 100:.2f}%",
-            "feature_means": cluster_df[numeric_cols].mean().to_dict(),
+            "size": int(sizes[i]),
+            "percentage": f"{sizes[i] / len(labels) * 100:.2f}%",
+            "feature_means": means.loc[i].to_dict(),
+            "feature_quartiles": quartiles.loc[i].round(4).to_dict("list"),
             "distinguishing_features": identify_distinguishing_features(
-                cluster_df, global_means, numeric_cols
+                means.loc[i], global_means
             ),
         }
         profiles[str(i)] = profile
@@ -83,31 +467,155 @@ def compute_cluster_profiles(df: pd.DataFrame, labels: np.ndarray) -> dict:
 
 
 def identify_distinguishing_features(
-    cluster_df: pd.DataFrame, global_means: pd.Series, numeric_cols: list
+    cluster_means: pd.Series, global_means: pd.Series
 ) -> list:
     """Identifies top 3 features that most distinguish a cluster from the global average."""
-    cluster_means = cluster_df[numeric_cols].mean()
     deviation = ((cluster_means - global_means) / global_means).abs()
     top_features = deviation.nlargest(3).index.tolist()
     return top_features
 
 
+@instrumented
 def create_dendrogram(linked_matrix) -> go.Figure:
     """Creates a dendrogram from a linkage matrix."""
     dendro = dendrogram(linked_matrix, no_plot=True)
     icoord = np.array(dendro["icoord"])
     dcoord = np.array(dendro["dcoord"])
+    # One NaN-separated trace instead of one trace per merge keeps the payload flat.
+    gaps = np.full((len(icoord), 1), np.nan)
     fig = go.Figure()
-    for i in range(len(icoord)):
-        fig.add_trace(
-            go.Scatter(x=dcoord[i], y=icoord[i], mode="lines", line=dict(color="gray"))
+    fig.add_trace(
+        go.Scatter(
+            x=np.hstack([dcoord, gaps]).ravel(),
+            y=np.hstack([icoord, gaps]).ravel(),
+            mode="lines",
+            line=dict(color="gray"),
         )
+    )
     fig.update_layout(
         title_text="Hierarchical Clustering Dendrogram",
-        plot_bgcolor="rgba(0,0,0,0)",
-        paper_bgcolor="rgba(0,0,0,0)",
+        template=APP_TEMPLATE,
         showlegend=False,
         yaxis=dict(title="Distance"),
         xaxis=dict(title="Data Points"),
     )
-    return fig
\ No newline at end of file
+    return fig
+
+
+def condense_tree(single_linkage: np.ndarray, min_cluster_size: int) -> pd.DataFrame:
+    """
+    Condenses an HDBSCAN single-linkage tree into the clusters it considers.
+    Walking down from the root, a split where both sides have at least
+    min_cluster_size rows creates two clusters; smaller sides are rows
+    leaving their cluster. Returns one row per cluster with its parent,
+    size, the lambda (1 / distance) range it lives over, its stability and
+    whether excess-of-mass selection picks it, as HDBSCAN does.
+    """
+    n = len(single_linkage) + 1
+    left = single_linkage["left_node"]
+    right = single_linkage["right_node"]
+    distance = single_linkage["value"]
+    # Duplicate rows merge at distance 0; clamp so lambda stays finite.
+    distance = np.maximum(distance, distance[distance > 0].min(initial=1e-12))
+    size = single_linkage["cluster_size"]
+
+    def node_size(node: int) -> int:
+        return 1 if node < n else int(size[node - n])
+
+    clusters = [{"parent": -1, "size": n, "birth": 0.0, "death": 0.0, "stability": 0.0}]
+    stack = [(2 * n - 2, 0)]
+    while stack:
+        node, cluster = stack.pop()
+        merge = node - n
+        lam = 1 / distance[merge]
+        current = clusters[cluster]
+        current["death"] = max(current["death"], lam)
+        children = [
+            (int(left[merge]), node_size(left[merge])),
+            (int(right[merge]), node_size(right[merge])),
+        ]
+        big = [(child, s) for child, s in children if s >= min_cluster_size]
+        for child, s in children:
+            if s < min_cluster_size or len(big) == 2:
+                current["stability"] += s * (lam - current["birth"])
+        if len(big) == 2:
+            for child, s in big:
+                clusters.append(
+                    {
+                        "parent": cluster,
+                        "size": s,
+                        "birth": lam,
+                        "death": lam,
+                        "stability": 0.0,
+                    }
+                )
+                stack.append((child, len(clusters) - 1))
+        elif big:
+            stack.append((big[0][0], cluster))
+    tree = pd.DataFrame(clusters)
+    children = tree.groupby("parent").groups
+    # Excess of mass: keep a cluster unless its descendants are more stable together.
+    subtree = tree["stability"].to_numpy().copy()
+    selected = np.ones(len(tree), dtype=bool)
+    selected[0] = False
+    for cluster in range(len(tree) - 1, 0, -1):
+        if cluster not in children:
+            continue
+        below = subtree[children[cluster]].sum()
+        if below > subtree[cluster]:
+            subtree[cluster] = below
+            selected[cluster] = False
+            continue
+        descendants = list(children[cluster])
+        while descendants:
+            child = descendants.pop()
+            selected[child] = False
+            descendants.extend(children.get(child, []))
+    tree["selected"] = selected
+    return tree
+
+
+@instrumented
+def create_condensed_tree(tree: pd.DataFrame) -> go.Figure:
+    """Icicle plot of a condensed tree; bar width is the cluster's size at birth."""
+    children = tree.groupby("parent").groups
+    x0 = np.zeros(len(tree))
+    for cluster in children:
+        if cluster < 0:
+            continue
+        # Children share the parent's span, centred, less the rows that left.
+        kept = tree["size"][children[cluster]].sum()
+        offset = x0[cluster] + (tree["size"][cluster] - kept) / 2
+        for child in children[cluster]:
+            x0[child] = offset
+            offset += tree["size"][child]
+    fig = go.Figure()
+    for selected, color, name in [
+        (False, "#94a3b8", "Candidate"),
+        (True, "#0284c7", "Selected cluster"),
+    ]:
+        rows = tree.index[tree["selected"] == selected]
+        xs, ys = [], []
+        for cluster in rows:
+            left, right = x0[cluster], x0[cluster] + tree["size"][cluster]
+            birth, death = tree["birth"][cluster], tree["death"][cluster]
+            xs += [left, right, right, left, left, None]
+            ys += [birth, birth, death, death, birth, None]
+        fig.add_trace(
+            go.Scatter(
+                x=xs,
+                y=ys,
+                fill="toself",
+                mode="lines",
+                line=dict(color=color, width=1),
+                fillcolor=color,
+                name=name,
+            )
+        )
+    fig.update_layout(
+        title_text="HDBSCAN Condensed Tree",
+        template=APP_TEMPLATE,
+        xaxis=dict(title="Customers", showticklabels=False),
+        yaxis=dict(title="λ = 1 / distance", autorange="reversed"),
+    )
+    return fig
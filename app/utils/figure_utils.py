@@ -0,0 +1,114 @@
+import base64
+import numpy as np
+import plotly.graph_objects as go
+
+APP_LAYOUT = go.Layout(
+    plot_bgcolor="rgba(0,0,0,0)",
+    paper_bgcolor="rgba(0,0,0,0)",
+    font={"family": "Open Sans", "color": "#4A5568"},
+)
+# Built once and shared by every figure. It replaces plotly's default
+# template, which otherwise adds several KB to each serialized figure.
+APP_TEMPLATE = go.layout.Template(layout=APP_LAYOUT)
+
+# Arrays shorter than this stay as plain JSON lists.
+MIN_TYPED_ARRAY_LENGTH = 8
+_SKIPPED_KEYS = {"range", "geojson", "layer", "layers", "template"}
+_INT_TYPES = (("i1", np.int8), ("i2", np.int16), ("i4", np.int32))
+_PLOTLY_DTYPES = {
+    "f4": np.float32,
+    "f8": np.float64,
+    "i1": np.int8,
+    "i2": np.int16,
+    "i4": np.int32,
+    "u1": np.uint8,
+    "u2": np.uint16,
+    "u4": np.uint32,
+}
+
+
+def _typed_array(arr: np.ndarray) -> dict:
+    """Encodes a numeric array as a plotly.js typed array spec."""
+    if arr.dtype.kind in "iub" and arr.size:
+        low, high = arr.min(), arr.max()
+        for code, int_type in _INT_TYPES:
+            info = np.iinfo(int_type)
+            if info.min <= low and high <= info.max:
+                arr = arr.astype(int_type)
+                break
+        else:
+            code, arr = "f4", arr.astype(np.float32)
+    else:
+        code, arr = "f4", arr.astype(np.float32)
+    spec = {"dtype": code, "bdata": base64.b64encode(arr.tobytes()).decode("ascii")}
+    if arr.ndim > 1:
+        spec["shape"] = ", ".join(str(n) for n in arr.shape)
+    return spec
+
+
+def _as_numeric_array(value) -> np.ndarray | None:
+    """Returns value as a numeric array if it is a large homogeneous numeric array."""
+    if isinstance(value, dict) and "bdata" in value and "dtype" in value:
+        if value["dtype"] not in _PLOTLY_DTYPES:
+            return None
+        arr = np.frombuffer(
+            base64.b64decode(value["bdata"]), dtype=_PLOTLY_DTYPES[value["dtype"]]
+        )
+        if "shape" in value:
+            arr = arr.reshape([int(n) for n in str(value["shape"]).split(",")])
+        return arr
+    if isinstance(value, np.ndarray):
+        arr = value
+    elif isinstance(value, (list, tuple)) and len(value) >= MIN_TYPED_ARRAY_LENGTH:
+        if not all(
+            v is None or (isinstance(v, (int, float)) and not isinstance(v, bool))
+            for v in value
+        ):
+            return None
+        arr = np.array([np.nan if v is None else v for v in value])
+    else:
+        return None
+    if arr.dtype.kind not in "iuf" or arr.size < MIN_TYPED_ARRAY_LENGTH:
+        return None
+    return arr
+
+
+def _compact(obj):
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in _SKIPPED_KEYS:
+                continue
+            arr = _as_numeric_array(value)
+            if arr is not None:
+                obj[key] = _typed_array(arr)
+            elif isinstance(value, (np.ndarray, np.generic)):
+                obj[key] = value.tolist()
+            else:
+                _compact(value)
+    elif isinstance(obj, list):
+        for i, value in enumerate(obj):
+            if isinstance(value, (np.ndarray, np.generic)):
+                obj[i] = value.tolist()
+            else:
+                _compact(value)
+    return obj
+
+
+def compact_figure_json(figure: go.Figure) -> dict:
+    """Serializes a figure with numeric arrays as float32/small-int typed arrays."""
+    return _compact(figure.to_plotly_json())
+
+
+def create_timing_chart(stages: list[str], seconds: list[float]) -> go.Figure:
+    """Horizontal bar chart of wall time per pipeline stage."""
+    fig = go.Figure(
+        go.Bar(x=seconds, y=stages, orientation="h", marker_color="#0284C7")
+    )
+    fig.update_layout(
+        title="Wall Time by Stage",
+        xaxis_title="Seconds",
+        yaxis=dict(autorange="reversed"),
+        template=APP_TEMPLATE,
+        margin=dict(l=20, r=20, t=50, b=20),
+    )
+    return fig
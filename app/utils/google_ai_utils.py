@@ -3,6 +3,7 @@ import os
 import logging
 import json
 from google.api_core import exceptions
+from app.utils.instrumentation import instrumented
 
 
 def check_api_key() -> bool:
@@ -17,6 +18,7 @@ def configure_genai():
     genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
 
 
+@instrumented
 def generate_cluster_insights(cluster_profiles: dict) -> dict:
     """Generates marketing insights and personas for customer clusters using Google's Gemini model."""
     configure_genai()
@@ -0,0 +1,350 @@
+import hashlib
+import itertools
+import logging
+import os
+import time
+from typing import Callable, Iterator
+import numpy as np
+import openpyxl
+import pandas as pd
+from joblib import Parallel, delayed
+from app.settings import INGEST_WORKERS
+from app.utils.instrumentation import instrumented
+from app.utils.memory_utils import memory_budget_bytes
+from app.utils.upload_cache import get_upload_cache
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+# Rows held as Python objects at a time; each chunk is converted to typed
+# column arrays before the next is read.
+XLSX_CHUNK_ROWS = 10000
+# The header is looked for among the first rows, below any title lines.
+HEADER_SCAN_ROWS = 20
+
+# Streams the rows of the named sheet as tuples, empty cells as None.
+SheetRows = Callable[[str], Iterator[tuple]]
+
+# Records which file each row of a multi-file upload came from.
+SOURCE_COLUMN = "source_file"
+# Parsing takes up to this many bytes of memory per byte of the file.
+PARSE_BYTES_PER_BYTE = 8
+# Interpreter and libraries of one parsing worker process.
+WORKER_OVERHEAD_BYTES = 200 * 1024**2
+# Parsing workers may use this share of the memory budget.
+MEMORY_SHARE = 0.5
+
+
+def _openpyxl_sheets(path: str) -> tuple[list[str], SheetRows]:
+    """Sheet names and a row iterator using openpyxl's read-only mode."""
+    workbook = openpyxl.load_workbook(
+        path, read_only=True, data_only=True, keep_links=False
+    )
+
+    def rows(name: str) -> Iterator[tuple]:
+        sheet = workbook[name]
+        # Some writers record a wrong used range, which read-only mode trusts.
+        sheet.reset_dimensions()
+        try:
+            yield from sheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    return workbook.sheetnames, rows
+
+
+def _calamine_sheets(path: str) -> tuple[list[str], SheetRows]:
+    """Sheet names and a row iterator using the Rust calamine reader."""
+    workbook = CalamineWorkbook.from_path(path)
+
+    def rows(name: str) -> Iterator[tuple]:
+        for row in workbook.get_sheet_by_name(name).iter_rows():
+            yield tuple(None if value == "" else value for value in row)
+
+    return workbook.sheet_names, rows
+
+
+def xlsx_sheets(path: str) -> tuple[list[str], SheetRows]:
+    """Sheet names of a workbook and a function streaming a sheet's rows.
+
+    Uses python-calamine when it is installed, which parses several times
+    faster than openpyxl, and openpyxl's read-only mode otherwise.
+    """
+    if CalamineWorkbook is not None:
+        return _calamine_sheets(path)
+    return _openpyxl_sheets(path)
+
+
+def _select_sheet(names: list[str], sheet: str | None) -> str:
+    """The sheet named sheet, or at that position counting from 1."""
+    if not sheet or sheet in names:
+        return sheet or names[0]
+    if sheet.isdigit() and 1 <= int(sheet) <= len(names):
+        return names[int(sheet) - 1]
+    raise ValueError(f"No sheet {sheet!r}; the workbook has {', '.join(names)}")
+
+
+def _filled(row: tuple) -> int:
+    return sum(value is not None for value in row)
+
+
+def _detect_header(rows: list[tuple]) -> tuple[int | None, slice]:
+    """Index of the header row among rows and the columns the table spans.
+
+    The header is the first row whose cells are all text and cover at least
+    half the table's width, which skips title lines above it. Without one
+    the table has no header.
+    """
+    filled = [i for row in rows for i, value in enumerate(row) if value is not None]
+    if not filled:
+        return None, slice(0, 0)
+    columns = slice(min(filled), max(filled) + 1)
+    width = max(_filled(row[columns]) for row in rows)
+    for i, row in enumerate(rows):
+        cells = [value for value in row[columns] if value is not None]
+        if len(cells) * 2 >= width and all(isinstance(v, str) for v in cells):
+            return i, columns
+    return None, columns
+
+
+def _column_names(header: tuple | None, width: int) -> list[str]:
+    """Header cells as names; blanks and repeats get pandas' placeholders."""
+    names, seen = [], {}
+    for i in range(width):
+        if header is None:
+            name = f"Column {i + 1}"
+        elif header[i] is None:
+            name = f"Unnamed: {i}"
+        else:
+            name = str(header[i]).strip()
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _typed_column(chunks: list[pd.Series]) -> pd.Series:
+    """Joins a column's chunks, upcasting where they were inferred differently."""
+    column = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    # Excel stores every number as a float; whole ones read back as integers.
+    if column.dtype == np.float64 and column.notna().all():
+        if np.array_equal(column, np.round(column)):
+            return column.astype(np.int64)
+    return column
+
+
+def xlsx_chunks(
+    path: str, sheet: str | None = None, chunk_rows: int = XLSX_CHUNK_ROWS
+) -> tuple[str, list[str], Iterator[pd.DataFrame]]:
+    """Sheet name, column names and the rows of a sheet as DataFrame chunks.
+
+    Rows are read one at a time and gathered into chunks of chunk_rows; each
+    chunk is transposed into typed arrays per column, so only one chunk of
+    cell objects is alive at once instead of the whole sheet. sheet is a
+    sheet name or position counting from 1, by default the first. Title
+    lines above the header and empty rows are skipped.
+    """
+    names, sheet_rows = xlsx_sheets(path)
+    sheet_name = _select_sheet(names, sheet)
+    rows = sheet_rows(sheet_name)
+    scanned = []
+    for row in rows:
+        scanned.append(row)
+        if len(scanned) == HEADER_SCAN_ROWS:
+            break
+    header_at, columns = _detect_header(scanned)
+    width = columns.stop - columns.start
+    header = None
+    if header_at is not None:
+        header = scanned[header_at][columns]
+        header += (None,) * (width - len(header))
+    column_names = _column_names(header, width)
+    body = scanned[header_at + 1 :] if header_at is not None else scanned
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        chunk = []
+        for row in itertools.chain(body, rows):
+            row = row[columns]
+            if not _filled(row):
+                continue
+            chunk.append(row + (None,) * (width - len(row)))
+            if len(chunk) == chunk_rows:
+                yield _chunk_frame(column_names, chunk)
+                chunk = []
+        if chunk:
+            yield _chunk_frame(column_names, chunk)
+
+    return sheet_name, column_names, chunks()
+
+
+def _chunk_frame(column_names: list[str], chunk: list[tuple]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {name: pd.Series(values) for name, values in zip(column_names, zip(*chunk))}
+    )
+
+
+@instrumented
+def read_xlsx(
+    path: str, sheet: str | None = None, chunk_rows: int = XLSX_CHUNK_ROWS
+) -> pd.DataFrame:
+    """Streams a sheet of an XLSX workbook into a DataFrame (see xlsx_chunks)."""
+    start = time.perf_counter()
+    sheet_name, column_names, chunks = xlsx_chunks(path, sheet, chunk_rows)
+    buffers = {name: [] for name in column_names}
+    for chunk in chunks:
+        for name in column_names:
+            buffers[name].append(chunk[name])
+    df = pd.DataFrame(
+        {
+            name: _typed_column(buffer) if buffer else pd.Series(dtype=object)
+            for name, buffer in buffers.items()
+        }
+    )
+    logging.info(
+        f"Read sheet {sheet_name!r}: {len(df):,} rows x {len(column_names)} columns "
+        f"in {time.perf_counter() - start:.1f} s"
+    )
+    return df
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def parse_upload(
+    path: str, filename: str, sha256: str | None = None, sheet: str | None = None
+) -> pd.DataFrame:
+    """Parses one CSV or XLSX file, unless the same bytes were parsed before.
+
+    The file is read from path; filename is the name it was uploaded under.
+    Parsed frames are cached under the SHA-256 of the content (see
+    upload_cache.py); sha256 saves hashing it again.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    digest = sha256 or file_sha256(path)
+    cache = get_upload_cache()
+    key = f"{digest}{extension.replace('.', '-')}"
+    if sheet and extension != ".csv":
+        key += f"-{hashlib.sha256(sheet.encode()).hexdigest()[:12]}"
+    df = cache.get(key)
+    if df is None:
+        if extension == ".csv":
+            df = pd.read_csv(path)
+        else:
+            df = read_xlsx(path, sheet)
+        cache.put(key, df)
+    return df
+
+
+def upload_workers(sizes: list[int]) -> int:
+    """Worker processes for parsing files of these sizes, as cores and memory allow."""
+    cores = INGEST_WORKERS or os.cpu_count() or 1
+    per_worker = WORKER_OVERHEAD_BYTES + max(sizes) * PARSE_BYTES_PER_BYTE
+    by_memory = int(memory_budget_bytes() * MEMORY_SHARE) // per_worker
+    return max(1, min(len(sizes), cores, by_memory))
+
+
+@instrumented
+def parse_uploads(
+    paths: list[str],
+    filenames: list[str],
+    digests: list[str | None],
+    sheet: str | None = None,
+) -> list[pd.DataFrame]:
+    """Parses several files at once in worker processes, in the given order.
+
+    Parsing is CPU-bound Python (openpyxl) or holds the GIL for long
+    stretches (the CSV tokenizer), so the files go to separate processes
+    rather than threads. A single file is parsed in this process.
+    """
+    workers = upload_workers([os.path.getsize(path) for path in paths])
+    if workers == 1:
+        return [
+            parse_upload(path, filename, digest, sheet)
+            for path, filename, digest in zip(paths, filenames, digests)
+        ]
+    logging.info(f"Parsing {len(paths)} files on {workers} workers")
+    with Parallel(n_jobs=workers, backend="loky") as pool:
+        return pool(
+            delayed(parse_upload)(path, filename, digest, sheet)
+            for path, filename, digest in zip(paths, filenames, digests)
+        )
+
+
+def _column_kind(column: pd.Series) -> str | None:
+    """What a column holds, or None if it is empty and agrees with anything."""
+    if column.isna().all():
+        return None
+    if pd.api.types.is_bool_dtype(column):
+        return "boolean"
+    if pd.api.types.is_numeric_dtype(column):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return "datetime"
+    return "text"
+
+
+def _check_schemas(frames: list[pd.DataFrame], filenames: list[str]):
+    """Raises ValueError unless every file has the first file's columns and kinds."""
+    columns = list(frames[0].columns)
+    if SOURCE_COLUMN in columns:
+        raise ValueError(f"{filenames[0]} already has a {SOURCE_COLUMN} column")
+    for df, filename in zip(frames[1:], filenames[1:]):
+        missing = [c for c in columns if c not in df.columns]
+        extra = [c for c in df.columns if c not in columns]
+        if missing or extra:
+            raise ValueError(
+                f"{filename} does not have the columns of {filenames[0]}: "
+                f"missing {missing or 'none'}, unexpected {extra or 'none'}"
+            )
+    for column in columns:
+        seen = None
+        for df, filename in zip(frames, filenames):
+            kind = _column_kind(df[column])
+            if kind is None:
+                continue
+            if seen is None:
+                seen = (kind, filename)
+            elif kind != seen[0]:
+                raise ValueError(
+                    f"Column {column!r} is {seen[0]} in {seen[1]} "
+                    f"but {kind} in {filename}"
+                )
+
+
+def _unique_names(filenames: list[str]) -> list[str]:
+    """Filenames with repeats numbered, e.g. two exports both called data.csv."""
+    seen, names = {}, []
+    for filename in filenames:
+        count = seen[filename] = seen.get(filename, 0) + 1
+        names.append(filename if count == 1 else f"{filename} ({count})")
+    return names
+
+
+@instrumented
+def merge_uploads(frames: list[pd.DataFrame], filenames: list[str]) -> pd.DataFrame:
+    """Stacks files with the same columns and records each row's source file.
+
+    Column order follows the first file. Each column is concatenated once,
+    straight into the merged frame, so the data is copied a single time;
+    the source column is categorical and stores one small code per row.
+    """
+    _check_schemas(frames, filenames)
+    lengths = [len(df) for df in frames]
+    merged = {
+        column: pd.concat([df[column] for df in frames], ignore_index=True)
+        for column in frames[0].columns
+    }
+    codes = np.repeat(np.arange(len(frames), dtype=np.int32), lengths)
+    merged[SOURCE_COLUMN] = pd.Categorical.from_codes(
+        codes, categories=_unique_names(filenames)
+    )
+    df = pd.DataFrame(merged, copy=False)
+    logging.info(f"Merged {len(frames)} files into {len(df):,} rows")
+    return df
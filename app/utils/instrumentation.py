@@ -0,0 +1,241 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from app.settings import INSTRUMENTATION, TRACE_FILE
+
+_current_run: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "segmentation_run_id", default=None
+)
+_span_depth: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "segmentation_span_depth", default=0
+)
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS:
+    """Samples RSS on a background thread and keeps the peak seen."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    @property
+    def delta_mb(self) -> float:
+        return (self.peak - self.start) / 1024**2
+
+
+def count_rows(obj) -> int | None:
+    """Best-effort row count for a stage input or output."""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        for key in ("labels", "transformed_data"):
+            if key in obj and hasattr(obj[key], "__len__"):
+                return len(obj[key])
+    return None
+
+
+class MetricsRegistry:
+    """Collects stage records per run, exports Prometheus text and a JSON trace."""
+
+    def __init__(self, trace_file: str = "", max_runs: int = 100):
+        self.trace_file = trace_file
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._runs: OrderedDict[str, list[dict]] = OrderedDict()
+        self._sums: dict[str, dict[str, float]] = defaultdict(
+            lambda: {"seconds": 0.0, "cpu_seconds": 0.0, "count": 0, "errors": 0}
+        )
+        self._last: dict[str, dict] = {}
+
+    def record(self, record: dict):
+        with self._lock:
+            totals = self._sums[record["stage"]]
+            totals["seconds"] += record["seconds"]
+            totals["cpu_seconds"] += record["cpu_seconds"]
+            totals["count"] += 1
+            totals["errors"] += record["status"] == "error"
+            self._last[record["stage"]] = record
+            run_id = record.get("run_id")
+            if run_id is not None:
+                self._runs.setdefault(run_id, []).append(record)
+                self._runs.move_to_end(run_id)
+                while len(self._runs) > self.max_runs:
+                    self._runs.popitem(last=False)
+        self._write_trace(record)
+
+    def annotate(self, record: dict, **fields):
+        """Adds fields measured after a span closed, such as its state delta size."""
+        with self._lock:
+            record.update(fields)
+        self._write_trace({"event": "annotate", "span_id": record["span_id"], **fields})
+
+    def run_records(self, run_id: str | None) -> list[dict]:
+        with self._lock:
+            return [dict(r) for r in self._runs.get(run_id, [])]
+
+    def _write_trace(self, entry: dict):
+        if not self.trace_file:
+            return
+        try:
+            directory = os.path.dirname(self.trace_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._lock, open(self.trace_file, "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+        except OSError as e:
+            logging.warning(f"Could not write trace file {self.trace_file}: {e}")
+
+    def prometheus_text(self) -> str:
+        """Renders the collected metrics in the Prometheus text exposition format."""
+        with self._lock:
+            sums = {stage: dict(v) for stage, v in self._sums.items()}
+            last = {stage: dict(v) for stage, v in self._last.items()}
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, stage, value in samples:
+                lines.append(f'{name}{suffix}{{stage="{stage}"}} {value}')
+
+        metric(
+            "segmentation_stage_duration_seconds",
+            "summary",
+            "Wall time spent in each pipeline stage.",
+            [
+                (suffix, stage, v[key])
+                for stage, v in sums.items()
+                for suffix, key in (("_sum", "seconds"), ("_count", "count"))
+            ],
+        )
+        metric(
+            "segmentation_stage_cpu_seconds_total",
+            "counter",
+            "CPU time spent in each pipeline stage.",
+            [("", stage, v["cpu_seconds"]) for stage, v in sums.items()],
+        )
+        metric(
+            "segmentation_stage_errors_total",
+            "counter",
+            "Pipeline stage failures.",
+            [("", stage, v["errors"]) for stage, v in sums.items()],
+        )
+        for key, name, help_text in (
+            ("peak_rss_mb", "segmentation_stage_peak_rss_megabytes", "Peak RSS growth"),
+            ("rows_in", "segmentation_stage_rows_in", "Rows entering"),
+            ("rows_out", "segmentation_stage_rows_out", "Rows leaving"),
+            ("delta_bytes", "segmentation_state_delta_bytes", "State delta size of"),
+        ):
+            metric(
+                name,
+                "gauge",
+                f"{help_text} the last run of each stage.",
+                [
+                    ("", stage, record[key])
+                    for stage, record in last.items()
+                    if record.get(key) is not None
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(TRACE_FILE)
+
+
+@contextmanager
+def pipeline_run(run_id: str | None, depth: int = 0):
+    """Attributes every span opened inside the block to run_id.
+
+    depth lets work handed to another thread nest under the span that waits on it.
+    """
+    run_token = _current_run.set(run_id)
+    depth_token = _span_depth.set(depth)
+    try:
+        yield
+    finally:
+        _span_depth.reset(depth_token)
+        _current_run.reset(run_token)
+
+
+@contextmanager
+def span(stage: str, rows_in: int | None = None):
+    """Measures a block of work; callers may set record["rows_out"]."""
+    record = {
+        "span_id": f"{time.time_ns():x}-{threading.get_ident():x}",
+        "run_id": _current_run.get(),
+        "stage": stage,
+        "depth": _span_depth.get(),
+        "started": time.time(),
+        "rows_in": rows_in,
+        "rows_out": None,
+        "status": "ok",
+    }
+    if not INSTRUMENTATION:
+        yield record
+        return
+    depth_token = _span_depth.set(record["depth"] + 1)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        with PeakRSS() as rss:
+            yield record
+    except Exception as e:
+        record.update(status="error", error=str(e))
+        raise
+    finally:
+        _span_depth.reset(depth_token)
+        record.update(
+            seconds=round(time.perf_counter() - wall_start, 4),
+            cpu_seconds=round(time.process_time() - cpu_start, 4),
+            peak_rss_mb=round(rss.delta_mb, 2),
+        )
+        metrics.record(record)
+
+
+def instrumented(fn):
+    """Records a span for every call, named after the function."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(fn.__name__, rows_in=count_rows(args[0]) if args else None) as record:
+            result = fn(*args, **kwargs)
+            record["rows_out"] = count_rows(result)
+            return result
+
+    return wrapper
@@ -0,0 +1,594 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+import numpy as np
+import pandas as pd
+from app.settings import (
+    JOB_DB_PATH,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_RETENTION_DAYS,
+    JOB_STORE_DIR,
+    JOB_WORKERS,
+)
+from app.utils.instrumentation import pipeline_run
+from app.utils.lazy_imports import lazy_module
+from app.utils.scheduler import (
+    AdmissionError,
+    FairScheduler,
+    JobCost,
+    estimate_cost,
+)
+from app.utils import memory_utils
+
+analytics_engine = lazy_module("app.utils.analytics_engine")
+
+JOB_STAGES: dict[str, Callable[[dict, dict, "JobContext"], dict]] = {}
+# Outputs of each stage that are also stored as Parquet for SQL analytics.
+JOB_DATASETS: dict[str, list[str]] = {}
+# Stages with side effects, which run again on every submit instead of
+# reusing a finished job with the same inputs and params.
+UNCACHED_STAGES: set[str] = set()
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    owner TEXT NOT NULL DEFAULT '',
+    run_id TEXT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    heartbeat_at REAL
+)
+"""
+
+
+class JobFailedError(RuntimeError):
+    """Raised when awaiting a job that finished with an error."""
+
+
+class JobCancelledError(JobFailedError):
+    """Raised when awaiting a job that was cancelled, or inside one being cancelled."""
+
+
+@dataclass(frozen=True)
+class OutputRef:
+    """Points at one output of another job, so large data is stored only once."""
+
+    job_id: str
+    key: str
+
+
+@dataclass(frozen=True)
+class DatasetRef(OutputRef):
+    """Like OutputRef, but the job receives the path of the output's Parquet copy."""
+
+
+def job_stage(name: str, datasets: tuple[str, ...] = (), cacheable: bool = True):
+    """Registers a function as the body of a pipeline stage job.
+
+    The outputs named in datasets are also written to Parquet when the job
+    finishes, for jobs reading them through a DatasetRef. cacheable=False
+    marks a stage with side effects: a finished job is run again when the
+    same job is submitted, while a queued or running one is still shared.
+    """
+
+    def decorator(fn):
+        JOB_STAGES[name] = fn
+        JOB_DATASETS[name] = list(datasets)
+        if cacheable:
+            UNCACHED_STAGES.discard(name)
+        else:
+            UNCACHED_STAGES.add(name)
+        return fn
+
+    return decorator
+
+
+def fingerprint(obj) -> str:
+    """Content hash of a job input."""
+    digest = hashlib.sha256()
+    _update_fingerprint(digest, obj)
+    return digest.hexdigest()
+
+
+def _update_fingerprint(digest, obj):
+    if isinstance(obj, DatasetRef):
+        digest.update(f"dataset:{obj.job_id}:{obj.key}".encode())
+    elif isinstance(obj, OutputRef):
+        digest.update(f"ref:{obj.job_id}:{obj.key}".encode())
+    elif isinstance(obj, pd.DataFrame):
+        digest.update(repr(list(zip(obj.columns, map(str, obj.dtypes)))).encode())
+        digest.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        digest.update(f"{obj.dtype}{obj.shape}".encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (bytes, bytearray)):
+        digest.update(obj)
+    elif isinstance(obj, dict):
+        for key in sorted(obj):
+            digest.update(str(key).encode())
+            _update_fingerprint(digest, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _update_fingerprint(digest, item)
+    else:
+        digest.update(repr(obj).encode())
+
+
+class JobContext:
+    """Handed to a running stage so it can checkpoint intermediate results."""
+
+    def __init__(self, job_dir: str, cancelled: Callable[[], bool] = lambda: False):
+        self.job_dir = job_dir
+        self.cancelled = cancelled
+
+    def checkpoint(self, name: str, compute: Callable[[], Any]) -> Any:
+        """Returns the saved value for name, computing and saving it on first use.
+
+        Raises JobCancelledError instead of computing once the job is cancelled.
+        """
+        path = os.path.join(self.job_dir, f"checkpoint-{name}.pkl")
+        if os.path.exists(path):
+            logging.info(f"Resuming from checkpoint {path}")
+            return _load(path)
+        if self.cancelled():
+            raise JobCancelledError(f"Cancelled before {name}.")
+        value = compute()
+        _dump(value, path)
+        return value
+
+    def raise_if_cancelled(self):
+        """Raises JobCancelledError once the job is cancelled.
+
+        Long computations call it between steps that are not worth a
+        checkpoint, such as k-means restarts.
+        """
+        if self.cancelled():
+            raise JobCancelledError("Cancelled while running.")
+
+
+def _dump(value, path: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def _load(path: str):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _shapes(outputs: dict) -> dict[str, list[int]]:
+    """Rows and columns of the tabular outputs, read by cost estimates downstream."""
+    shapes = {}
+    for key, value in outputs.items():
+        if isinstance(value, pd.DataFrame):
+            shapes[key] = list(memory_utils.stored_shape(value))
+        elif isinstance(value, np.ndarray):
+            shape = list(value.shape) + [1]
+            shapes[key] = shape[:2]
+    return shapes
+
+
+class JobQueue:
+    """SQLite-backed queue of pipeline stage jobs with persisted inputs and outputs.
+
+    Job ids are content hashes of the stage, its inputs and its params, so
+    submitting work that already finished returns the stored result instead
+    of recomputing it. Running jobs heartbeat; on start-up, jobs whose
+    heartbeat went stale (the process died) are queued again and resume from
+    their last checkpoint.
+
+    Jobs only reach a worker once the scheduler admits them under the shared
+    memory budget (see app/utils/scheduler.py). A superseded job can be
+    cancelled: a queued one leaves the queue at once, a running one stops at
+    its next checkpoint.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        store_dir: str,
+        max_workers: int = 2,
+        heartbeat_seconds: float = 5.0,
+        memory_budget_bytes: int | None = None,
+    ):
+        self.db_path = db_path
+        self.store_dir = store_dir
+        # Uploaded files, named by content hash, which ingest jobs read.
+        self.upload_dir = os.path.join(store_dir, "uploads")
+        self.heartbeat_seconds = heartbeat_seconds
+        self.scheduler = FairScheduler(
+            memory_budget_bytes or memory_utils.memory_budget_bytes(), max_workers
+        )
+        os.makedirs(self.upload_dir, exist_ok=True)
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="pipeline-job"
+        )
+        self._running: set[str] = set()
+        # Jobs dispatched again while still running, e.g. a deferred job whose
+        # upstream finished before it left _running; _run dispatches them
+        # once they have.
+        self._redispatch: set[str] = set()
+        self._cancel_requested: set[str] = set()
+        self._dependents: dict[str, list[str]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            conn.row_factory = sqlite3.Row
+            with conn:
+                yield conn
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.store_dir, job_id)
+
+    def upload_path(self, sha256: str, filename: str) -> str:
+        """Where an uploaded file with this content hash is kept."""
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(self.upload_dir, f"{sha256}{extension}")
+
+    def submit(
+        self,
+        stage: str,
+        inputs: dict,
+        params: dict | None = None,
+        owner: str = "",
+        run_id: str | None = None,
+    ) -> str:
+        """Queues a stage job and returns its id; finished or running jobs are reused.
+
+        Finished jobs of uncached stages are run again instead.
+        """
+        if stage not in JOB_STAGES:
+            raise ValueError(f"Unknown job stage: {stage}")
+        params = params or {}
+        params_json = json.dumps(params, sort_keys=True, default=str)
+        job_id = fingerprint([stage, inputs, params_json])[:32]
+        reusable = ("queued", "running")
+        if stage not in UNCACHED_STAGES:
+            reusable += ("done",)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is not None and row["status"] in reusable:
+                with self._lock:
+                    self._cancel_requested.discard(job_id)
+                if row["status"] == "queued":
+                    self._dispatch(job_id, inputs)
+                return job_id
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        _dump(inputs, os.path.join(job_dir, "inputs.pkl"))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, stage, owner, run_id, params, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = 'queued', error = NULL, "
+                "owner = excluded.owner, run_id = excluded.run_id, updated_at = excluded.updated_at",
+                (job_id, stage, owner, run_id, params_json, now, now),
+            )
+        self._dispatch(job_id, inputs)
+        return job_id
+
+    def _dispatch(self, job_id: str, inputs: dict | None = None):
+        with self._lock:
+            if job_id in self._running:
+                self._redispatch.add(job_id)
+                return
+            self._running.add(job_id)
+        try:
+            job = self.status(job_id)
+            if inputs is None:
+                inputs = _load(os.path.join(self._job_dir(job_id), "inputs.pkl"))
+            cost = self.estimate(job["stage"], inputs, job["params"])
+            self.scheduler.submit(
+                job_id,
+                job["owner"],
+                cost,
+                lambda: self._executor.submit(self._run, job_id),
+            )
+        except AdmissionError as e:
+            logging.warning(f"Rejected job {job_id}: {e}")
+            self._finish(job_id, "failed", str(e))
+            with self._lock:
+                self._running.discard(job_id)
+
+    def estimate(self, stage: str, inputs: dict, params: dict) -> JobCost:
+        """Estimates a job's cost from the shape of its largest input."""
+        rows = cols = input_bytes = 0
+        for key, value in inputs.items():
+            if isinstance(value, OutputRef):
+                meta_path = os.path.join(self._job_dir(value.job_id), "shapes.json")
+                if not os.path.exists(meta_path):
+                    continue
+                with open(meta_path) as f:
+                    shape = json.load(f).get(value.key)
+            elif isinstance(value, (pd.DataFrame, np.ndarray)):
+                shape = _shapes({key: value})[key]
+            else:
+                # Uploaded files are passed by path.
+                for item in value if isinstance(value, (list, tuple)) else [value]:
+                    if isinstance(item, str) and os.path.isfile(item):
+                        input_bytes += os.path.getsize(item)
+                continue
+            if shape and shape[0] * shape[1] > rows * cols:
+                rows, cols = shape
+        return estimate_cost(stage, rows, cols, params, input_bytes)
+
+    def position(self, job_id: str) -> int:
+        """Place of a job in the admission queue, 0 once it is running."""
+        return self.scheduler.position(job_id)
+
+    def cancel(self, job_id: str, owner: str) -> bool:
+        """Cancels a queued or running job last submitted by owner.
+
+        Jobs are shared by content hash, so a job another session submitted
+        since is left alone. Returns False if there was nothing to cancel.
+        """
+        with self._connect() as conn:
+            cancelled = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'queued'",
+                (time.time(), job_id, owner),
+            ).rowcount
+            running = conn.execute(
+                "SELECT 1 FROM jobs WHERE id = ? AND owner = ? AND status = 'running'",
+                (job_id, owner),
+            ).fetchone()
+        if cancelled:
+            if self.scheduler.withdraw(job_id):
+                with self._lock:
+                    self._running.discard(job_id)
+            logging.info(f"Cancelled queued job {job_id}")
+            return True
+        if running:
+            with self._lock:
+                self._cancel_requested.add(job_id)
+            logging.info(f"Cancelling running job {job_id} at its next checkpoint")
+            return True
+        return False
+
+    def _claim(self, job_id: str) -> sqlite3.Row | None:
+        now = time.time()
+        with self._connect() as conn:
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (now, now, job_id),
+            ).rowcount
+            if not claimed:
+                return None
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def _run(self, job_id: str):
+        try:
+            row = self._claim(job_id)
+            if row is None:
+                return
+            job_dir = self._job_dir(job_id)
+            try:
+                inputs = _load(os.path.join(job_dir, "inputs.pkl"))
+                if self._defer_until_upstream(job_id, inputs):
+                    return
+                inputs = self._resolve(inputs)
+                context = JobContext(job_dir, lambda: job_id in self._cancel_requested)
+                with pipeline_run(row["run_id"], depth=1):
+                    outputs = JOB_STAGES[row["stage"]](
+                        inputs, json.loads(row["params"]), context
+                    )
+                _dump(outputs, os.path.join(job_dir, "outputs.pkl"))
+                for key in JOB_DATASETS.get(row["stage"], []):
+                    analytics_engine.write_parquet(
+                        outputs[key], self.dataset_path(job_id, key), key
+                    )
+                with open(os.path.join(job_dir, "shapes.json"), "w") as f:
+                    json.dump(_shapes(outputs), f)
+                self._finish(job_id, "done")
+            except JobCancelledError as e:
+                logging.info(f"Job {job_id} ({row['stage']}) cancelled: {e}")
+                self._finish(job_id, "cancelled")
+            except Exception as e:
+                logging.exception(f"Job {job_id} ({row['stage']}) failed: {e}")
+                self._finish(job_id, "failed", str(e))
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+                self._cancel_requested.discard(job_id)
+                redispatch = job_id in self._redispatch
+                self._redispatch.discard(job_id)
+            self.scheduler.release(job_id)
+            self._release_dependents(job_id)
+            if redispatch and self.status(job_id)["status"] == "queued":
+                self._dispatch(job_id)
+
+    def _defer_until_upstream(self, job_id: str, inputs: dict) -> bool:
+        """Puts a job back in the queue if a job it reads from is not done yet."""
+        for ref in inputs.values():
+            if not isinstance(ref, OutputRef):
+                continue
+            upstream = self.status(ref.job_id)
+            if upstream is None or upstream["status"] in ("failed", "cancelled"):
+                raise JobFailedError(f"Upstream job {ref.job_id} did not finish.")
+            if upstream["status"] != "done":
+                with self._lock:
+                    self._dependents[ref.job_id].append(job_id)
+                self._finish(job_id, "queued")
+                # The upstream job may have finished while this one was deferred.
+                if self.status(ref.job_id)["status"] in ("done", "failed", "cancelled"):
+                    self._release_dependents(ref.job_id)
+                return True
+        return False
+
+    def _release_dependents(self, job_id: str):
+        with self._lock:
+            dependents = self._dependents.pop(job_id, [])
+        for dependent in dependents:
+            self._dispatch(dependent)
+
+    def _resolve(self, inputs: dict) -> dict:
+        resolved = {}
+        for key, value in inputs.items():
+            if isinstance(value, DatasetRef):
+                value = self.dataset_path(value.job_id, value.key)
+            elif isinstance(value, OutputRef):
+                value = self.result(value.job_id)[value.key]
+            resolved[key] = value
+        return resolved
+
+    def _finish(self, job_id: str, status: str, error: str | None = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def _beat(self):
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                        [(time.time(), job_id) for job_id in running],
+                    )
+            except sqlite3.Error as e:
+                logging.warning(f"Job heartbeat failed: {e}")
+
+    def status(self, job_id: str) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def result(self, job_id: str) -> dict:
+        """Loads the outputs of a finished job."""
+        return _load(os.path.join(self._job_dir(job_id), "outputs.pkl"))
+
+    def dataset_path(self, job_id: str, key: str) -> str:
+        """Path of the Parquet copy of a finished job's output."""
+        return os.path.join(self._job_dir(job_id), f"{key}.parquet")
+
+    async def wait(
+        self,
+        job_id: str,
+        poll_interval: float = 0.2,
+        on_position: Callable[[int], Awaitable[None]] | None = None,
+    ) -> dict:
+        """Waits for a job to finish and returns its outputs.
+
+        on_position is awaited whenever the job's place in the admission
+        queue changes.
+        """
+        position = 0
+        while True:
+            job = await asyncio.to_thread(self.status, job_id)
+            if job is None:
+                raise JobFailedError(f"Job {job_id} does not exist.")
+            if job["status"] == "done":
+                return await asyncio.to_thread(self.result, job_id)
+            if job["status"] == "failed":
+                raise JobFailedError(job["error"] or "Job failed.")
+            if job["status"] == "cancelled":
+                raise JobCancelledError(f"Job {job_id} was cancelled.")
+            if on_position is not None and self.position(job_id) != position:
+                position = self.position(job_id)
+                await on_position(position)
+            await asyncio.sleep(poll_interval)
+
+    def recover(self):
+        """Requeues jobs orphaned by a crash and restarts everything queued."""
+        stale_before = time.time() - 3 * self.heartbeat_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' "
+                "AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (stale_before,),
+            )
+            queued = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+                )
+            ]
+        for job_id in queued:
+            self._dispatch(job_id)
+        if queued:
+            logging.info(f"Resumed {len(queued)} queued pipeline jobs.")
+
+    def purge(self, older_than_days: float):
+        """Deletes finished jobs, their data and uploads past the retention window.
+
+        An upload received again is written anew, which renews its window.
+        """
+        cutoff = time.time() - older_than_days * 86400
+        with self._connect() as conn:
+            expired = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM jobs WHERE status IN ('done', 'failed', 'cancelled') "
+                    "AND updated_at < ?",
+                    (cutoff,),
+                )
+            ]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in expired])
+        for job_id in expired:
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+        for entry in os.scandir(self.upload_dir):
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+
+
+_queue: JobQueue | None = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue, recovering interrupted jobs on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            # Registers the stage bodies with JOB_STAGES.
+            import app.utils.pipeline_jobs  # noqa: F401
+
+            _queue = JobQueue(
+                JOB_DB_PATH,
+                JOB_STORE_DIR,
+                max_workers=JOB_WORKERS,
+                heartbeat_seconds=JOB_HEARTBEAT_SECONDS,
+            )
+            _queue.purge(JOB_RETENTION_DAYS)
+            _queue.recover()
+        return _queue
@@ -0,0 +1,253 @@
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Callable
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.cluster import kmeans_plusplus
+from app.settings import KMEANS_WORKERS
+
+# k-means++ seeds are drawn from this many sampled rows (at least 50 per cluster).
+SEED_SAMPLE_ROWS = 10_000
+# Restarts run at least this many iterations before they may be abandoned,
+# and only once their projected inertia trails the best by this fraction.
+MIN_ITERATIONS_BEFORE_ABANDON = 5
+ABANDON_MARGIN = 0.005
+# Rows per block of the assignment step, so distances stay in cache.
+CHUNK_ROWS = 16_384
+# Slots of the array the restarts share: the lowest finished inertia, and a
+# flag that stops every restart once the fit is cancelled.
+BEST, CANCELLED = 0, 1
+
+
+@dataclass
+class KMeansResult:
+    labels: np.ndarray
+    centroids: np.ndarray
+    inertia: float
+    n_iter: int
+    restarts_finished: int
+    restarts_abandoned: int
+
+
+def not_cancelled():
+    """Default cancel check of the clustering fits: never cancelled."""
+
+
+def worker_count(n_init: int, n_workers: int | None = None) -> int:
+    """Processes used for n_init restarts; defaults to SEGMENTATION_KMEANS_WORKERS."""
+    return max(1, min(n_init, n_workers or KMEANS_WORKERS or os.cpu_count() or 1))
+
+
+def _assign(
+    data: np.ndarray, sq_norms: np.ndarray, centroids: np.ndarray
+) -> tuple[np.ndarray, float]:
+    """Nearest centroid of every row and the total squared distance."""
+    labels = np.empty(len(data), dtype=np.int32)
+    inertia = float(sq_norms.sum())
+    centroid_sq = np.einsum("ij,ij->i", centroids, centroids)[:, None]
+    for start in range(0, len(data), CHUNK_ROWS):
+        # Clusters x rows, so argmin runs along contiguous rows of distances.
+        distances = centroids @ data[start : start + CHUNK_ROWS].T
+        distances *= -2
+        distances += centroid_sq
+        block_labels = distances.argmin(axis=0)
+        labels[start : start + len(block_labels)] = block_labels
+        inertia += float(distances[block_labels, np.arange(len(block_labels))].sum())
+    return labels, max(inertia, 0.0)
+
+
+def _update(data: np.ndarray, labels: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Mean of each cluster; an empty one takes the row farthest from its centroid."""
+    k = len(centroids)
+    counts = np.bincount(labels, minlength=k)
+    membership = sp.csr_matrix(
+        (np.ones(len(labels), dtype=data.dtype), labels, np.arange(len(labels) + 1)),
+        shape=(len(labels), k),
+    )
+    sums = membership.T @ data
+    new = centroids.copy()
+    filled = counts > 0
+    new[filled] = sums[filled] / counts[filled, None]
+    if not filled.all():
+        residual = ((data - centroids[labels]) ** 2).sum(axis=1)
+        for cluster, row in zip(np.flatnonzero(~filled), np.argsort(residual)[::-1]):
+            new[cluster] = data[row]
+    return new.astype(data.dtype, copy=False)
+
+
+def _projected_floor(trajectory: list[float]) -> float:
+    """Extrapolates the inertia a restart would converge to.
+
+    Lloyd iterations shrink the inertia by roughly geometric steps once past
+    the first few, so the remaining improvement is about step * r / (1 - r).
+    """
+    step, previous = trajectory[-2] - trajectory[-1], trajectory[-3] - trajectory[-2]
+    if previous <= 0 or step <= 0:
+        return trajectory[-1]
+    ratio = min(step / previous, 0.95)
+    return trajectory[-1] - step * ratio / (1 - ratio)
+
+
+def _lloyd(
+    data: np.ndarray,
+    sq_norms: np.ndarray,
+    centroids: np.ndarray,
+    max_iter: int,
+    tol: float,
+    shared: np.ndarray,
+) -> tuple[float, np.ndarray, int] | None:
+    """Runs one restart; returns its inertia, centroids and iterations.
+
+    shared[BEST] is the lowest inertia any restart has finished with,
+    lowered as restarts in this or other workers finish. Returns None if
+    the restart was abandoned because it could no longer beat it, or
+    because shared[CANCELLED] was set.
+    """
+    trajectory = []
+    for n_iter in range(1, max_iter + 1):
+        if shared[CANCELLED]:
+            return None
+        labels, inertia = _assign(data, sq_norms, centroids)
+        trajectory.append(inertia)
+        if (
+            n_iter >= MIN_ITERATIONS_BEFORE_ABANDON
+            and _projected_floor(trajectory) * (1 - ABANDON_MARGIN) > shared[BEST]
+        ):
+            return None
+        new = _update(data, labels, centroids)
+        shift = float(((new - centroids) ** 2).sum())
+        centroids = new
+        if shift <= tol:
+            break
+    _, inertia = _assign(data, sq_norms, centroids)
+    # Two workers finishing at once may leave the higher inertia here; that
+    # only abandons less, since the result is picked from the returned runs.
+    shared[BEST] = min(shared[BEST], inertia)
+    return inertia, centroids, n_iter
+
+
+def _parallel_restarts(
+    data: np.ndarray,
+    sq_norms: np.ndarray,
+    seeds: list[np.ndarray],
+    max_iter: int,
+    tol: float,
+    n_workers: int,
+    check_cancelled: Callable[[], None],
+) -> list:
+    """Runs each restart as a task on n_workers worker processes.
+
+    The data, row norms and shared slots are memory-mapped files that every
+    worker opens: the data is written once, and a restart finishing in one
+    worker lets the others abandon theirs. check_cancelled runs as each
+    restart finishes; if it raises, the running restarts stop too.
+    """
+    with tempfile.TemporaryDirectory(prefix="kmeans-") as directory:
+        shared = {}
+        for name, array in (
+            ("data", data),
+            ("sq_norms", sq_norms),
+            ("shared", np.array([np.inf, 0.0])),
+        ):
+            shared[name] = np.lib.format.open_memmap(
+                os.path.join(directory, f"{name}.npy"),
+                mode="w+",
+                dtype=array.dtype,
+                shape=array.shape,
+            )
+            shared[name][:] = array
+        # inner_max_num_threads sets each worker's BLAS thread count when the
+        # worker starts.
+        with Parallel(
+            n_jobs=n_workers,
+            backend="loky",
+            inner_max_num_threads=1,
+            return_as="generator_unordered",
+        ) as pool:
+            runs = []
+            for run in pool(
+                delayed(_lloyd)(
+                    shared["data"],
+                    shared["sq_norms"],
+                    seed,
+                    max_iter,
+                    tol,
+                    shared["shared"],
+                )
+                for seed in seeds
+            ):
+                runs.append(run)
+                try:
+                    check_cancelled()
+                except BaseException:
+                    shared["shared"][CANCELLED] = 1
+                    raise
+            return runs
+
+
+def parallel_kmeans(
+    data,
+    n_clusters: int,
+    n_init: int = 10,
+    max_iter: int = 300,
+    tol: float = 1e-4,
+    random_state: int = 42,
+    n_workers: int | None = None,
+    check_cancelled: Callable[[], None] = not_cancelled,
+) -> KMeansResult:
+    """k-means with its restarts run concurrently over one shared copy of the data.
+
+    Each restart is seeded with k-means++ on a row sample and runs Lloyd
+    iterations on all rows. The restarts run as tasks on worker processes
+    that memory-map the same array. Each worker starts with BLAS held to one
+    thread, so the restarts, not the matrix products, spread across the
+    cores; this process's own BLAS settings are left alone. A restart whose
+    projected final inertia cannot beat the best finished restart, in any
+    worker, is abandoned. tol is relative to the mean feature variance, as
+    in scikit-learn. check_cancelled is called between restarts and stops
+    the fit by raising.
+    """
+    data = np.ascontiguousarray(data)
+    if data.dtype not in (np.float32, np.float64):
+        data = data.astype(np.float64)
+    rng = np.random.default_rng(random_state)
+    sample_rows = min(len(data), max(SEED_SAMPLE_ROWS, 50 * n_clusters))
+    sample = data[rng.choice(len(data), sample_rows, replace=False)]
+    seeds = [
+        kmeans_plusplus(sample, n_clusters, random_state=int(seed))[0].astype(
+            data.dtype
+        )
+        for seed in rng.integers(0, 2**31 - 1, n_init)
+    ]
+    sq_norms = np.einsum("ij,ij->i", data, data)
+    tol = tol * float(np.mean(np.var(data, axis=0)))
+    n_workers = worker_count(n_init, n_workers)
+    if n_workers == 1:
+        shared = np.array([np.inf, 0.0])
+        runs = []
+        for seed in seeds:
+            check_cancelled()
+            runs.append(_lloyd(data, sq_norms, seed, max_iter, tol, shared))
+    else:
+        runs = _parallel_restarts(
+            data, sq_norms, seeds, max_iter, tol, n_workers, check_cancelled
+        )
+    finished = [run for run in runs if run is not None]
+    _, centroids, n_iter = min(finished, key=lambda run: run[0])
+    abandoned = len(runs) - len(finished)
+    labels, inertia = _assign(data, sq_norms, centroids)
+    logging.info(
+        f"k-means: {n_init - abandoned} of {n_init} restarts finished on "
+        f"{n_workers} workers, best inertia {inertia:,.1f}"
+    )
+    return KMeansResult(
+        labels=labels,
+        centroids=centroids,
+        inertia=inertia,
+        n_iter=n_iter,
+        restarts_finished=n_init - abandoned,
+        restarts_abandoned=abandoned,
+    )
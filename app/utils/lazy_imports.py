@@ -0,0 +1,37 @@
+import importlib
+import sys
+import threading
+import types
+from app.settings import LAZY_IMPORTS
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is first used."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lock = threading.Lock()
+        self._module: types.ModuleType | None = None
+
+    def _load(self) -> types.ModuleType:
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        # Only called for attributes the proxy itself does not have.
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    """Returns module name, imported now or on first use per SEGMENTATION_LAZY_IMPORTS.
+
+    Modules that are already imported are returned as they are.
+    """
+    if not LAZY_IMPORTS or name in sys.modules:
+        return importlib.import_module(name)
+    return LazyModule(name)
@@ -0,0 +1,79 @@
+import pandas as pd
+import numpy as np
+import logging
+import os
+from app.settings import JOB_MEMORY_BUDGET_MB
+
+
+def memory_bytes(obj) -> int:
+    """Returns the approximate in-memory size of a DataFrame, array or nested dict."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(memory_bytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(memory_bytes(v) for v in obj)
+    return 0
+
+
+def physical_memory() -> int:
+    """Total RAM of the host in bytes."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def memory_budget_bytes() -> int:
+    """Memory that running pipeline jobs may share; half of RAM unless configured."""
+    if JOB_MEMORY_BUDGET_MB > 0:
+        return JOB_MEMORY_BUDGET_MB * 1024**2
+    return physical_memory() // 2
+
+
+def log_memory(stage: str, obj) -> int:
+    """Logs and returns the memory held by a stage's output."""
+    size = memory_bytes(obj)
+    logging.info(f"{stage} output holds {size / 1024**2:.2f} MB.")
+    return size
+
+
+def to_arrow_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts object/string columns to Arrow-backed strings."""
+    string_cols = df.select_dtypes(include=["object", "string"]).columns
+    if len(string_cols) == 0:
+        return df
+    df = df.copy()
+    for col in string_cols:
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ("string", "empty"):
+            df[col] = df[col].astype("string[pyarrow]")
+    return df
+
+
+def sparse_columns(df: pd.DataFrame) -> list:
+    """Columns stored as pandas sparse arrays, such as one-hot encodings."""
+    return [c for c, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+
+
+def stored_shape(df: pd.DataFrame) -> tuple[int, int]:
+    """Rows and values stored per row; sparse columns count by their density.
+
+    Costs of stages that keep sparse columns sparse grow with this width,
+    not with the number of columns.
+    """
+    sparse = sparse_columns(df)
+    if not sparse:
+        return df.shape
+    stored = sum(df[c].sparse.density for c in sparse)
+    return len(df), df.shape[1] - len(sparse) + max(1, int(np.ceil(stored)))
+
+
+def smallest_int_codes(values) -> np.ndarray:
+    """Returns category codes in the smallest integer dtype that fits them."""
+    return pd.Categorical(values).codes
+
+
+def downcast_labels(labels: np.ndarray) -> np.ndarray:
+    """Stores cluster labels in the smallest signed integer dtype."""
+    return pd.to_numeric(pd.Series(labels), downcast="integer").to_numpy()
@@ -1,32 +1,87 @@
 import pandas as pd
-from sklearn.decomposition import PCA
+from scipy import sparse
+from sklearn.decomposition import PCA, TruncatedSVD
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import logging
+from app.utils.figure_utils import APP_TEMPLATE
+from app.utils.instrumentation import instrumented
+from app.utils.memory_utils import sparse_columns
 
+# Components a truncated SVD keeps for one-hot encoded data; a full
+# decomposition would have one per category.
+MAX_SVD_COMPONENTS = 50
 
-def perform_pca(df: pd.DataFrame) -> dict:
+
+def design_matrix(df: pd.DataFrame, dtype=np.float64) -> sparse.csr_matrix:
+    """The cleaned frame as a CSR matrix, dense columns first, then sparse ones.
+
+    Sparse columns go through COO to CSR without ever being densified.
+    """
+    one_hot = sparse_columns(df)
+    dense = df.drop(columns=one_hot).to_numpy(dtype=dtype)
+    blocks = [sparse.csr_matrix(dense)]
+    if one_hot:
+        blocks.append(df[one_hot].sparse.to_coo().astype(dtype))
+    return sparse.hstack(blocks, format="csr")
+
+
+@instrumented
+def perform_pca(
+    df: pd.DataFrame, compact: bool = False, sample_size: int | None = None
+) -> dict:
     """
     Performs PCA on the cleaned dataframe.
+    With compact=True the fit runs in float32 and returns float32 components.
+    With sample_size the components are fitted on a random subset of rows and
+    every row is then projected onto them. Frames with sparse one-hot columns
+    get a truncated SVD of up to MAX_SVD_COMPONENTS components instead.
+    At least two components are kept, as the cluster scatter plots PC1 and PC2.
     """
     if not isinstance(df, pd.DataFrame):
         raise TypeError("Input must be a pandas DataFrame.")
-    pca = PCA(random_state=42)
-    pca_transformed = pca.fit_transform(df)
+    if df.shape[1] < 2:
+        raise ValueError(
+            f"PCA needs at least two feature columns after cleaning, got "
+            f"{df.shape[1]}. Keep more columns in the cleaning step."
+        )
+    dtype = np.float32 if compact else np.float64
+    one_hot = sparse_columns(df)
+    if one_hot:
+        # Truncated SVD works on the sparse matrix directly; unlike PCA it
+        # does not centre the data, which would densify it. The scaled
+        # numeric columns are centred already.
+        features = [c for c in df.columns if c not in one_hot] + one_hot
+        data = design_matrix(df, dtype)
+        pca = TruncatedSVD(
+            n_components=min(MAX_SVD_COMPONENTS, max(2, data.shape[1] - 1)),
+            random_state=42,
+        )
+    else:
+        features = list(df.columns)
+        data = df.to_numpy(dtype=dtype)
+        pca = PCA(random_state=42)
+    if sample_size is not None and sample_size < data.shape[0]:
+        rng = np.random.default_rng(42)
+        pca.fit(data[rng.choice(data.shape[0], sample_size, replace=False)])
+        pca_transformed = pca.transform(data)
+    else:
+        pca_transformed = pca.fit_transform(data)
     explained_variance = pca.explained_variance_ratio_
     cumulative_variance = np.cumsum(explained_variance)
-    optimal_n_components = np.argmax(cumulative_variance >= 0.8) + 1
+    # A truncated SVD may keep too few components to reach the threshold.
+    optimal_n_components = (
+        np.argmax(cumulative_variance >= 0.8) + 1
+        if cumulative_variance[-1] >= 0.8
+        else len(cumulative_variance)
+    )
     scree_plot = px.bar(
         x=range(1, len(explained_variance) + 1),
         y=explained_variance,
         labels={"x": "Principal Component", "y": "Explained Variance"},
         title="Scree Plot",
-    )
-    scree_plot.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-        paper_bgcolor="rgba(0,0,0,0)",
-        font={"family": "Open Sans", "color": "#4A5568"},
+        template=APP_TEMPLATE,
     )
     cumulative_plot = go.Figure()
     cumulative_plot.add_trace(
@@ -47,16 +102,16 @@ def perform_pca(df: pd.DataFrame) -> dict:
         title="Cumulative Explained Variance",
         xaxis_title="Number of Components",
         yaxis_title="Cumulative Variance",
-        plot_bgcolor="rgba(0,0,0,0)",
-        paper_bgcolor="rgba(0,0,0,0)",
-        font={"family": "Open Sans", "color": "#4A5568"},
+        template=APP_TEMPLATE,
     )
     loadings = pd.DataFrame(
         pca.components_.T,
-        columns=[f"PC{i + 1}" for i in range(len(df.columns))],
-        index=df.columns,
+        columns=[f"PC{i + 1}" for i in range(len(pca.components_))],
+        index=features,
+    )
+    logging.info(
+        f"{type(pca).__name__} completed. Optimal components: {optimal_n_components}"
     )
-    logging.info(f"PCA completed. Optimal components: {optimal_n_components}")
     return {
         "transformed_data": pca_transformed,
         "explained_variance": explained_variance,
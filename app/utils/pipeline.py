@@ -0,0 +1,209 @@
+import logging
+import time
+from typing import Any, Callable
+import pandas as pd
+from app.utils.cleaning_utils import (
+    clean_data,
+    get_statistics,
+    create_correlation_heatmap,
+)
+from app.utils.clustering_utils import (
+    perform_hdbscan,
+    perform_kmeans,
+    perform_hierarchical,
+    create_cluster_scatter,
+    compute_cluster_profiles,
+)
+from app.utils.kmeans_engine import not_cancelled
+from app.utils.memory_utils import log_memory, stored_shape
+from app.utils.pca_utils import perform_pca
+from app.utils.planner import plan_clustering, plan_pca, run_plan
+from app.utils.schema_utils import apply_schema, profile_schema, recommended_actions
+
+# Categorical columns with more distinct values than this are not used as strata.
+MAX_STRATUM_CARDINALITY = 20
+CLUSTERING_ALGORITHMS = {
+    "kmeans": perform_kmeans,
+    "hierarchical": perform_hierarchical,
+    "hdbscan": perform_hdbscan,
+}
+
+
+def _no_checkpoint(name: str, compute: Callable[[], Any]) -> Any:
+    return compute()
+
+
+def stratified_sample(df: pd.DataFrame, size: int, seed: int = 42) -> pd.DataFrame:
+    """Samples about size rows, keeping the mix of the low-cardinality categoricals."""
+    if len(df) <= size:
+        return df
+    categorical = df.select_dtypes(include=["object", "category", "string"])
+    cardinality = categorical.nunique()
+    strata = cardinality[
+        (cardinality > 1) & (cardinality <= MAX_STRATUM_CARDINALITY)
+    ].nsmallest(2)
+    if strata.empty:
+        return df.sample(size, random_state=seed)
+    return df.groupby(list(strata.index), dropna=False, observed=True).sample(
+        frac=size / len(df), random_state=seed
+    )
+
+
+def run_cleaning(
+    raw_df: pd.DataFrame,
+    compact: bool = False,
+    build_figures: bool = True,
+    checkpoint: Callable[[str, Callable[[], Any]], Any] = _no_checkpoint,
+    column_actions: dict[str, str] | None = None,
+    encoding: str = "label",
+) -> dict:
+    """Cleans the raw data and computes before/after statistics.
+
+    column_actions names the columns to drop or transform before encoding
+    (see schema_utils.py); by default the schema profiler recommends them.
+    encoding is "label" or "onehot" (see clean_data).
+    """
+    if column_actions is None:
+        column_actions = recommended_actions(profile_schema(raw_df))
+    original_stats = checkpoint("original_stats", lambda: get_statistics(raw_df)[0])
+    cleaned_df, outliers_removed = checkpoint(
+        "cleaned",
+        lambda: clean_data(
+            apply_schema(raw_df, column_actions), compact=compact, encoding=encoding
+        ),
+    )
+    log_memory("Cleaning", cleaned_df)
+    cleaned_stats = checkpoint(
+        "cleaned_stats", lambda: get_statistics(cleaned_df, outliers_removed)[0]
+    )
+    return {
+        "original_stats": original_stats,
+        "cleaned_stats": cleaned_stats,
+        "cleaned_data": cleaned_df,
+        "correlation_heatmap": (
+            create_correlation_heatmap(cleaned_df) if build_figures else None
+        ),
+        "column_actions": column_actions,
+    }
+
+
+def run_pca(
+    cleaned_df: pd.DataFrame,
+    compact: bool = False,
+    time_budget: float | None = None,
+    checkpoint: Callable[[str, Callable[[], Any]], Any] = _no_checkpoint,
+) -> dict:
+    """Runs PCA with the strategy the planner picks for the data's shape."""
+    plan = plan_pca(*stored_shape(cleaned_df), compact, time_budget=time_budget)
+    pca_results, plan_report = checkpoint(
+        "pca", lambda: run_plan(plan, perform_pca, cleaned_df, compact=compact)
+    )
+    pca_results["plan"] = plan_report
+    log_memory("PCA", pca_results["transformed_data"])
+    return {
+        "pca_results": pca_results,
+        "transformed_data": pca_results["transformed_data"],
+    }
+
+
+def run_clustering(
+    pca_data,
+    algorithm: str,
+    n_clusters: int,
+    compact: bool = False,
+    build_figures: bool = True,
+    time_budget: float | None = None,
+    checkpoint: Callable[[str, Callable[[], Any]], Any] = _no_checkpoint,
+    check_cancelled: Callable[[], None] = not_cancelled,
+) -> dict:
+    """Clusters the PCA projection with the strategy the planner picks.
+
+    The planner chooses exact, sampled or mini-batch variants from the data
+    shape; its prediction and the measured cost are returned as "plan".
+    check_cancelled is passed to the clustering, which calls it between
+    k-means restarts and between the fit, score and figure steps.
+    """
+    plan = plan_clustering(
+        *pca_data.shape, algorithm, n_clusters, compact, time_budget=time_budget
+    )
+    perform = CLUSTERING_ALGORITHMS[algorithm]
+    start = time.perf_counter()
+    results, plan_report = checkpoint(
+        "clustering",
+        lambda: run_plan(
+            plan,
+            perform,
+            pca_data,
+            n_clusters,
+            compact=compact,
+            build_figures=build_figures,
+            check_cancelled=check_cancelled,
+        ),
+    )
+    seconds = time.perf_counter() - start
+    log_memory("Clustering", results["labels"])
+    return {
+        "algorithm": algorithm,
+        "n_clusters": n_clusters,
+        "results": results,
+        "labels": results["labels"],
+        "plan": plan_report,
+        "seconds": seconds,
+        "scatter_fig": (
+            checkpoint(
+                "scatter_fig",
+                lambda: create_cluster_scatter(pca_data, results["labels"]),
+            )
+            if build_figures
+            else None
+        ),
+    }
+
+
+def run_profiles(cleaned_df: pd.DataFrame, labels) -> dict:
+    """Summarises each cluster against the cleaned data."""
+    return {"profiles": compute_cluster_profiles(cleaned_df, labels)}
+
+
+def run_pipeline(
+    raw_df: pd.DataFrame,
+    algorithm: str,
+    n_clusters: int,
+    compact: bool = False,
+    build_figures: bool = True,
+    time_budget: float | None = None,
+    column_actions: dict[str, str] | None = None,
+    encoding: str = "label",
+) -> dict:
+    """Runs cleaning, PCA, clustering and profiling end to end.
+
+    Returns each stage's outputs under its stage name, in the same shape the
+    per-stage jobs produce.
+    """
+    start = time.perf_counter()
+    cleaning = run_cleaning(
+        raw_df,
+        compact,
+        build_figures,
+        column_actions=column_actions,
+        encoding=encoding,
+    )
+    pca = run_pca(cleaning["cleaned_data"], compact, time_budget)
+    clustering = run_clustering(
+        pca["transformed_data"],
+        algorithm,
+        n_clusters,
+        compact,
+        build_figures,
+        time_budget,
+    )
+    profiles = run_profiles(cleaning["cleaned_data"], clustering["labels"])
+    logging.info(
+        f"Pipeline on {len(raw_df):,} rows took {time.perf_counter() - start:.2f} s"
+    )
+    return {
+        "cleaning": cleaning,
+        "pca": pca,
+        "clustering": clustering,
+        "profiles": profiles,
+    }
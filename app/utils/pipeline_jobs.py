@@ -0,0 +1,165 @@
+from app.settings import DRAFT_SAMPLE_ROWS, DRAFT_TIME_BUDGET_SECONDS
+from app.utils.analytics_engine import cluster_profiles
+from app.utils.ingest_utils import merge_uploads, parse_uploads
+from app.utils.job_queue import JobContext, job_stage
+from app.utils.memory_utils import log_memory, to_arrow_strings
+from app.utils.pipeline import (
+    run_cleaning,
+    run_clustering,
+    run_pca,
+    run_pipeline,
+    run_profiles,
+    stratified_sample,
+)
+from app.utils.schema_utils import profile_schema
+from app.utils.similarity import build_similarity_index
+from app.utils.stability import bootstrap_stability
+from app.utils.transaction_utils import aggregate_transactions
+from app.utils.writeback import segment_assignments, write_segments
+
+
+@job_stage("ingest")
+def ingest_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Parses one or more uploaded CSV or XLSX files into a single dataset.
+
+    Several files are parsed in parallel and merged, with a source_file
+    column recording each row's file; the result is then profiled (see
+    schema_utils.py). inputs["paths"] are where the uploads were saved and
+    params["filenames"] the names they were uploaded under; params["sha256"]
+    lists their hashes, computed while they were received. params["sheet"]
+    picks the sheet of a workbook, by default the first. With
+    params["transactions"] the files hold one row per transaction and are
+    streamed into per-customer features instead (see transaction_utils.py).
+    """
+    paths, filenames = inputs["paths"], params["filenames"]
+    sheet = params.get("sheet") or None
+    if params.get("transactions"):
+        df = aggregate_transactions(paths, filenames, sheet)
+    else:
+        digests = params.get("sha256") or [None] * len(paths)
+        frames = parse_uploads(paths, filenames, digests, sheet)
+        df = frames[0] if len(frames) == 1 else merge_uploads(frames, filenames)
+        # The per-file frames are no longer needed once merged.
+        del frames
+    if params.get("compact"):
+        df = to_arrow_strings(df)
+    log_memory("Upload", df)
+    filename = filenames[0]
+    if len(filenames) > 1:
+        filename += f" and {len(filenames) - 1} more"
+    return {"raw_data": df, "filename": filename, "schema": profile_schema(df)}
+
+
+@job_stage("cleaning", datasets=("cleaned_data",))
+def cleaning_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Cleans the raw data and builds the statistics and correlation heatmap.
+
+    params["columns"] holds the chosen action per column, by default the
+    schema profiler's recommendations; params["encoding"] is "label" or
+    "onehot".
+    """
+    return run_cleaning(
+        inputs["raw_data"],
+        params.get("compact", False),
+        checkpoint=ctx.checkpoint,
+        column_actions=params.get("columns"),
+        encoding=params.get("encoding", "label"),
+    )
+
+
+@job_stage("pca")
+def pca_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Runs PCA on the cleaned data."""
+    return run_pca(
+        inputs["cleaned_data"], params.get("compact", False), checkpoint=ctx.checkpoint
+    )
+
+
+@job_stage("clustering", datasets=("labels",))
+def clustering_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Clusters the PCA projection and builds the scatter plot."""
+    return run_clustering(
+        inputs["transformed_data"],
+        params["algorithm"],
+        params["n_clusters"],
+        params.get("compact", False),
+        checkpoint=ctx.checkpoint,
+        check_cancelled=ctx.raise_if_cancelled,
+    )
+
+
+@job_stage("profiles")
+def profiles_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Summarises each cluster against the cleaned data.
+
+    With params["engine"] "duckdb" the inputs are the Parquet paths of the
+    cleaned data and labels, and the profiles are SQL over them.
+    """
+    if params.get("engine") == "duckdb":
+        return {"profiles": cluster_profiles(inputs["cleaned_data"], inputs["labels"])}
+    return run_profiles(inputs["cleaned_data"], inputs["labels"])
+
+
+@job_stage("stability")
+def stability_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Refits the clustering on subsamples to measure each segment's stability."""
+    return bootstrap_stability(
+        inputs["transformed_data"],
+        inputs["labels"],
+        params["algorithm"],
+        params["n_clusters"],
+        params.get("n_bootstraps"),
+        checkpoint=ctx.checkpoint,
+    )
+
+
+@job_stage("similarity_index")
+def similarity_index_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Indexes the PCA projection for similar-customer lookups."""
+    return {
+        "index": build_similarity_index(
+            inputs["transformed_data"],
+            inputs["labels"],
+            inputs["cleaned_data"].index.to_numpy(),
+        )
+    }
+
+
+@job_stage("writeback", cacheable=False)
+def writeback_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Bulk-loads each customer's segment into the write-back database.
+
+    params["run_id"] names the clustering run; loading the same run again
+    replaces its earlier rows. Returns the row count and throughput.
+    """
+    cleaned_data = inputs["cleaned_data"]
+    assignments = segment_assignments(
+        inputs["raw_data"],
+        inputs["schema"],
+        cleaned_data.index,
+        inputs["transformed_data"],
+        inputs["labels"],
+        inputs["results"].get("centroids"),
+    )
+    # Only the index was needed; free the frame before the load.
+    del cleaned_data, inputs["cleaned_data"]
+    return write_segments(assignments, params["run_id"], table_name=params["table"])
+
+
+@job_stage("draft")
+def draft_job(inputs: dict, params: dict, ctx: JobContext) -> dict:
+    """Runs the whole pipeline on a stratified sample for a quick preview."""
+    raw_data = inputs["raw_data"]
+    sample = stratified_sample(raw_data, params.get("sample_rows", DRAFT_SAMPLE_ROWS))
+    outputs = run_pipeline(
+        sample,
+        params["algorithm"],
+        params["n_clusters"],
+        params.get("compact", False),
+        time_budget=DRAFT_TIME_BUDGET_SECONDS,
+        column_actions=params.get("columns"),
+        encoding=params.get("encoding", "label"),
+    )
+    outputs["sample_rows"] = len(sample)
+    outputs["total_rows"] = len(raw_data)
+    return outputs
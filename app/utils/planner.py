@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+import numpy as np
+from sklearn.cluster import HDBSCAN, AgglomerativeClustering, MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.metrics import silhouette_score
+from sklearn.neighbors import KDTree
+from app.settings import PLANNER_CALIBRATION_FILE, PLANNER_TIME_BUDGET_SECONDS
+from app.utils.clustering_utils import HDBSCAN_MAX_DIMENSIONS
+from app.utils.instrumentation import PeakRSS
+from app.utils.kmeans_engine import parallel_kmeans, worker_count
+from app.utils.memory_utils import memory_budget_bytes
+
+SAMPLE_SIZES = [50_000, 20_000, 10_000, 5_000, 2_000]
+# sklearn computes silhouette distances in chunks of at most this many bytes.
+SILHOUETTE_WORKING_MEMORY = 1024**3
+# Lloyd iterations per k-means init; pessimistic for well-separated data.
+KMEANS_ITERATIONS = 30
+KMEANS_INITS = 10
+# Bump when calibrate() changes what a coefficient measures.
+CALIBRATION_VERSION = 3
+# A single job may plan for this share of the budget, leaving room for others.
+MEMORY_SHARE = 0.5
+
+_coefficients: dict[str, float] | None = None
+_coefficients_lock = threading.Lock()
+
+
+@dataclass
+class Plan:
+    """The strategy chosen for a stage and its predicted cost."""
+
+    stage: str
+    strategy: str
+    predicted_seconds: float
+    predicted_memory_bytes: int
+    kwargs: dict = field(default_factory=dict)
+
+    def report(self, seconds: float, memory_bytes: int) -> dict[str, str]:
+        """Predicted against actual cost, formatted for display."""
+        return {
+            "stage": self.stage,
+            "strategy": self.strategy,
+            "predicted_seconds": f"{self.predicted_seconds:.2f} s",
+            "actual_seconds": f"{seconds:.2f} s",
+            "predicted_memory": f"{self.predicted_memory_bytes / 1024**2:,.0f} MB",
+            "actual_memory": f"{max(memory_bytes, 0) / 1024**2:,.0f} MB",
+        }
+
+
+def _timed(fn: Callable[[], Any]) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def calibrate() -> dict[str, float]:
+    """Times small runs of each kernel and returns seconds per unit of work."""
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(20_000, 8))
+    small = data[:2_000]
+    n, d, k = len(data), data.shape[1], 8
+    seconds, kmeans = _timed(
+        lambda: parallel_kmeans(data, k, n_init=1, random_state=0, n_workers=1)
+    )
+    coefficients = {"kmeans": seconds / (n * k * d * kmeans.n_iter)}
+    seconds, _ = _timed(
+        lambda: MiniBatchKMeans(
+            n_clusters=k, n_init=3, batch_size=4096, random_state=0
+        ).fit(data)
+    )
+    coefficients["minibatch"] = seconds / (n * k * d)
+    seconds, _ = _timed(
+        lambda: AgglomerativeClustering(n_clusters=k, linkage="ward").fit(small)
+    )
+    coefficients["ward"] = seconds / (len(small) ** 2 * (d + 1))
+    labels = rng.integers(0, k, len(small))
+    seconds, _ = _timed(lambda: silhouette_score(small, labels))
+    coefficients["pairwise"] = seconds / (len(small) ** 2 * d)
+    seconds, _ = _timed(lambda: PCA(random_state=0).fit_transform(data))
+    coefficients["svd"] = seconds / (n * d * d)
+    seconds, _ = _timed(
+        lambda: HDBSCAN(min_cluster_size=50, min_samples=15, copy=True).fit(small)
+    )
+    coefficients["hdbscan"] = seconds / (len(small) ** 2 * d)
+    index = KDTree(small)
+    seconds, _ = _timed(lambda: index.query(data, k=1))
+    coefficients["neighbours"] = seconds / (n * d * np.log2(len(small)))
+    return coefficients
+
+
+def coefficients() -> dict[str, float]:
+    """Per-host cost coefficients, calibrated on first use and cached on disk."""
+    global _coefficients
+    with _coefficients_lock:
+        if _coefficients is not None:
+            return _coefficients
+        host = f"{platform.node()}/{os.cpu_count()}"
+        try:
+            with open(PLANNER_CALIBRATION_FILE) as f:
+                cached = json.load(f)
+            if (
+                cached.get("host") == host
+                and cached.get("version") == CALIBRATION_VERSION
+            ):
+                _coefficients = cached["coefficients"]
+                return _coefficients
+        except (OSError, ValueError, KeyError):
+            pass
+        _coefficients = calibrate()
+        logging.info(f"Calibrated planner cost model: {_coefficients}")
+        try:
+            if os.path.dirname(PLANNER_CALIBRATION_FILE):
+                os.makedirs(os.path.dirname(PLANNER_CALIBRATION_FILE), exist_ok=True)
+            with open(PLANNER_CALIBRATION_FILE, "w") as f:
+                json.dump(
+                    {
+                        "host": host,
+                        "version": CALIBRATION_VERSION,
+                        "coefficients": _coefficients,
+                    },
+                    f,
+                )
+        except OSError as e:
+            logging.warning(f"Could not cache planner calibration: {e}")
+        return _coefficients
+
+
+def _choose(
+    candidates: list[Plan],
+    time_budget: float | None,
+    memory_budget: int | None,
+) -> Plan:
+    """Picks the first (most exact) candidate within budget, else the cheapest."""
+    if time_budget is None:
+        time_budget = PLANNER_TIME_BUDGET_SECONDS
+    if memory_budget is None:
+        memory_budget = int(memory_budget_bytes() * MEMORY_SHARE)
+    for plan in candidates:
+        if (
+            plan.predicted_seconds <= time_budget
+            and plan.predicted_memory_bytes <= memory_budget
+        ):
+            return plan
+    fitting = [p for p in candidates if p.predicted_memory_bytes <= memory_budget]
+    if fitting:
+        return min(fitting, key=lambda p: p.predicted_seconds)
+    return min(candidates, key=lambda p: p.predicted_memory_bytes)
+
+
+def _samples(rows: int) -> list[int]:
+    return [size for size in SAMPLE_SIZES if size < rows]
+
+
+def plan_pca(
+    rows: int,
+    cols: int,
+    compact: bool = False,
+    time_budget: float | None = None,
+    memory_budget: int | None = None,
+) -> Plan:
+    """Chooses between a full PCA fit and a fit on sampled rows."""
+    c = coefficients()
+    itemsize = 4 if compact else 8
+    # The full SVD holds the input, its centred copy and U.
+    candidates = [
+        Plan(
+            "pca",
+            "Full SVD on all rows",
+            c["svd"] * rows * cols * cols,
+            rows * cols * itemsize * 3,
+        )
+    ]
+    for size in _samples(rows):
+        candidates.append(
+            Plan(
+                "pca",
+                f"SVD on {size:,} sampled rows, then project all rows",
+                c["svd"] * (size + rows) * cols * cols,
+                size * cols * itemsize * 3 + rows * cols * itemsize * 2,
+                {"sample_size": size},
+            )
+        )
+    return _choose(candidates, time_budget, memory_budget)
+
+
+def plan_clustering(
+    rows: int,
+    cols: int,
+    algorithm: str,
+    n_clusters: int,
+    compact: bool = False,
+    time_budget: float | None = None,
+    memory_budget: int | None = None,
+) -> Plan:
+    """Chooses the fit and silhouette strategies for a clustering run."""
+    c = coefficients()
+    data_bytes = rows * cols * (4 if compact else 8)
+    fits = []
+    if algorithm == "hdbscan":
+        # Prim's tree over the fitted rows is quadratic and runs twice: in
+        # HDBSCAN and for the condensed tree. The other rows are then looked
+        # up in a KD-tree of the fitted rows on every core. All of it works
+        # on at most HDBSCAN_MAX_DIMENSIONS leading components.
+        dims = min(cols, HDBSCAN_MAX_DIMENSIONS)
+        for size in [None] + _samples(rows):
+            m = size or rows
+            lookups = 0 if size is None else rows * np.log2(m) / (os.cpu_count() or 1)
+            fits.append(
+                (
+                    "HDBSCAN on all rows"
+                    if size is None
+                    else f"HDBSCAN on {m:,} sampled rows, nearest neighbour for the rest",
+                    {"sample_size": size} if size else {},
+                    2 * c["hdbscan"] * m * m * dims
+                    + c["neighbours"] * lookups * dims,
+                    data_bytes + m * dims * 8 * 4 + rows * 24,
+                )
+            )
+    elif algorithm == "hierarchical":
+        for size in [None] + _samples(rows):
+            m = size or rows
+            # Ward runs twice: AgglomerativeClustering and the dendrogram linkage.
+            fits.append(
+                (
+                    "Ward on all rows"
+                    if size is None
+                    else f"Ward on {m:,} sampled rows, nearest centroid for the rest",
+                    {"sample_size": size} if size else {},
+                    2 * c["ward"] * m * m * (cols + 1)
+                    + c["kmeans"] * rows * n_clusters * cols,
+                    int(m * (m - 1) // 2 * 8 * 1.5) + data_bytes,
+                )
+            )
+    else:
+        # Restarts run side by side over one shared copy of the data, each
+        # holding its labels and a sparse membership matrix.
+        workers = worker_count(KMEANS_INITS)
+        fits.append(
+            (
+                "k-means",
+                {},
+                c["kmeans"]
+                * -(-KMEANS_INITS // workers)
+                * KMEANS_ITERATIONS
+                * rows
+                * n_clusters
+                * cols,
+                data_bytes + rows * 8 + workers * rows * 24,
+            )
+        )
+        fits.append(
+            (
+                "Mini-batch k-means",
+                {"minibatch": True},
+                c["minibatch"] * rows * n_clusters * cols,
+                data_bytes * 2,
+            )
+        )
+    silhouettes = [
+        (
+            "exact silhouette",
+            {},
+            c["pairwise"] * rows * rows * cols,
+            min(rows * rows * 8, SILHOUETTE_WORKING_MEMORY),
+        )
+    ] + [
+        (
+            f"silhouette on {size:,} sampled rows",
+            {"silhouette_sample": size},
+            c["pairwise"] * size * size * cols,
+            min(size * size * 8, SILHOUETTE_WORKING_MEMORY),
+        )
+        for size in _samples(rows)
+    ]
+    candidates = [
+        Plan(
+            "clustering",
+            f"{fit_name}, {score_name}",
+            fit_seconds + score_seconds,
+            # The fit and the silhouette run one after the other.
+            max(fit_memory, data_bytes + score_memory),
+            {**fit_kwargs, **score_kwargs},
+        )
+        for fit_name, fit_kwargs, fit_seconds, fit_memory in fits
+        for score_name, score_kwargs, score_seconds, score_memory in silhouettes
+    ]
+    return _choose(candidates, time_budget, memory_budget)
+
+
+def run_plan(plan: Plan, fn: Callable, *args, **kwargs) -> tuple[Any, dict[str, str]]:
+    """Calls fn with the plan's options; returns its result and the cost report."""
+    logging.info(f"Running {plan.stage} as: {plan.strategy}")
+    start = time.perf_counter()
+    with PeakRSS() as rss:
+        result = fn(*args, **kwargs, **plan.kwargs)
+    return result, plan.report(time.perf_counter() - start, rss.peak - rss.start)
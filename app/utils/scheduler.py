@@ -0,0 +1,179 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable
+from app.settings import ANALYTICS_MEMORY_MB, STABILITY_BOOTSTRAPS
+from app.utils.lazy_imports import lazy_module
+
+# The cost models pull in scikit-learn; load them with the first estimate.
+planner = lazy_module("app.utils.planner")
+stability = lazy_module("app.utils.stability")
+
+
+class AdmissionError(RuntimeError):
+    """Raised when a job could never fit in the memory budget."""
+
+
+@dataclass(frozen=True)
+class JobCost:
+    memory_bytes: int
+    cpu_seconds: float
+
+
+def estimate_cost(
+    stage: str, rows: int, cols: int, params: dict, input_bytes: int = 0
+) -> JobCost:
+    """Rough peak memory and CPU time of a stage for a dataset of rows x cols.
+
+    PCA and clustering are costed by the planner for the strategy it will
+    pick. The other constants are deliberately pessimistic: they only have
+    to keep the process clear of the OOM killer.
+    """
+    cells = rows * cols
+    if stage == "ingest" and params.get("transactions"):
+        # Files stream through in blocks; the per-customer state they leave
+        # is smaller than the files themselves.
+        return JobCost(input_bytes * 2, input_bytes / 35e6)
+    if stage == "ingest":
+        # Parsing text into object columns takes several times the file size;
+        # merging several files holds the parsed frames and the merged copy.
+        merging = len(params.get("filenames", [])) > 1
+        return JobCost(input_bytes * (12 if merging else 8), input_bytes / 30e6)
+    if stage == "cleaning":
+        return JobCost(cells * 8 * 6, cells * 2e-7)
+    if stage in ("pca", "clustering"):
+        # Same cost model the job uses to pick its strategy, so the estimate
+        # matches what will actually run.
+        if stage == "pca":
+            plan = planner.plan_pca(rows, cols, params.get("compact", False))
+        else:
+            plan = planner.plan_clustering(
+                rows,
+                cols,
+                params.get("algorithm", "kmeans"),
+                params.get("n_clusters", 4),
+                params.get("compact", False),
+            )
+        return JobCost(plan.predicted_memory_bytes, plan.predicted_seconds)
+    if stage == "stability":
+        # Worker processes refit the algorithm on subsamples side by side,
+        # sharing one memory-mapped copy of the data.
+        algorithm = params.get("algorithm", "kmeans")
+        n_bootstraps = params.get("n_bootstraps") or STABILITY_BOOTSTRAPS
+        sample_rows = stability.subsample_rows(rows)
+        workers = stability.stability_workers(
+            n_bootstraps, sample_rows, cols, algorithm
+        )
+        per_worker = stability.bootstrap_memory(sample_rows, cols, algorithm)
+        fit = planner.plan_clustering(
+            sample_rows, cols, algorithm, params.get("n_clusters", 4)
+        )
+        return JobCost(
+            cells * 8 * 2 + workers * per_worker,
+            fit.predicted_seconds * -(-n_bootstraps // workers),
+        )
+    if stage == "similarity_index":
+        # The vectors are regrouped by inverted list in float32; training and
+        # assignment rank about four coarse centroids per square-root row.
+        return JobCost(cells * 4 * 3 + rows * 24, cells * 4 * rows**0.5 * 5e-10)
+    if stage == "profiles" and params.get("engine") == "duckdb":
+        # DuckDB streams the Parquet files and spills past its own limit.
+        memory = min(cells * 8 * 3, ANALYTICS_MEMORY_MB * 1024**2)
+        return JobCost(memory, cells * 2e-8)
+    if stage == "profiles":
+        return JobCost(cells * 8 * 3, cells * 1e-7)
+    if stage == "writeback":
+        # The raw upload is the largest input; the rows go out a batch at a
+        # time at a few hundred thousand per second.
+        return JobCost(cells * 8 * 2, rows * 4e-6)
+    return JobCost(cells * 8, cells * 1e-7)
+
+
+class FairScheduler:
+    """Admits jobs under a shared memory budget, round-robin across owners.
+
+    Each owner (a browser session) has its own FIFO of pending jobs. Owners
+    take turns, so one analyst queueing many large runs cannot starve the
+    others. If the next job in turn does not fit alongside the running ones
+    it waits for memory to free up rather than being overtaken by smaller
+    jobs, so large jobs are never starved either.
+    """
+
+    def __init__(self, memory_budget_bytes: int, max_running: int):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_running = max_running
+        self._pending: OrderedDict[str, deque] = OrderedDict()
+        self._running: dict[str, JobCost] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self, job_id: str, owner: str, cost: JobCost, start: Callable[[], None]
+    ):
+        """Queues a job; start is called once it is admitted."""
+        if cost.memory_bytes > self.memory_budget_bytes:
+            raise AdmissionError(
+                f"This step needs about {cost.memory_bytes / 1024**2:,.0f} MB, more "
+                f"than the {self.memory_budget_bytes / 1024**2:,.0f} MB budget. "
+                "Try a smaller file or KMeans instead of Hierarchical clustering."
+            )
+        with self._lock:
+            self._pending.setdefault(owner, deque()).append((job_id, cost, start))
+        self._admit()
+
+    def withdraw(self, job_id: str) -> bool:
+        """Removes a job that has not been admitted yet; False if it already runs."""
+        with self._lock:
+            for owner, jobs in self._pending.items():
+                for entry in jobs:
+                    if entry[0] == job_id:
+                        jobs.remove(entry)
+                        if not jobs:
+                            del self._pending[owner]
+                        return True
+        return False
+
+    def release(self, job_id: str):
+        """Frees a finished job's share of the budget and admits waiting jobs."""
+        with self._lock:
+            self._running.pop(job_id, None)
+        self._admit()
+
+    def _admit(self):
+        admitted = []
+        with self._lock:
+            while self._pending and len(self._running) < self.max_running:
+                owner, jobs = next(iter(self._pending.items()))
+                job_id, cost, start = jobs[0]
+                in_use = sum(c.memory_bytes for c in self._running.values())
+                if self._running and in_use + cost.memory_bytes > self.memory_budget_bytes:
+                    break
+                jobs.popleft()
+                if jobs:
+                    self._pending.move_to_end(owner)
+                else:
+                    del self._pending[owner]
+                self._running[job_id] = cost
+                admitted.append((job_id, cost, start))
+        for job_id, cost, start in admitted:
+            logging.info(
+                f"Admitted job {job_id} (~{cost.memory_bytes / 1024**2:.0f} MB, "
+                f"~{cost.cpu_seconds:.1f} s CPU)"
+            )
+            start()
+
+    def position(self, job_id: str) -> int:
+        """1-based place of a pending job in admission order, 0 once admitted."""
+        with self._lock:
+            queues = [list(jobs) for jobs in self._pending.values()]
+        order = [
+            jobs[turn][0]
+            for turn in range(max(map(len, queues), default=0))
+            for jobs in queues
+            if turn < len(jobs)
+        ]
+        return order.index(job_id) + 1 if job_id in order else 0
+
+    def memory_in_use(self) -> int:
+        with self._lock:
+            return sum(c.memory_bytes for c in self._running.values())
@@ -0,0 +1,158 @@
+import logging
+import re
+import time
+import numpy as np
+import pandas as pd
+from app.utils.instrumentation import instrumented
+
+# Type checks look at a random sample of this many rows.
+SCHEMA_SAMPLE_ROWS = 20000
+# Size of the k-minimum-values sketch behind the distinct counts; the
+# estimate's relative error is about 1 / sqrt(KMV_K), 3% here.
+KMV_K = 1024
+KMV_CHUNK_ROWS = 65536
+# A column whose values are nearly all distinct identifies rows.
+IDENTIFIER_DISTINCT_SHARE = 0.95
+# Text columns with more distinct values than this are high-cardinality.
+HIGH_CARDINALITY = 50
+# Share of a text sample that has to parse as dates for a date column.
+DATE_PARSE_SHARE = 0.95
+# Last words of a name that mark a numeric column as a key, not a measure.
+IDENTIFIER_WORDS = {"id", "key", "uuid", "guid", "number", "no", "num", "code"}
+
+# What cleaning does with a column: encode it as is, drop it, replace
+# values by their frequency, or turn dates into days before the latest one.
+ACTIONS = {
+    "identifier": ["exclude", "keep"],
+    "constant": ["exclude", "keep"],
+    "high_cardinality": ["frequency", "exclude", "keep"],
+    "date": ["days_since", "exclude"],
+    "numeric": ["keep", "exclude"],
+    "categorical": ["keep", "frequency", "exclude"],
+}
+
+
+def approx_distinct(column: pd.Series, k: int = KMV_K) -> int:
+    """Estimated number of distinct non-null values, by a k-minimum-values sketch.
+
+    Values are hashed uniformly into 64 bits and only the k smallest distinct
+    hashes are kept, chunk by chunk. If the k-th smallest lies at fraction u
+    of the hash range, the column has about (k - 1) / u distinct values.
+    """
+    column = column.dropna()
+    sketch = np.empty(0, dtype=np.uint64)
+    for start in range(0, len(column), KMV_CHUNK_ROWS):
+        hashes = pd.util.hash_pandas_object(
+            column.iloc[start : start + KMV_CHUNK_ROWS], index=False
+        ).to_numpy()
+        if len(sketch) == k:
+            hashes = hashes[hashes < sketch[-1]]
+        sketch = np.unique(np.concatenate([sketch, hashes]))[:k]
+    if len(sketch) < k:
+        return len(sketch)
+    return int((k - 1) / (float(sketch[-1]) / 2.0**64))
+
+
+def _last_word(name: str) -> str:
+    """Last word of a column name, lower-case: CustomerID and customer_id give id."""
+    words = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", name)
+    return words[-1].lower() if words else ""
+
+
+def _parses_as_dates(sample: pd.Series) -> bool:
+    values = sample.dropna()
+    if values.empty or not pd.api.types.is_string_dtype(values):
+        return False
+    # Numbers and short codes would parse as dates too.
+    values = values.astype(str)
+    if values.str.fullmatch(r"[\d.]+").mean() > 0.5 or values.str.len().min() < 6:
+        return False
+    parsed = pd.to_datetime(values, errors="coerce", format="mixed")
+    return parsed.notna().mean() >= DATE_PARSE_SHARE
+
+
+def _classify(name: str, column: pd.Series, sample: pd.Series, distinct: int) -> str:
+    present = int(column.notna().sum())
+    if distinct <= 1:
+        return "constant"
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return "date"
+    unique_rows = distinct >= IDENTIFIER_DISTINCT_SHARE * present
+    if pd.api.types.is_bool_dtype(column):
+        return "categorical"
+    if pd.api.types.is_numeric_dtype(column):
+        values = sample.dropna()
+        whole = bool((values == np.round(values)).all())
+        # Integer keys are either named like one or number the rows densely.
+        dense = whole and distinct >= 0.9 * (values.max() - values.min() + 1)
+        if unique_rows and whole and (_last_word(name) in IDENTIFIER_WORDS or dense):
+            return "identifier"
+        return "numeric"
+    if _parses_as_dates(sample):
+        return "date"
+    if unique_rows:
+        return "identifier"
+    if distinct > HIGH_CARDINALITY:
+        return "high_cardinality"
+    return "categorical"
+
+
+@instrumented
+def profile_schema(
+    df: pd.DataFrame, sample_rows: int = SCHEMA_SAMPLE_ROWS
+) -> list[dict]:
+    """Classifies each column before cleaning and recommends what to do with it.
+
+    Kinds are identifier, constant, date, high_cardinality, categorical and
+    numeric. Distinct counts are KMV estimates over the whole column; the
+    date and integer checks look at a row sample. Each profile lists the
+    actions that fit its kind, the recommended one first.
+    """
+    start = time.perf_counter()
+    sample = df.sample(sample_rows, random_state=42) if len(df) > sample_rows else df
+    profiles = []
+    for name in df.columns:
+        column = df[name]
+        distinct = approx_distinct(column)
+        kind = _classify(str(name), column, sample[name], distinct)
+        profiles.append(
+            {
+                "column": str(name),
+                "kind": kind,
+                "distinct": min(distinct, int(column.notna().sum())),
+                "missing_share": float(column.isna().mean()) if len(df) else 0.0,
+                "action": ACTIONS[kind][0],
+                "actions": ACTIONS[kind],
+            }
+        )
+    logging.info(
+        f"Profiled {len(profiles)} columns in {time.perf_counter() - start:.2f} s: "
+        + ", ".join(f"{p['column']} {p['kind']}" for p in profiles)
+    )
+    return profiles
+
+
+def recommended_actions(profiles: list[dict]) -> dict[str, str]:
+    return {p["column"]: p["action"] for p in profiles}
+
+
+@instrumented
+def apply_schema(df: pd.DataFrame, actions: dict[str, str]) -> pd.DataFrame:
+    """Drops or transforms columns as chosen; columns not in actions are kept."""
+    excluded = [c for c in df.columns if actions.get(str(c)) == "exclude"]
+    df = df.drop(columns=excluded)
+    for name in df.columns:
+        action = actions.get(str(name), "keep")
+        if action == "frequency":
+            shares = df[name].value_counts(normalize=True)
+            df[name] = df[name].map(shares).astype(np.float64)
+        elif action == "days_since":
+            dates = df[name]
+            if not pd.api.types.is_datetime64_any_dtype(dates):
+                dates = pd.to_datetime(
+                    dates.astype(str), errors="coerce", format="mixed"
+                )
+            df[name] = (dates.max() - dates).dt.total_seconds() / 86400
+    if excluded:
+        logging.info(f"Excluded before cleaning: {', '.join(map(str, excluded))}")
+    return df
@@ -0,0 +1,234 @@
+import logging
+import os
+import time
+from typing import Any, Callable
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from joblib import Parallel, delayed
+from app.settings import (
+    STABILITY_BOOTSTRAPS,
+    STABILITY_SAMPLE_ROWS,
+    STABILITY_WORKERS,
+)
+from app.utils.clustering_utils import NOISE_LABEL, fit_labels
+from app.utils.figure_utils import APP_TEMPLATE
+from app.utils.instrumentation import instrumented
+from app.utils.memory_utils import memory_budget_bytes
+
+# Each subsample holds this share of the rows, up to STABILITY_SAMPLE_ROWS.
+SUBSAMPLE_SHARE = 0.8
+# Hennig's rule of thumb for a segment's mean Jaccard similarity across
+# subsamples: above the first it is stable, below the second it dissolves.
+STABLE_JACCARD = 0.75
+DISSOLVED_JACCARD = 0.5
+# A customer is confidently assigned if it stays in its segment this often.
+CONFIDENT_CONSENSUS = 0.8
+# Interpreter and libraries of one worker process.
+WORKER_OVERHEAD_BYTES = 200 * 1024**2
+# A stability job may use this share of the memory budget.
+MEMORY_SHARE = 0.5
+
+
+def subsample_rows(rows: int, sample_rows: int | None = None) -> int:
+    """Rows in each subsample of a dataset with rows rows."""
+    limit = sample_rows or STABILITY_SAMPLE_ROWS
+    return max(2, min(limit, int(rows * SUBSAMPLE_SHARE)))
+
+
+def bootstrap_memory(sample_rows: int, cols: int, algorithm: str) -> int:
+    """Peak memory of one worker clustering a subsample."""
+    subsample = sample_rows * cols * 8 * 2
+    if algorithm == "hierarchical":
+        # Ward's condensed distance matrix and its working copy.
+        fit = int(sample_rows * (sample_rows - 1) // 2 * 8 * 1.5)
+    else:
+        fit = sample_rows * cols * 8 * 4
+    return WORKER_OVERHEAD_BYTES + subsample + fit
+
+
+def stability_workers(
+    n_bootstraps: int, sample_rows: int, cols: int, algorithm: str
+) -> int:
+    """Worker processes for the subsamples, as many as cores and memory allow."""
+    cores = STABILITY_WORKERS or os.cpu_count() or 1
+    by_memory = int(memory_budget_bytes() * MEMORY_SHARE) // bootstrap_memory(
+        sample_rows, cols, algorithm
+    )
+    return max(1, min(n_bootstraps, cores, by_memory))
+
+
+def _cluster_subsample(
+    data: np.ndarray, rows: np.ndarray, algorithm: str, n_clusters: int
+) -> np.ndarray:
+    """Labels of one subsample; runs in a worker process."""
+    return fit_labels(data[rows], algorithm, n_clusters, n_jobs=1).astype(np.int16)
+
+
+def _contingency(
+    reference: np.ndarray, labels: np.ndarray, n_reference: int
+) -> np.ndarray:
+    """Counts of rows per (reference cluster, subsample cluster); noise comes last."""
+    reference = np.where(reference == NOISE_LABEL, n_reference, reference)
+    n_labels = int(labels.max(initial=NOISE_LABEL)) + 1
+    labels = np.where(labels == NOISE_LABEL, n_labels, labels)
+    codes = reference.astype(np.int64) * (n_labels + 1) + labels
+    return np.bincount(codes, minlength=(n_reference + 1) * (n_labels + 1)).reshape(
+        n_reference + 1, n_labels + 1
+    )
+
+
+def _no_checkpoint(name: str, compute: Callable[[], Any]) -> Any:
+    return compute()
+
+
+@instrumented
+def bootstrap_stability(
+    data,
+    labels: np.ndarray,
+    algorithm: str,
+    n_clusters: int,
+    n_bootstraps: int | None = None,
+    sample_rows: int | None = None,
+    random_state: int = 42,
+    checkpoint: Callable[[str, Callable[[], Any]], Any] = _no_checkpoint,
+) -> dict:
+    """Measures how reproducible each segment is under resampling.
+
+    The algorithm is refitted on n_bootstraps random subsamples. Each
+    subsample cluster is matched to the reference segment it overlaps most:
+    a segment's Jaccard similarity to its best match, averaged over the
+    subsamples, is its stability. The co-assignment matrix gives, for two
+    segments, how often a pair of their customers lands in one subsample
+    cluster. Both come from a segments x clusters contingency table per
+    subsample, so memory grows with the rows, never with their pairs.
+
+    Subsamples run in worker processes that share one memory-mapped copy of
+    the data. Each batch of subsamples is checkpointed as it finishes, so a
+    cancelled job stops between batches and a restarted one resumes.
+    """
+    start = time.perf_counter()
+    data = np.ascontiguousarray(data, dtype=np.float64)
+    labels = np.asarray(labels)
+    n_bootstraps = n_bootstraps or STABILITY_BOOTSTRAPS
+    rows, cols = data.shape
+    sample_rows = subsample_rows(rows, sample_rows)
+    workers = stability_workers(n_bootstraps, sample_rows, cols, algorithm)
+    rng = np.random.default_rng(random_state)
+    subsamples = [
+        np.sort(rng.choice(rows, sample_rows, replace=False))
+        for _ in range(n_bootstraps)
+    ]
+    # Joblib memory-maps arrays this large once into shared memory; every
+    # worker reads the same pages instead of receiving its own copy.
+    fitted = []
+    with Parallel(
+        n_jobs=workers, backend="loky", max_nbytes="1M", mmap_mode="r"
+    ) as pool:
+        for batch in range(0, n_bootstraps, workers):
+            fitted += checkpoint(
+                f"stability-{batch}",
+                lambda: pool(
+                    delayed(_cluster_subsample)(data, sub, algorithm, n_clusters)
+                    for sub in subsamples[batch : batch + workers]
+                ),
+            )
+
+    segments = np.unique(labels[labels != NOISE_LABEL])
+    n_segments = len(segments)
+    reference = np.searchsorted(segments, labels)
+    reference[labels == NOISE_LABEL] = NOISE_LABEL
+    jaccard = np.zeros((n_bootstraps, n_segments))
+    pairs = np.zeros((n_segments, n_segments))
+    pair_counts = np.zeros((n_segments, n_segments))
+    stayed = np.zeros(rows, dtype=np.int32)
+    seen = np.zeros(rows, dtype=np.int32)
+    for b, (sub, sub_labels) in enumerate(zip(subsamples, fitted)):
+        sub_reference = reference[sub]
+        table = _contingency(sub_reference, sub_labels, n_segments)
+        segment_sizes = table[:-1].sum(axis=1)
+        cluster_sizes = table[:, :-1].sum(axis=0)
+        overlap = table[:-1, :-1]
+        union = segment_sizes[:, None] + cluster_sizes[None, :] - overlap
+        similarity = np.divide(
+            overlap, union, out=np.zeros(overlap.shape), where=union > 0
+        )
+        if similarity.shape[1]:
+            jaccard[b] = similarity.max(axis=1)
+            match = similarity.argmax(axis=1)
+            clustered = (sub_reference != NOISE_LABEL) & (sub_labels != NOISE_LABEL)
+            kept = np.zeros(len(sub), dtype=bool)
+            kept[clustered] = (
+                match[sub_reference[clustered]] == sub_labels[clustered]
+            )
+            stayed[sub] += kept
+        seen[sub] += sub_reference != NOISE_LABEL
+        # Pairs of customers from segments i and j that share a cluster.
+        together = overlap @ overlap.T.astype(np.float64)
+        together[np.diag_indices(n_segments)] -= overlap.sum(axis=1)
+        possible = np.outer(segment_sizes, segment_sizes).astype(np.float64)
+        possible[np.diag_indices(n_segments)] -= segment_sizes
+        pairs += together
+        pair_counts += possible
+
+    co_assignment = pd.DataFrame(
+        np.divide(pairs, pair_counts, out=np.zeros_like(pairs), where=pair_counts > 0),
+        index=segments.astype(str),
+        columns=segments.astype(str),
+    )
+    mean_jaccard = jaccard.mean(axis=0)
+    clusters = pd.DataFrame(
+        {
+            "size": pd.Series(labels).value_counts().reindex(segments).to_numpy(),
+            "jaccard_mean": mean_jaccard,
+            "jaccard_min": jaccard.min(axis=0),
+            "co_assignment": np.diag(co_assignment.to_numpy()),
+            "verdict": [
+                "Stable"
+                if j >= STABLE_JACCARD
+                else "Dissolves"
+                if j < DISSOLVED_JACCARD
+                else "Moderate"
+                for j in mean_jaccard
+            ],
+        },
+        index=segments.astype(str),
+    )
+    row_consensus = np.full(rows, np.nan, dtype=np.float32)
+    np.divide(stayed, seen, out=row_consensus, where=seen > 0)
+    confident_share = float(np.mean(row_consensus[seen > 0] >= CONFIDENT_CONSENSUS))
+    seconds = time.perf_counter() - start
+    logging.info(
+        f"Stability: {n_bootstraps} subsamples of {sample_rows:,} rows on "
+        f"{workers} workers in {seconds:.1f} s, mean Jaccard "
+        f"{float(mean_jaccard.mean()) if n_segments else 0.0:.3f}"
+    )
+    return {
+        "clusters": clusters,
+        "co_assignment": co_assignment,
+        "co_assignment_fig": create_co_assignment_heatmap(co_assignment),
+        "row_consensus": row_consensus,
+        "confident_share": confident_share,
+        "n_bootstraps": n_bootstraps,
+        "sample_rows": sample_rows,
+        "workers": workers,
+        "seconds": seconds,
+    }
+
+
+def create_co_assignment_heatmap(co_assignment: pd.DataFrame) -> go.Figure:
+    """How often customers of two segments share a cluster across subsamples."""
+    fig = px.imshow(
+        co_assignment,
+        text_auto=".2f",
+        aspect="auto",
+        color_continuous_scale="Blues",
+        zmin=0,
+        zmax=1,
+        labels={"x": "Segment", "y": "Segment", "color": "Co-assigned"},
+        title="Co-assignment Across Subsamples",
+        template=APP_TEMPLATE,
+    )
+    fig.update_layout(margin=dict(l=20, r=20, t=50, b=20))
+    return fig
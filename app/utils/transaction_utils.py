@@ -0,0 +1,321 @@
+import logging
+import os
+import re
+import time
+from typing import Iterator
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from app.utils.ingest_utils import xlsx_chunks
+from app.utils.instrumentation import instrumented
+
+# CSV files are parsed in blocks of this many bytes, about 400k transactions.
+TRANSACTION_BLOCK_BYTES = 16 * 1024**2
+TRANSACTION_CHUNK_ROWS = 200000
+# Header names recognised for each field, compared in lower case without
+# spaces, underscores or other punctuation.
+TRANSACTION_FIELDS = {
+    "customer": ["customerid", "customer", "custid", "clientid", "client", "accountid"],
+    "date": [
+        "date",
+        "transactiondate",
+        "txndate",
+        "bookingdate",
+        "timestamp",
+        "datetime",
+    ],
+    "amount": ["amount", "transactionamount", "txnamount", "value"],
+    "channel": ["channel", "transactionchannel", "txnchannel"],
+    "balance": ["balance", "accountbalance", "runningbalance", "balanceafter"],
+}
+REQUIRED_FIELDS = ["customer", "date", "amount"]
+NS_PER_DAY = 86400 * 10**9
+INT64_MAX = np.iinfo(np.int64).max
+# NaT as int64 nanoseconds.
+NAT = np.iinfo(np.int64).min
+
+
+def _normalise(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+def transaction_columns(columns: list[str]) -> dict[str, str]:
+    """Maps each transaction field to the column holding it.
+
+    Raises ValueError naming the accepted headers if a required field
+    (customer, date or amount) has no column.
+    """
+    by_name = {_normalise(column): column for column in columns}
+    found = {}
+    for field, names in TRANSACTION_FIELDS.items():
+        for name in names:
+            if name in by_name:
+                found[field] = by_name[name]
+                break
+    missing = [field for field in REQUIRED_FIELDS if field not in found]
+    if missing:
+        raise ValueError(
+            "Transaction files need columns for "
+            + "; ".join(
+                f"{field} (e.g. {', '.join(TRANSACTION_FIELDS[field][:3])})"
+                for field in missing
+            )
+        )
+    return found
+
+
+def _csv_chunks(path: str) -> Iterator[pd.DataFrame]:
+    """Streams a CSV as DataFrames of about TRANSACTION_BLOCK_BYTES each.
+
+    Only the transaction columns are converted. Their types are fixed up
+    front, since the streaming reader infers types from the first block only.
+    """
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    columns = transaction_columns(header)
+    types = {
+        field: pa.float64() if field in ("amount", "balance") else pa.string()
+        for field in columns
+    }
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=TRANSACTION_BLOCK_BYTES),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=list(columns.values()),
+            column_types={columns[field]: t for field, t in types.items()},
+            strings_can_be_null=True,
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def transaction_chunks(
+    path: str, filename: str, sheet: str | None = None
+) -> Iterator[pd.DataFrame]:
+    """Streams a transaction file from disk in chunks, whatever its format."""
+    if os.path.splitext(filename)[1].lower() == ".csv":
+        yield from _csv_chunks(path)
+    else:
+        _, _, chunks = xlsx_chunks(path, sheet, TRANSACTION_CHUNK_ROWS)
+        yield from chunks
+
+
+class TransactionAggregator:
+    """Per-customer features accumulated over chunks of transactions.
+
+    Each chunk is reduced with grouped sums, counts, minima and maxima and
+    folded into arrays holding one slot per customer, so memory grows with
+    the number of customers while a file of any length streams through.
+    The balance trend is a least-squares slope per customer, kept as the
+    running sums its closed form needs.
+    """
+
+    def __init__(self):
+        # Customer ids in slot order.
+        self._ids = pd.Index([], dtype=str)
+        self._channels: dict[str, int] = {}
+        # Column of each field and format of the dates in the current file.
+        self._columns: dict[str, str] = {}
+        self._date_format: str | None = None
+        self._customer_column = ""
+        self._has_balance = False
+        self._origin: int | None = None
+        self.transactions = 0
+        self.skipped = 0
+        self._count = np.zeros(0, dtype=np.int64)
+        self._amount = np.zeros(0)
+        self._first = np.zeros(0, dtype=np.int64)
+        self._last = np.zeros(0, dtype=np.int64)
+        self._channel_counts = np.zeros((0, 0), dtype=np.int64)
+        # Per customer: n, sum t, sum b, sum t^2 and sum t*b, t in days.
+        self._balance_sums = np.zeros((0, 5))
+        self._last_balance = np.zeros(0)
+        self._last_balance_at = np.zeros(0, dtype=np.int64)
+
+    def _grow(self, capacity: int):
+        """Makes room for capacity customers; new slots hold a customer not seen yet."""
+        fills = {
+            "_count": 0,
+            "_amount": 0.0,
+            "_first": INT64_MAX,
+            "_last": NAT,
+            "_channel_counts": 0,
+            "_balance_sums": 0.0,
+            "_last_balance": np.nan,
+            "_last_balance_at": NAT,
+        }
+        for name, fill in fills.items():
+            array = getattr(self, name)
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+
+    def _customer_codes(self, ids: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+        """Chunk-local group of each row and the customer slot of each group."""
+        local, uniques = pd.factorize(ids.astype(str))
+        # Numbered ids come back as floats from columns with gaps: 1042.0 is 1042.
+        uniques = pd.Index(uniques).str.replace(r"^(\d+)\.0$", r"\1", regex=True)
+        slots = self._ids.get_indexer(uniques)
+        new = slots < 0
+        if new.any():
+            # Appending rebuilds the lookup table, so only chunks that bring
+            # new customers pay for it.
+            self._ids = self._ids.append(pd.Index(pd.unique(uniques[new])))
+            slots[new] = self._ids.get_indexer(uniques[new])
+            if len(self._ids) > len(self._count):
+                self._grow(max(len(self._ids), 2 * len(self._count), 1024))
+        return local, slots
+
+    def _dates(self, values: pd.Series) -> np.ndarray:
+        """Nanosecond timestamps, NaT as the int64 minimum."""
+        if not pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype("string")
+            if self._date_format is None:
+                first = values.dropna()
+                if not first.empty:
+                    self._date_format = (
+                        pd.tseries.api.guess_datetime_format(first.iloc[0]) or "mixed"
+                    )
+            values = pd.to_datetime(
+                values, errors="coerce", format=self._date_format or "mixed"
+            )
+        if getattr(values.dt, "tz", None) is not None:
+            values = values.dt.tz_convert(None)
+        return values.astype("datetime64[ns]").to_numpy().view(np.int64)
+
+    def add_file(self, chunks: Iterator[pd.DataFrame]):
+        """Folds in a file's chunks; files may name and format columns differently."""
+        self._columns, self._date_format = {}, None
+        for chunk in chunks:
+            self.add(chunk)
+
+    def add(self, chunk: pd.DataFrame):
+        """Folds a chunk of transactions into the per-customer totals."""
+        if not self._columns:
+            self._columns = transaction_columns(chunk.columns.tolist())
+            self._customer_column = self._customer_column or self._columns["customer"]
+            self._has_balance |= "balance" in self._columns
+        columns = self._columns
+        dates = self._dates(chunk[columns["date"]])
+        ids = chunk[columns["customer"]]
+        valid = (dates != NAT) & ids.notna().to_numpy()
+        self.transactions += len(chunk)
+        self.skipped += int((~valid).sum())
+        if not valid.all():
+            chunk, dates = chunk[valid], dates[valid]
+        if chunk.empty:
+            return
+        if self._origin is None:
+            self._origin = int(dates.min())
+        local, slots = self._customer_codes(chunk[columns["customer"]])
+        groups = len(slots)
+        amounts = pd.to_numeric(chunk[columns["amount"]], errors="coerce").fillna(0.0)
+        self._count[slots] += np.bincount(local, minlength=groups)
+        self._amount[slots] += np.bincount(
+            local, weights=amounts.to_numpy(np.float64), minlength=groups
+        )
+        by_date = pd.Series(dates).groupby(local)
+        self._first[slots] = np.minimum(self._first[slots], by_date.min().to_numpy())
+        self._last[slots] = np.maximum(self._last[slots], by_date.max().to_numpy())
+        if "channel" in columns:
+            self._add_channels(chunk[columns["channel"]], local, slots)
+        if "balance" in columns:
+            self._add_balances(chunk[columns["balance"]], dates, local, slots)
+
+    def _add_channels(self, channels: pd.Series, local: np.ndarray, slots: np.ndarray):
+        codes, names = pd.factorize(channels.astype("string"))
+        channel_map = self._channels
+        chunk_to_global = np.array(
+            [channel_map.setdefault(str(n), len(channel_map)) for n in names],
+            dtype=np.int64,
+        )
+        width = len(channel_map)
+        if width > self._channel_counts.shape[1]:
+            grown = np.zeros((len(self._channel_counts), width), dtype=np.int64)
+            grown[:, : self._channel_counts.shape[1]] = self._channel_counts
+            self._channel_counts = grown
+        known = codes >= 0
+        cells = local[known] * width + chunk_to_global[codes[known]]
+        counts = np.bincount(cells, minlength=len(slots) * width)
+        self._channel_counts[slots] += counts.reshape(len(slots), width)
+
+    def _add_balances(
+        self,
+        balances: pd.Series,
+        dates: np.ndarray,
+        local: np.ndarray,
+        slots: np.ndarray,
+    ):
+        balances = pd.to_numeric(balances, errors="coerce").to_numpy(np.float64)
+        known = ~np.isnan(balances)
+        b, at, group = balances[known], dates[known], local[known]
+        t = (at - self._origin) / NS_PER_DAY
+        groups = len(slots)
+        for i, weights in enumerate((None, t, b, t * t, t * b)):
+            self._balance_sums[slots, i] += np.bincount(
+                group, weights=weights, minlength=groups
+            )
+        if not len(b):
+            return
+        latest = pd.Series(at).groupby(group).idxmax()
+        present = slots[latest.index.to_numpy()]
+        newer = at[latest.to_numpy()] >= self._last_balance_at[present]
+        rows = latest.to_numpy()[newer]
+        self._last_balance[present[newer]] = b[rows]
+        self._last_balance_at[present[newer]] = at[rows]
+
+    def result(self) -> pd.DataFrame:
+        """One row per customer: recency, frequency, monetary, channel mix, trend."""
+        size = len(self._ids)
+        if size == 0:
+            raise ValueError("The file has no transactions with a customer and date")
+        count = self._count[:size]
+        first, last = self._first[:size], self._last[:size]
+        as_of = last.max()
+        df = pd.DataFrame(
+            {
+                self._customer_column: pd.Series(self._ids, dtype="string"),
+                "recency_days": (as_of - last) / NS_PER_DAY,
+                "frequency": count,
+                "monetary": self._amount[:size],
+                "avg_amount": self._amount[:size] / count,
+                "tenure_days": (as_of - first) / NS_PER_DAY,
+            }
+        )
+        for name, code in self._channels.items():
+            counts = self._channel_counts[:size, code]
+            df[f"channel_share_{name}"] = counts / count
+        if self._has_balance:
+            n, st, sb, stt, stb = self._balance_sums[:size].T
+            with np.errstate(divide="ignore", invalid="ignore"):
+                slope = (n * stb - st * sb) / (n * stt - st * st)
+            df["last_balance"] = self._last_balance[:size]
+            # Change per 30 days; undefined for customers seen on one day only.
+            df["balance_trend"] = np.where(np.isfinite(slope), slope * 30, np.nan)
+        return df
+
+
+@instrumented
+def aggregate_transactions(
+    paths: list[str], filenames: list[str], sheet: str | None = None
+) -> pd.DataFrame:
+    """Streams transaction files into a customer table for clean_data.
+
+    filenames are the names the files at paths were uploaded under, which
+    give their format. Every file is read from disk in chunks and folded
+    into one TransactionAggregator, so a customer's transactions may be
+    spread across files. Rows without a customer or a parseable date are
+    skipped.
+    """
+    start = time.perf_counter()
+    aggregator = TransactionAggregator()
+    for path, filename in zip(paths, filenames):
+        aggregator.add_file(transaction_chunks(path, filename, sheet))
+    df = aggregator.result()
+    logging.info(
+        f"Aggregated {aggregator.transactions:,} transactions into {len(df):,} "
+        f"customers in {time.perf_counter() - start:.1f} s"
+        + (f"; skipped {aggregator.skipped:,} rows" if aggregator.skipped else "")
+    )
+    return df
@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from app.settings import UPLOAD_CACHE_DIR, UPLOAD_CACHE_MB
+
+
+class UploadCache:
+    """Parsed uploads on disk, keyed by a hash of the file's bytes.
+
+    Each entry is an uncompressed Arrow IPC file. A hit skips parsing but
+    still copies the data into a new, writable DataFrame. It also refreshes
+    the file's modification time, which orders eviction: once the entries
+    exceed max_bytes the least recently used are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.arrow")
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        """A copy of the cached frame for key, or None."""
+        path = self._path(key)
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            os.utime(path)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        logging.info(f"Upload cache hit for {key[:12]}")
+        return table.to_pandas()
+
+    def put(self, key: str, df: pd.DataFrame):
+        """Stores df under key and evicts old entries past the size limit."""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            feather.write_feather(df, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+        except (OSError, pa.ArrowException) as e:
+            # Columns Arrow cannot store are parsed again next time.
+            logging.warning(f"Could not cache upload {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".arrow"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                logging.info(f"Evicted {name} from the upload cache")
+
+
+_cache: UploadCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_upload_cache() -> UploadCache:
+    """Returns the process-wide upload cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = UploadCache(UPLOAD_CACHE_DIR, UPLOAD_CACHE_MB * 1024**2)
+        return _cache
@@ -0,0 +1,181 @@
+import io
+import logging
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from app.settings import WRITEBACK_BATCH_ROWS, WRITEBACK_TABLE, WRITEBACK_URL
+from app.utils.instrumentation import instrumented
+from app.utils.lazy_imports import lazy_module
+
+sa = lazy_module("sqlalchemy")
+
+WRITEBACK_COLUMNS = ("run_id", "customer_id", "cluster", "distance_to_centroid")
+
+# One pooled engine per database URL, shared by every write-back.
+_engines: dict = {}
+_engines_lock = threading.Lock()
+
+
+def customer_ids(raw_data: pd.DataFrame, schema: list[dict], index) -> np.ndarray:
+    """Each cleaned row's customer id, from the upload's first identifier column.
+
+    Uploads without one are numbered by row, as the cleaned data is.
+    """
+    columns = [p["column"] for p in schema if p["kind"] == "identifier"]
+    if not columns:
+        return pd.Index(index).astype(str).to_numpy(dtype=object)
+    ids = raw_data[columns[0]].loc[index]
+    # Integer ids read as floats because some are missing: 142.0 is 142.
+    if pd.api.types.is_float_dtype(ids) and (ids.dropna() % 1 == 0).all():
+        ids = ids.astype("Int64")
+    return ids.astype("string").to_numpy(dtype=object, na_value=None)
+
+
+def distances_to_centroids(points, labels, centroids=None) -> np.ndarray:
+    """Euclidean distance of each row to its cluster's centroid in the PCA space.
+
+    Algorithms without centroids (Ward, HDBSCAN) use the mean of the members;
+    HDBSCAN's noise points (label -1) have no distance.
+    """
+    points = np.asarray(points)
+    labels = np.asarray(labels, dtype=np.int64)
+    clustered = labels >= 0
+    if centroids is None:
+        means = pd.DataFrame(points[clustered]).groupby(labels[clustered]).mean()
+        centroids = means.reindex(range(labels.max() + 1)).to_numpy()
+    distances = np.full(len(labels), np.nan)
+    offsets = points[clustered] - np.asarray(centroids)[labels[clustered]]
+    distances[clustered] = np.linalg.norm(offsets, axis=1)
+    return distances
+
+
+@instrumented
+def segment_assignments(
+    raw_data: pd.DataFrame,
+    schema: list[dict],
+    index,
+    points,
+    labels,
+    centroids=None,
+) -> pd.DataFrame:
+    """customer_id, cluster and distance_to_centroid for every clustered row."""
+    return pd.DataFrame(
+        {
+            "customer_id": customer_ids(raw_data, schema, index),
+            "cluster": np.asarray(labels, dtype=np.int64),
+            "distance_to_centroid": distances_to_centroids(points, labels, centroids),
+        }
+    )
+
+
+def get_engine(url: str = WRITEBACK_URL):
+    """The pooled engine for a database URL, created on first use."""
+    with _engines_lock:
+        if url not in _engines:
+            parsed = sa.make_url(url)
+            if parsed.get_backend_name() == "sqlite" and parsed.database not in (
+                None,
+                "",
+                ":memory:",
+            ):
+                directory = os.path.dirname(os.path.abspath(parsed.database))
+                os.makedirs(directory, exist_ok=True)
+            _engines[url] = sa.create_engine(url, pool_pre_ping=True)
+        return _engines[url]
+
+
+def display_url(url: str = WRITEBACK_URL) -> str:
+    """The database URL with any password masked, for logs and job params."""
+    return sa.make_url(url).render_as_string(hide_password=True)
+
+
+def segments_table(name: str = WRITEBACK_TABLE):
+    return sa.Table(
+        name,
+        sa.MetaData(),
+        sa.Column("run_id", sa.String(64), nullable=False, index=True),
+        sa.Column("customer_id", sa.String),
+        sa.Column("cluster", sa.Integer, nullable=False),
+        sa.Column("distance_to_centroid", sa.Float),
+    )
+
+
+def _batch_rows(batch: pd.DataFrame, run_id: str, positional: bool) -> list:
+    distance = batch["distance_to_centroid"].to_numpy()
+    rows = zip(
+        [run_id] * len(batch),
+        batch["customer_id"].tolist(),
+        batch["cluster"].tolist(),
+        np.where(np.isnan(distance), None, distance).tolist(),
+    )
+    if positional:
+        return list(rows)
+    return [dict(zip(WRITEBACK_COLUMNS, row)) for row in rows]
+
+
+def _copy_batch(conn, table, batch: pd.DataFrame, run_id: str):
+    """Streams a batch into PostgreSQL with COPY, through the driver's own API."""
+    buffer = io.StringIO()
+    batch.assign(run_id=run_id)[list(WRITEBACK_COLUMNS)].to_csv(
+        buffer, index=False, header=False
+    )
+    name = conn.dialect.identifier_preparer.format_table(table)
+    sql = f"COPY {name} ({', '.join(WRITEBACK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, "copy"):  # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:  # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+@instrumented
+def write_segments(
+    assignments: pd.DataFrame,
+    run_id: str,
+    url: str = WRITEBACK_URL,
+    table_name: str = WRITEBACK_TABLE,
+    batch_rows: int = WRITEBACK_BATCH_ROWS,
+) -> dict:
+    """Bulk-loads one run's segment assignments into the write-back table.
+
+    Rows an earlier load of the same run left are deleted in the same
+    transaction, so loading a run twice leaves one copy and readers never
+    see a partial load. PostgreSQL (psycopg) receives each batch through
+    COPY, other databases through executemany.
+    """
+    engine = get_engine(url)
+    table = segments_table(table_name)
+    table.metadata.create_all(engine)
+    copy = engine.dialect.name == "postgresql" and engine.driver.startswith("psycopg")
+    insert = str(table.insert().compile(dialect=engine.dialect))
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.run_id == run_id))
+        for offset in range(0, len(assignments), batch_rows):
+            batch = assignments.iloc[offset : offset + batch_rows]
+            if copy:
+                _copy_batch(conn, table, batch, run_id)
+            else:
+                rows = _batch_rows(batch, run_id, engine.dialect.positional)
+                conn.exec_driver_sql(insert, rows)
+    seconds = time.perf_counter() - start
+    rate = len(assignments) / seconds if seconds else 0.0
+    logging.info(
+        f"Wrote {len(assignments):,} segment rows of run {run_id} to {table_name} "
+        f"in {seconds:.2f} s ({rate:,.0f} rows/s)"
+    )
+    return {
+        "run_id": run_id,
+        "table": table_name,
+        "target": display_url(url),
+        "rows": len(assignments),
+        "seconds": seconds,
+        "rows_per_second": rate,
+    }
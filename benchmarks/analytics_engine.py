@@ -0,0 +1,88 @@
+"""Cluster profiles and exports: DuckDB over Parquet vs pandas in memory.
+
+Writes seeded customers and random cluster labels to Parquet the way the
+job queue does, then profiles them with cluster_profiles (SQL) and with
+read_parquet plus compute_cluster_profiles, reporting time and peak RSS
+growth of each and checking that sizes, means and quartiles agree. The
+CSV export of one cluster is timed the same way.
+
+    python -m benchmarks.analytics_engine --rows 5000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.utils.analytics_engine import (
+    cluster_profiles,
+    duckdb_enabled,
+    export_clustered_csv,
+    write_parquet,
+)
+from app.utils.clustering_utils import compute_cluster_profiles
+from app.utils.instrumentation import PeakRSS
+from benchmarks.synthetic_data import generate_customers
+
+
+def pandas_export(data_path: str, labels_path: str, cluster: int, path: str):
+    df = pd.read_parquet(data_path)
+    df["cluster"] = pd.read_parquet(labels_path)["labels"].to_numpy()
+    df[df["cluster"] == cluster].to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--clusters", type=int, default=5)
+    args = parser.parse_args()
+    if not duckdb_enabled():
+        raise SystemExit("DuckDB is not installed or SEGMENTATION_ANALYTICS_ENGINE")
+
+    directory = tempfile.mkdtemp()
+    data_path = os.path.join(directory, "cleaned_data.parquet")
+    labels_path = os.path.join(directory, "labels.parquet")
+    df = generate_customers(args.rows).select_dtypes(include=np.number)
+    labels = np.random.default_rng(0).integers(0, args.clusters, args.rows)
+    write_parquet(df, data_path)
+    write_parquet(labels, labels_path, "labels")
+    del df
+    print(f"{args.rows:,} rows, {os.path.getsize(data_path) / 1024**2:.0f} MB Parquet")
+
+    runs = {
+        "duckdb profiles": lambda: cluster_profiles(data_path, labels_path),
+        "pandas profiles": lambda: compute_cluster_profiles(
+            pd.read_parquet(data_path), pd.read_parquet(labels_path)["labels"]
+        ),
+        "duckdb export": lambda: export_clustered_csv(data_path, labels_path, [0]),
+        "pandas export": lambda: pandas_export(
+            data_path, labels_path, 0, os.path.join(directory, "pandas.csv")
+        ),
+    }
+    results = {}
+    for name, fn in runs.items():
+        start = time.perf_counter()
+        with PeakRSS() as rss:
+            results[name] = fn()
+        seconds = time.perf_counter() - start
+        print(f"{name:<18}{seconds:>8.2f} s{rss.delta_mb:>10.0f} MB peak")
+
+    duck, pand = results["duckdb profiles"], results["pandas profiles"]
+    same = all(
+        duck[k]["size"] == pand[k]["size"]
+        and np.allclose(
+            list(duck[k]["feature_means"].values()),
+            list(pand[k]["feature_means"].values()),
+        )
+        and duck[k]["feature_quartiles"] == pand[k]["feature_quartiles"]
+        for k in pand
+        if k not in ("summary_df", "feature_names")
+    )
+    print("Profiles agree." if same else "Profiles differ.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Batch runs: the UI's pipeline with figures vs the headless batch runner.
+
+Writes several seeded customer files, runs run_pipeline with figures on
+each in turn (what the web app does per upload), then run_batch on all of
+them with one worker and with as many workers as cores and memory allow,
+reporting the wall time of each.
+
+    python -m benchmarks.batch --files 8 --rows 50000 --algorithm hierarchical
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from app.utils.batch import batch_workers, load_config, run_batch
+from app.utils.pipeline import run_pipeline
+from benchmarks.synthetic_data import generate_customers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--algorithm", default="kmeans")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    paths = []
+    for i in range(args.files):
+        path = os.path.join(directory, f"customers_{i}.csv")
+        generate_customers(args.rows, seed=i).to_csv(path, index=False)
+        paths.append(path)
+    config = {**load_config(), "algorithm": args.algorithm}
+    workers = batch_workers([os.path.getsize(p) for p in paths])
+    print(f"{args.files} files of {args.rows:,} rows, {os.cpu_count()} cores")
+
+    start = time.perf_counter()
+    for path in paths:
+        run_pipeline(pd.read_csv(path), args.algorithm, config["n_clusters"])
+    print(f"{'pipeline with figures':<28}{time.perf_counter() - start:>8.1f} s")
+    for n in sorted({1, workers}):
+        start = time.perf_counter()
+        output = os.path.join(directory, f"output_{n}")
+        report = run_batch(paths, config, output, workers=n)
+        failed = sum(1 for row in report if row["error"])
+        label = f"run_batch, {n} worker{'s' if n > 1 else ''}"
+        print(f"{label:<28}{time.perf_counter() - start:>8.1f} s  {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Memory per stage with and without compact-memory mode.
+
+Runs the pipeline twice on the same reference dataset, reports the memory held
+by each stage's output and checks that cluster assignments are unchanged.
+
+    python -m benchmarks.compact_memory --rows 20000
+"""
+
+import argparse
+import sys
+
+from sklearn.metrics import adjusted_rand_score
+
+from app.utils.cleaning_utils import clean_data
+from app.utils.clustering_utils import perform_hierarchical, perform_kmeans
+from app.utils.memory_utils import memory_bytes, to_arrow_strings
+from app.utils.pca_utils import perform_pca
+from benchmarks.synthetic_data import generate_customers
+
+HIERARCHICAL_MAX_ROWS = 10000
+
+
+def run(raw, n_clusters: int, compact: bool) -> tuple[dict, dict]:
+    if compact:
+        raw = to_arrow_strings(raw)
+    cleaned, _ = clean_data(raw, compact=compact)
+    pca = perform_pca(cleaned, compact=compact)
+    data = pca["transformed_data"]
+    labels = {"kmeans": perform_kmeans(data, n_clusters, compact=compact)["labels"]}
+    if len(data) <= HIERARCHICAL_MAX_ROWS:
+        labels["hierarchical"] = perform_hierarchical(
+            data, n_clusters, compact=compact
+        )["labels"]
+    memory = {
+        "raw_data": memory_bytes(raw),
+        "cleaned_data": memory_bytes(cleaned),
+        "pca_transformed": memory_bytes(data),
+        "labels": memory_bytes(labels["kmeans"]),
+    }
+    return memory, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--clusters", type=int, default=4)
+    args = parser.parse_args()
+
+    raw = generate_customers(args.rows)
+    default_memory, default_labels = run(raw, args.clusters, compact=False)
+    compact_memory, compact_labels = run(raw, args.clusters, compact=True)
+
+    print(f"{'stage':<18}{'default (MB)':>14}{'compact (MB)':>14}")
+    for stage, size in default_memory.items():
+        print(f"{stage:<18}{size / 1024**2:>14.3f}{compact_memory[stage] / 1024**2:>14.3f}")
+    unchanged = True
+    for algo, labels in default_labels.items():
+        ari = adjusted_rand_score(labels, compact_labels[algo])
+        unchanged &= ari == 1.0
+        print(f"{algo} assignments ARI vs default: {ari:.6f}")
+    sys.exit(0 if unchanged else 1)
+
+
+if __name__ == "__main__":
+    main()
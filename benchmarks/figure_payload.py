@@ -0,0 +1,56 @@
+"""Serialized figure size and CPU: plotly's JSON vs the compact typed-array transport.
+
+    python -m benchmarks.figure_payload --rows 5000
+"""
+
+import argparse
+import json
+import time
+
+from plotly.io import to_json
+
+from app.utils.cleaning_utils import clean_data, create_correlation_heatmap
+from app.utils.clustering_utils import create_cluster_scatter, perform_hierarchical
+from app.utils.figure_utils import compact_figure_json
+from app.utils.pca_utils import perform_pca
+from benchmarks.synthetic_data import generate_customers
+
+
+def time_call(fn, repeat: int) -> tuple[str, float]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        payload = json.dumps(fn())
+    return payload, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--clusters", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cleaned, _ = clean_data(generate_customers(args.rows))
+    pca = perform_pca(cleaned)
+    hierarchical = perform_hierarchical(pca["transformed_data"], args.clusters)
+    figures = {
+        "correlation_heatmap": create_correlation_heatmap(cleaned),
+        "scree_plot": pca["scree_plot"],
+        "cumulative_variance_plot": pca["cumulative_variance_plot"],
+        "cluster_scatter_fig": create_cluster_scatter(
+            pca["transformed_data"], hierarchical["labels"]
+        ),
+        "dendrogram_fig": hierarchical["dendrogram_fig"],
+    }
+    print(f"{'figure':<26}{'plotly (B)':>12}{'compact (B)':>13}{'plotly ms':>11}{'compact ms':>12}")
+    for name, fig in figures.items():
+        plain, plain_s = time_call(lambda: json.loads(to_json(fig)), args.repeat)
+        compact, compact_s = time_call(lambda: compact_figure_json(fig), args.repeat)
+        print(
+            f"{name:<26}{len(plain):>12}{len(compact):>13}"
+            f"{plain_s * 1000:>11.1f}{compact_s * 1000:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Wall time and quality of parallel k-means restarts against scikit-learn.
+
+Clusters the PCA projection of a reference dataset with KMeans(n_init=10)
+and with the parallel engine at each --workers count of worker processes,
+reporting wall time, inertia relative to scikit-learn and how many restarts
+were abandoned early. With several workers a restart is abandoned against
+the best inertia any worker has reached, so the count should stay close to
+the single-worker one. Exits non-zero if any run's inertia is over 0.5% worse.
+
+    python -m benchmarks.kmeans_restarts --rows 200000 --clusters 6 --workers 1,4,8
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from sklearn.cluster import KMeans
+from sklearn.metrics import adjusted_rand_score
+
+from app.utils.cleaning_utils import clean_data
+from app.utils.kmeans_engine import parallel_kmeans
+from app.utils.pca_utils import perform_pca
+from benchmarks.synthetic_data import generate_customers
+
+MAX_INERTIA_RATIO = 1.005
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--clusters", type=int, default=6)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    cleaned, _ = clean_data(generate_customers(args.rows))
+    data = perform_pca(cleaned)["transformed_data"]
+    start = time.perf_counter()
+    reference = KMeans(n_clusters=args.clusters, n_init=10, random_state=42).fit(data)
+    reference_seconds = time.perf_counter() - start
+
+    print(f"{'engine':<22}{'seconds':>9}{'inertia ratio':>15}{'ARI':>8}{'abandoned':>11}")
+    print(f"{'scikit-learn KMeans':<22}{reference_seconds:>9.2f}{1:>15.4f}{1:>8.3f}{'-':>11}")
+    ok = True
+    for workers in (int(w) for w in args.workers.split(",")):
+        start = time.perf_counter()
+        result = parallel_kmeans(data, args.clusters, n_workers=workers)
+        seconds = time.perf_counter() - start
+        ratio = result.inertia / reference.inertia_
+        ok &= ratio <= MAX_INERTIA_RATIO
+        ari = adjusted_rand_score(reference.labels_, result.labels)
+        print(
+            f"{f'parallel, {workers} workers':<22}{seconds:>9.2f}{ratio:>15.4f}"
+            f"{ari:>8.3f}{result.restarts_abandoned:>11}"
+        )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
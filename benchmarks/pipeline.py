@@ -0,0 +1,247 @@
+"""Times each pipeline stage on synthetic banking data and compares to a baseline.
+
+    python -m benchmarks.pipeline --sizes 10k,100k,1M,10M
+    python -m benchmarks.pipeline --sizes 10k,100k --save-baseline
+    python -m benchmarks.pipeline --sizes 10k,100k --ci
+
+Baselines are machine-specific, so none is committed: save one on the
+machine that runs the comparison. With --ci (or the CI environment variable
+set) a missing baseline, or one without a measured stage, fails the run
+instead of passing unchecked.
+
+Hierarchical clustering and the dendrogram are O(n^2) in memory; sizes above
+--hierarchical-max-rows are recorded as skipped rather than run. The exact
+silhouette score in perform_kmeans is also quadratic in rows, so the 1M and
+10M sizes take a long time.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import scipy
+import sklearn
+from scipy.cluster.hierarchy import linkage
+
+from app.utils.cleaning_utils import clean_data
+from app.utils.clustering_utils import (
+    compute_cluster_profiles,
+    create_dendrogram,
+    perform_hierarchical,
+    perform_kmeans,
+)
+from app.utils.instrumentation import PeakRSS
+from app.utils.pca_utils import perform_pca
+from benchmarks.synthetic_data import generate_customers
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    if value[-1] in _SUFFIXES:
+        return int(float(value[:-1]) * _SUFFIXES[value[-1]])
+    return int(value)
+
+
+def run_stage(name: str, rows: int, fn, *args) -> tuple[object, dict]:
+    record = {"stage": name, "rows": rows, "status": "ok"}
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    result = None
+    with PeakRSS() as rss:
+        try:
+            result = fn(*args)
+        except Exception as e:
+            record.update(status="error", error=str(e))
+    record.update(
+        seconds=round(time.perf_counter() - wall_start, 4),
+        cpu_seconds=round(time.process_time() - cpu_start, 4),
+        peak_rss_mb=round(rss.delta_mb, 2),
+    )
+    return result, record
+
+
+def skipped(name: str, rows: int, reason: str) -> dict:
+    return {"stage": name, "rows": rows, "status": "skipped", "reason": reason}
+
+
+def rows_out(result) -> int | None:
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, (pd.DataFrame, np.ndarray)):
+        return len(result)
+    if isinstance(result, dict) and "labels" in result:
+        return len(result["labels"])
+    if isinstance(result, dict) and "transformed_data" in result:
+        return len(result["transformed_data"])
+    return None
+
+
+def benchmark_size(rows: int, args) -> list[dict]:
+    records = []
+    raw = generate_customers(rows, seed=args.seed)
+
+    def record(name, fn, *fn_args):
+        result, entry = run_stage(name, rows, fn, *fn_args)
+        entry["rows_out"] = rows_out(result)
+        records.append(entry)
+        print(
+            f"{rows:>10} {name:<26} {entry['status']:<8} "
+            f"{entry['seconds']:>9.3f}s {entry['peak_rss_mb']:>9.1f}MB",
+            flush=True,
+        )
+        return result if entry["status"] == "ok" else None
+
+    cleaned = record("clean_data", clean_data, raw)
+    if cleaned is None:
+        return records
+    cleaned_df, _ = cleaned
+    pca = record("perform_pca", perform_pca, cleaned_df)
+    if pca is None:
+        return records
+    data = pca["transformed_data"]
+    kmeans = record("perform_kmeans", perform_kmeans, data, args.clusters)
+    if kmeans is not None:
+        record(
+            "compute_cluster_profiles",
+            compute_cluster_profiles,
+            cleaned_df,
+            kmeans["labels"],
+        )
+    if len(data) <= args.hierarchical_max_rows:
+        record("perform_hierarchical", perform_hierarchical, data, args.clusters)
+        record("create_dendrogram", create_dendrogram, linkage(data, "ward"))
+    else:
+        reason = f"rows > --hierarchical-max-rows ({args.hierarchical_max_rows})"
+        for name in ("perform_hierarchical", "create_dendrogram"):
+            records.append(skipped(name, rows, reason))
+            print(f"{rows:>10} {name:<26} skipped", flush=True)
+    return records
+
+
+def unmatched(results: list[dict], baseline: list[dict]) -> list[dict]:
+    """Returns the measured stages the baseline has no successful run of."""
+    previous = {(r["rows"], r["stage"]) for r in baseline if r["status"] == "ok"}
+    return [
+        r
+        for r in results
+        if r["status"] == "ok" and (r["rows"], r["stage"]) not in previous
+    ]
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    """Returns the stages whose time or memory regressed beyond tolerance."""
+    previous = {(r["rows"], r["stage"]): r for r in baseline if r["status"] == "ok"}
+    regressions = []
+    for current in results:
+        before = previous.get((current["rows"], current["stage"]))
+        if current["status"] != "ok" or before is None:
+            continue
+        for metric in ("seconds", "peak_rss_mb"):
+            if before[metric] <= 0:
+                continue
+            ratio = current[metric] / before[metric]
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    {
+                        "rows": current["rows"],
+                        "stage": current["stage"],
+                        "metric": metric,
+                        "baseline": before[metric],
+                        "current": current[metric],
+                        "ratio": round(ratio, 2),
+                    }
+                )
+    return regressions
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scikit-learn": sklearn.__version__,
+        "scipy": scipy.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10k,100k,1M,10M")
+    parser.add_argument("--clusters", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--hierarchical-max-rows", type=int, default=20000)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown or memory growth vs baseline (0.25 = 25%%).",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the new baseline.",
+    )
+    parser.add_argument(
+        "--ci",
+        action="store_true",
+        default=bool(os.environ.get("CI")),
+        help="Fail if the baseline is missing or lacks a measured stage.",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for rows in (parse_size(s) for s in args.sizes.split(",")):
+        results.extend(benchmark_size(rows, args))
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save-baseline to store one.")
+        if args.ci:
+            sys.exit(f"--ci needs a baseline at {args.baseline}")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    missing = unmatched(results, baseline)
+    for r in missing:
+        print(f"NO BASELINE {r['stage']} @ {r['rows']} rows")
+    if missing and args.ci:
+        sys.exit(f"--ci needs baseline runs of {len(missing)} more stages")
+    regressions = compare(results, baseline, args.tolerance)
+    for r in regressions:
+        print(
+            f"REGRESSION {r['stage']} @ {r['rows']} rows: {r['metric']} "
+            f"{r['baseline']} -> {r['current']} ({r['ratio']}x)"
+        )
+    if regressions:
+        sys.exit(1)
+    print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
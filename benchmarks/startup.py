@@ -0,0 +1,107 @@
+"""Worker boot time and first-click latency under each import strategy.
+
+Each configuration runs in a fresh interpreter: it times importing the Reflex
+app (what a worker does at boot), optionally runs the background warmup, then
+times the first call of every stage on a small table, as the first user to
+click through the workflow would experience it.
+
+    python -m benchmarks.startup --rows 2000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGURATIONS = [
+    ("eager imports", "0", False),
+    ("lazy imports", "1", False),
+    ("lazy imports + warmup", "1", True),
+]
+STAGES = ["cleaning", "pca", "clustering", "profiles", "insights"]
+
+
+def measure(rows: int, warmup: bool) -> dict:
+    """Runs in the child interpreter; returns seconds per phase."""
+    start = time.perf_counter()
+    import app.app  # noqa: F401
+
+    result = {"boot": time.perf_counter() - start, "warmup": 0.0}
+    if warmup:
+        from app.utils.warmup import warm_up
+
+        result["warmup"] = sum(warm_up().values())
+
+    from app.utils.lazy_imports import lazy_module
+    from benchmarks.synthetic_data import generate_customers
+
+    raw = generate_customers(rows)
+    timings = {}
+
+    def first_call(stage, fn):
+        start = time.perf_counter()
+        value = fn()
+        timings[stage] = time.perf_counter() - start
+        return value
+
+    pipeline = lazy_module("app.utils.pipeline")
+    google_ai_utils = lazy_module("app.utils.google_ai_utils")
+    cleaning = first_call("cleaning", lambda: pipeline.run_cleaning(raw))
+    pca = first_call("pca", lambda: pipeline.run_pca(cleaning["cleaned_data"]))
+    clustering = first_call(
+        "clustering",
+        lambda: pipeline.run_clustering(pca["transformed_data"], "kmeans", 4),
+    )
+    first_call(
+        "profiles",
+        lambda: pipeline.run_profiles(cleaning["cleaned_data"], clustering["labels"]),
+    )
+    first_call("insights", lambda: google_ai_utils.check_api_key())
+    result["first_clicks"] = timings
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        result = measure(args.rows, args.warmup)
+        print(json.dumps(result))
+        return
+
+    print(
+        f"{'configuration':<24}{'boot':>8}{'warmup':>8}"
+        + "".join(f"{stage:>12}" for stage in STAGES)
+        + f"{'first clicks':>14}"
+    )
+    with tempfile.TemporaryDirectory() as job_dir:
+        for name, lazy, warmup in CONFIGURATIONS:
+            env = dict(
+                os.environ,
+                SEGMENTATION_LAZY_IMPORTS=lazy,
+                SEGMENTATION_TRACE_FILE="",
+                SEGMENTATION_JOB_DB=os.path.join(job_dir, f"{lazy}{warmup}.sqlite3"),
+                SEGMENTATION_JOB_STORE=os.path.join(job_dir, f"store{lazy}{warmup}"),
+            )
+            command = [sys.executable, "-m", "benchmarks.startup", "--child"]
+            command += ["--rows", str(args.rows)] + (["--warmup"] if warmup else [])
+            output = subprocess.run(
+                command, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            clicks = result["first_clicks"]
+            print(
+                f"{name:<24}{result['boot']:>7.2f}s{result['warmup']:>7.2f}s"
+                + "".join(f"{clicks[stage]:>11.2f}s" for stage in STAGES)
+                + f"{sum(clicks.values()):>13.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Per-event state delta size: the legacy monolithic State vs per-stage substates.
+
+Replays the upload -> cleaning -> PCA -> clustering -> profiles flow against
+both layouts and reports the serialized delta each event sends to the browser.
+
+    python -m benchmarks.state_delta --rows 5000
+"""
+
+import argparse
+import json
+import logging
+import time
+
+import pandas as pd
+import plotly.graph_objects as go
+import reflex as rx
+from reflex.utils import format
+
+import app.app  # noqa: F401 - registers the app state tree
+from app.state import (
+    CleaningState,
+    ClusteringState,
+    InsightsState,
+    PCAState,
+    State,
+    Stats,
+    UploadState,
+)
+from app.utils.cleaning_utils import (
+    clean_data,
+    create_correlation_heatmap,
+    get_statistics,
+)
+from app.utils.clustering_utils import (
+    compute_cluster_profiles,
+    create_cluster_scatter,
+    perform_kmeans,
+)
+from app.utils.pca_utils import perform_pca
+from benchmarks.synthetic_data import generate_customers
+
+
+class LegacyState(rx.State):
+    """Mirror of the single-state layout the app used before the split."""
+
+    current_stage: str = "Upload"
+    is_processing: bool = False
+    uploaded_file_name: str = ""
+    raw_data: pd.DataFrame | None = None
+    cleaned_data: pd.DataFrame | None = None
+    original_stats: Stats = Stats()
+    cleaned_stats: Stats = Stats()
+    correlation_heatmap: go.Figure | None = go.Figure()
+    preview_page: int = 1
+    rows_per_page: int = 10
+    pca_results: dict | None = None
+    scree_plot: go.Figure = go.Figure()
+    cumulative_variance_plot: go.Figure = go.Figure()
+    n_clusters: int = 4
+    clustering_results: dict | None = None
+    cluster_scatter_fig: go.Figure = go.Figure()
+    dendrogram_fig: go.Figure = go.Figure()
+    cluster_profiles: dict = {}
+
+    @rx.var
+    def has_dendrogram_data(self) -> bool:
+        return self.dendrogram_fig is not None and len(self.dendrogram_fig.data) > 0
+
+    @rx.var
+    def filtered_cluster_keys(self) -> list[str]:
+        return [
+            k
+            for k in self.cluster_profiles.keys()
+            if k not in ["summary_df", "feature_names"]
+        ]
+
+    @rx.var
+    def raw_data_preview(self) -> list[dict[str, float | int | str]]:
+        if self.raw_data is not None and (not self.raw_data.empty):
+            start = (self.preview_page - 1) * self.rows_per_page
+            end = start + self.rows_per_page
+            return self.raw_data.iloc[start:end].to_dict("records")
+        return []
+
+    @rx.var
+    def raw_data_columns(self) -> list[str]:
+        if self.raw_data is not None:
+            return self.raw_data.columns.tolist()
+        return []
+
+    @rx.var
+    def total_preview_pages(self) -> int:
+        if self.raw_data is not None:
+            return (len(self.raw_data) + self.rows_per_page - 1) // self.rows_per_page
+        return 1
+
+
+def compute_stage_outputs(raw: pd.DataFrame, n_clusters: int) -> dict:
+    original_stats, _ = get_statistics(raw)
+    cleaned, outliers = clean_data(raw)
+    cleaned_stats, _ = get_statistics(cleaned, outliers)
+    pca = perform_pca(cleaned)
+    clustering = perform_kmeans(pca["transformed_data"], n_clusters)
+    return {
+        "raw": raw,
+        "original_stats": Stats(**original_stats),
+        "cleaned": cleaned,
+        "cleaned_stats": Stats(**cleaned_stats),
+        "heatmap": create_correlation_heatmap(cleaned),
+        "pca": pca,
+        "clustering": clustering,
+        "scatter": create_cluster_scatter(pca["transformed_data"], clustering["labels"]),
+        "profiles": compute_cluster_profiles(cleaned, clustering["labels"]),
+    }
+
+
+def legacy_events(root: rx.State, out: dict, n_clusters: int) -> list:
+    s = root.get_substate(LegacyState.get_full_name().split("."))
+
+    def upload():
+        s.uploaded_file_name = "customers.csv"
+        s.raw_data = out["raw"]
+        s.preview_page = 1
+
+    def cleaning():
+        s.original_stats = out["original_stats"]
+        s.cleaned_stats = out["cleaned_stats"]
+        s.cleaned_data = out["cleaned"]
+        s.correlation_heatmap = out["heatmap"]
+        s.current_stage = "Cleaning"
+
+    def next_page():
+        s.preview_page += 1
+
+    def pca():
+        s.pca_results = out["pca"]
+        s.scree_plot = out["pca"]["scree_plot"]
+        s.cumulative_variance_plot = out["pca"]["cumulative_variance_plot"]
+        s.current_stage = "PCA"
+
+    def set_k():
+        s.n_clusters = n_clusters
+
+    def clustering():
+        s.clustering_results = out["clustering"]
+        s.cluster_scatter_fig = out["scatter"]
+        s.current_stage = "Clustering"
+
+    def profiles():
+        s.cluster_profiles = out["profiles"]
+
+    return [upload, cleaning, next_page, pca, set_k, clustering, profiles]
+
+
+def substate_events(root: rx.State, out: dict, n_clusters: int) -> list:
+    def get(state_cls):
+        return root.get_substate(state_cls.get_full_name().split("."))
+
+    def upload():
+        upload_state = get(UploadState)
+        upload_state.uploaded_file_name = "customers.csv"
+        upload_state._raw_data = out["raw"]
+        upload_state.preview_page = 1
+
+    def cleaning():
+        cleaning_state = get(CleaningState)
+        cleaning_state.original_stats = out["original_stats"]
+        cleaning_state.cleaned_stats = out["cleaned_stats"]
+        cleaning_state._cleaned_data = out["cleaned"]
+        cleaning_state.correlation_heatmap = out["heatmap"]
+        get(State).current_stage = "Cleaning"
+
+    def next_page():
+        get(UploadState).preview_page += 1
+
+    def pca():
+        pca_state = get(PCAState)
+        pca_state._pca_results = out["pca"]
+        pca_state.optimal_n_components = out["pca"]["optimal_n_components"]
+        pca_state.scree_plot = out["pca"]["scree_plot"]
+        pca_state.cumulative_variance_plot = out["pca"]["cumulative_variance_plot"]
+        get(State).current_stage = "PCA"
+
+    def set_k():
+        get(ClusteringState).n_clusters = n_clusters
+
+    def clustering():
+        clustering_state = get(ClusteringState)
+        clustering_state._clustering_results = out["clustering"]
+        clustering_state.cluster_scatter_fig = out["scatter"]
+        get(State).current_stage = "Clustering"
+
+    def profiles():
+        get(InsightsState).cluster_profiles = out["profiles"]
+
+    return [upload, cleaning, next_page, pca, set_k, clustering, profiles]
+
+
+def measure(events: list, root: rx.State) -> list[dict]:
+    results = []
+    for event in events:
+        start = time.perf_counter()
+        event()
+        try:
+            size = len(format.json_dumps(root.get_delta()))
+        except Exception as e:
+            logging.warning(f"Delta for {event.__name__} failed to serialize: {e}")
+            size = -1
+        results.append(
+            {
+                "event": event.__name__,
+                "delta_bytes": size,
+                "seconds": round(time.perf_counter() - start, 4),
+            }
+        )
+        root._clean()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--clusters", type=int, default=4)
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    out = compute_stage_outputs(generate_customers(args.rows), args.clusters)
+    legacy_root = rx.State(_reflex_internal_init=True)
+    legacy = measure(legacy_events(legacy_root, out, args.clusters), legacy_root)
+    root = rx.State(_reflex_internal_init=True)
+    scoped = measure(substate_events(root, out, args.clusters), root)
+
+    print(f"{'event':<12}{'before (B)':>14}{'after (B)':>14}{'before (s)':>12}{'after (s)':>12}")
+    for before, after in zip(legacy, scoped):
+        print(
+            f"{before['event']:<12}{before['delta_bytes']:>14}{after['delta_bytes']:>14}"
+            f"{before['seconds']:>12}{after['seconds']:>12}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rows": args.rows, "before": legacy, "after": scoped}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Seeded synthetic banking customers for benchmarks.
+
+    python -m benchmarks.synthetic_data --rows 100000 --output customers.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+REGIONS = ["North", "South", "East", "West", "Central"]
+ACCOUNT_TYPES = ["current", "savings", "premium", "business"]
+CHANNELS = ["branch", "online", "mobile", "phone"]
+NUMERIC_COLUMNS = [
+    "age",
+    "balance",
+    "tenure_months",
+    "num_products",
+    "credit_score",
+    "estimated_salary",
+    "monthly_transactions",
+]
+CATEGORICAL_COLUMNS = ["region", "account_type", "preferred_channel"]
+
+
+def generate_customers(
+    rows: int,
+    seed: int = 42,
+    missing_rate: float = 0.02,
+    outlier_rate: float = 0.01,
+    chunk_size: int = 1_000_000,
+) -> pd.DataFrame:
+    """Builds a customer table with missing values and outliers injected.
+
+    Rows are generated in chunks, each from its own seeded stream, so 10M-row
+    tables never need one giant draw. Output is fixed by seed and chunk_size.
+    """
+    chunks = [
+        _generate_chunk(
+            min(chunk_size, rows - start), np.random.default_rng([seed, 0, index])
+        )
+        for index, start in enumerate(range(0, rows, chunk_size))
+    ] or [_generate_chunk(0, np.random.default_rng(seed))]
+    df = pd.concat(chunks, ignore_index=True)
+    rng = np.random.default_rng([seed, 1])
+    _inject_outliers(df, rng, outlier_rate)
+    _inject_missing(df, rng, missing_rate)
+    return df
+
+
+def _generate_chunk(rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    # A latent affluence score ties balance, salary and products together so
+    # that the data has real segments to find.
+    affluence = rng.gamma(2.0, 1.0, rows)
+    age = rng.normal(45, 14, rows).clip(18, 90).round()
+    tenure = (rng.exponential(60, rows) * (age - 17) / 40).clip(0, 480).round()
+    return pd.DataFrame(
+        {
+            "age": age,
+            "balance": (rng.lognormal(7.5, 1.0, rows) * affluence).round(2),
+            "tenure_months": tenure,
+            "num_products": (1 + rng.poisson(affluence * 0.8)).clip(1, 8),
+            "credit_score": rng.normal(650 + 30 * affluence, 60, rows)
+            .clip(300, 850)
+            .round(),
+            "estimated_salary": (
+                rng.lognormal(10.4, 0.35, rows) * (0.6 + 0.3 * affluence)
+            ).round(2),
+            "monthly_transactions": rng.poisson(8 + 6 * affluence),
+            "region": rng.choice(REGIONS, rows),
+            "account_type": np.where(
+                affluence > 3.5,
+                "premium",
+                rng.choice(ACCOUNT_TYPES, rows, p=[0.5, 0.3, 0.05, 0.15]),
+            ),
+            "preferred_channel": rng.choice(CHANNELS, rows, p=[0.2, 0.35, 0.4, 0.05]),
+        }
+    )
+
+
+def _inject_outliers(df: pd.DataFrame, rng: np.random.Generator, rate: float):
+    for col in ("balance", "estimated_salary", "monthly_transactions"):
+        mask = rng.random(len(df)) < rate
+        values = df[col].to_numpy(dtype=float, copy=True)
+        values[mask] *= rng.uniform(10, 50, mask.sum())
+        df[col] = values.round(2).astype(df[col].dtype)
+
+
+def _inject_missing(df: pd.DataFrame, rng: np.random.Generator, rate: float):
+    for col in ("age", "balance", "credit_score", "region", "preferred_channel"):
+        mask = rng.random(len(df)) < rate
+        df.loc[mask, col] = np.nan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True, help="CSV or Parquet path.")
+    args = parser.parse_args()
+    df = generate_customers(args.rows, seed=args.seed)
+    if args.output.endswith(".parquet"):
+        df.to_parquet(args.output, index=False)
+    else:
+        df.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Transaction aggregation: streamed chunks vs reading the whole file first.
+
+Writes a seeded transaction CSV (customer, date, amount, channel, balance),
+then builds the per-customer table with aggregate_transactions and with a
+plain read_csv plus groupby, reporting time and peak RSS growth of each and
+checking that recency, frequency and monetary agree.
+
+    python -m benchmarks.transactions --rows 5000000 --customers 200000
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.utils.instrumentation import PeakRSS
+from app.utils.transaction_utils import aggregate_transactions
+
+CHANNELS = ["branch", "online", "mobile", "phone"]
+
+
+def generate_transactions(
+    rows: int, customers: int, seed: int = 42, chunk_size: int = 1_000_000
+) -> bytes:
+    """A year of transactions as CSV bytes, written chunk by chunk."""
+    buffer = io.StringIO()
+    start = pd.Timestamp("2024-01-01")
+    for index, offset in enumerate(range(0, rows, chunk_size)):
+        rng = np.random.default_rng([seed, index])
+        n = min(chunk_size, rows - offset)
+        customer = rng.integers(0, customers, n)
+        seconds = np.sort(rng.integers(0, 365 * 86400, n))
+        pd.DataFrame(
+            {
+                "customer_id": customer,
+                "date": (start + pd.to_timedelta(seconds, unit="s")).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                ),
+                "amount": rng.lognormal(3.5, 1.0, n).round(2),
+                "channel": rng.choice(CHANNELS, n, p=[0.1, 0.4, 0.45, 0.05]),
+                "balance": (rng.lognormal(7.5, 1.0, customers)[customer]).round(2),
+            }
+        ).to_csv(buffer, index=False, header=index == 0)
+    return buffer.getvalue().encode()
+
+
+def read_and_group(path: str) -> pd.DataFrame:
+    """What pre-aggregating outside the tool amounts to."""
+    df = pd.read_csv(path, parse_dates=["date"])
+    as_of = df["date"].max()
+    grouped = df.groupby("customer_id")
+    return pd.DataFrame(
+        {
+            "recency_days": (as_of - grouped["date"].max()).dt.total_seconds() / 86400,
+            "frequency": grouped.size(),
+            "monetary": grouped["amount"].sum(),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--customers", type=int, default=50_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "transactions.csv")
+    with open(path, "wb") as f:
+        f.write(generate_transactions(args.rows, args.customers))
+    print(f"{args.rows:,} transactions, {os.path.getsize(path) / 1024**2:.0f} MB")
+    results = {}
+    runs = {
+        "aggregate_transactions": lambda: aggregate_transactions([path], ["t.csv"]),
+        "read_csv + groupby": lambda: read_and_group(path),
+    }
+    for name, fn in runs.items():
+        start = time.perf_counter()
+        with PeakRSS() as rss:
+            results[name] = fn()
+        seconds = time.perf_counter() - start
+        print(f"{name:<24}{seconds:>8.1f} s{rss.delta_mb:>10.0f} MB peak")
+    streamed = results["aggregate_transactions"]
+    streamed = streamed.set_index(streamed["customer_id"].astype(np.int64))
+    reference = results["read_csv + groupby"]
+    columns = ["recency_days", "frequency", "monetary"]
+    same = np.allclose(streamed.loc[reference.index, columns], reference[columns])
+    print("Features agree." if same else "Features differ.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Segment write-back throughput: write_segments vs DataFrame.to_sql.
+
+Loads seeded segment assignments into a fresh SQLite database (or the
+database at --url) twice under the same run id with write_segments, then
+once with pandas' to_sql into a second table, reporting rows per second
+and checking that the repeated load left a single copy of the run.
+
+    python -m benchmarks.writeback --rows 2000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from app.utils.writeback import get_engine, write_segments
+
+RUN_ID = "benchmark"
+
+
+def generate_assignments(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "customer_id": (rng.permutation(rows) + 10**6).astype(str).astype(object),
+            "cluster": rng.integers(0, 5, rows),
+            "distance_to_centroid": rng.gamma(2.0, 1.0, rows),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--url", default="")
+    args = parser.parse_args()
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'segments.db')}"
+
+    assignments = generate_assignments(args.rows)
+    print(f"{args.rows:,} assignments into {url}")
+    for attempt in ("write_segments", "write_segments again"):
+        result = write_segments(assignments, RUN_ID, url, "segment_assignments")
+        print(
+            f"{attempt:<22}{result['seconds']:>8.1f} s"
+            f"{result['rows_per_second']:>12,.0f} rows/s"
+        )
+    start = time.perf_counter()
+    assignments.assign(run_id=RUN_ID).to_sql(
+        "segment_assignments_to_sql", get_engine(url), index=False, chunksize=50_000
+    )
+    seconds = time.perf_counter() - start
+    print(f"{'to_sql':<22}{seconds:>8.1f} s{args.rows / seconds:>12,.0f} rows/s")
+
+    with get_engine(url).connect() as conn:
+        stored = conn.execute(
+            sa.text("SELECT count(*) FROM segment_assignments WHERE run_id = :run"),
+            {"run": RUN_ID},
+        ).scalar()
+    print("One copy of the run." if stored == args.rows else f"{stored:,} rows stored.")
+
+
+if __name__ == "__main__":
+    main()
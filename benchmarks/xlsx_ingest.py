@@ -0,0 +1,58 @@
+"""XLSX parse time and peak memory: pandas.read_excel vs the streaming reader.
+
+Writes the reference dataset to a workbook, then parses it with each reader
+and checks that both return the same frame. Peak memory is what Python
+allocated while parsing, measured with tracemalloc in a separate run.
+
+    python -m benchmarks.xlsx_ingest --rows 50000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from app.utils.ingest_utils import CalamineWorkbook, read_xlsx
+from benchmarks.synthetic_data import generate_customers
+
+
+def measure(fn) -> tuple[pd.DataFrame, float, float]:
+    """Seconds and peak MB; tracing slows parsing, so memory is a second run."""
+    start = time.perf_counter()
+    df = fn()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / 1024**2
+    tracemalloc.stop()
+    return df, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "customers.xlsx")
+    generate_customers(args.rows).to_excel(path, index=False)
+    size_mb = os.path.getsize(path) / 1024**2
+    reader = "calamine" if CalamineWorkbook is not None else "openpyxl read-only"
+    print(f"{args.rows:,} rows, {size_mb:.1f} MB; streaming via {reader}")
+
+    expected, pandas_s, pandas_mb = measure(lambda: pd.read_excel(path))
+    streamed, stream_s, stream_mb = measure(lambda: read_xlsx(path))
+    print(f"{'reader':<16}{'seconds':>10}{'peak MB':>10}")
+    print(f"{'read_excel':<16}{pandas_s:>10.2f}{pandas_mb:>10.1f}")
+    print(f"{'read_xlsx':<16}{stream_s:>10.2f}{stream_mb:>10.1f}")
+    try:
+        pd.testing.assert_frame_equal(streamed, expected)
+        print("Frames are identical.")
+    except AssertionError as e:
+        print(f"Frames differ: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import threading
+import time
+from app.utils.job_queue import JobQueue, OutputRef, job_stage
+
+release_upstream = threading.Event()
+side_effects = []
+
+
+@job_stage("test_upstream")
+def upstream_job(inputs: dict, params: dict, ctx) -> dict:
+    release_upstream.wait(10)
+    return {"value": inputs["value"]}
+
+
+@job_stage("test_child")
+def child_job(inputs: dict, params: dict, ctx) -> dict:
+    return {"value": inputs["value"] + 1}
+
+
+@job_stage("test_side_effect", cacheable=False)
+def side_effect_job(inputs: dict, params: dict, ctx) -> dict:
+    side_effects.append(inputs["value"])
+    return {"runs": len(side_effects)}
+
+
+def _wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _queue(tmp_path) -> JobQueue:
+    return JobQueue(
+        str(tmp_path / "jobs.sqlite3"),
+        str(tmp_path / "store"),
+        max_workers=2,
+        memory_budget_bytes=1024**3,
+    )
+
+
+def test_deferred_job_runs_when_upstream_finishes_while_deferring(tmp_path):
+    queue = _queue(tmp_path)
+    upstream = queue.submit("test_upstream", {"value": 1})
+    assert _wait_for(lambda: queue.status(upstream)["status"] == "running")
+
+    finish = queue._finish
+
+    def finish_upstream_while_deferring(job_id, status, error=None):
+        finish(job_id, status, error)
+        if status == "queued" and queue.status(job_id)["stage"] == "test_child":
+            # The upstream job finishes and releases its dependents before
+            # the child has left the running set.
+            release_upstream.set()
+            assert _wait_for(lambda: upstream not in queue._running)
+
+    queue._finish = finish_upstream_while_deferring
+    child = queue.submit("test_child", {"value": OutputRef(upstream, "value")})
+
+    assert _wait_for(lambda: queue.status(child)["status"] == "done")
+    assert queue.result(child) == {"value": 2}
+
+
+def test_uncached_stage_runs_again_when_resubmitted(tmp_path):
+    queue = _queue(tmp_path)
+    for runs in (1, 2):
+        job_id = queue.submit("test_side_effect", {"value": 1})
+        assert _wait_for(lambda: queue.status(job_id)["status"] == "done")
+        assert queue.result(job_id) == {"runs": runs}